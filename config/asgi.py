@@ -2,6 +2,9 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Besides the regular API it serves the long-lived availability streams
+(``library.availability``), which the WSGI application refuses: each open
+stream is a coroutine here but would hold a worker thread there.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -9,8 +12,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+if getattr(settings, 'WARMUP_ON_STARTUP', False):
+    from core.warmup import warm_up
+
+    warm_up()
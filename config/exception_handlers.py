@@ -2,10 +2,12 @@ from rest_framework.views import exception_handler as drf_exception_handler
 from rest_framework.response import Response
 from rest_framework import status
 
+from core import metrics
 from library import services as library_services
 
 
 def custom_exception_handler(exc, context):
+    metrics.API_EXCEPTIONS.labels(type(exc).__name__).inc()
     response = drf_exception_handler(exc, context)
     if response is not None:
         return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,7 +42,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ThresholdGZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -50,6 +54,28 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Responses smaller than this are not gzipped (see core.middleware).
+GZIP_MIN_LENGTH = 1024
+
+# Directory where each worker process keeps its metrics (core.metrics) so
+# /metrics reports all workers. Unset, every process only reports its own.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+# /metrics is served to staff users, to scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>" and to these client addresses.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+# Slow-query log (core.slow_queries): statements slower than this many
+# milliseconds are kept with their plan. Unset, the log is off. Only this
+# fraction of requests is observed.
+SLOW_QUERY_THRESHOLD_MS = None
+if os.environ.get('SLOW_QUERY_THRESHOLD_MS'):
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ['SLOW_QUERY_THRESHOLD_MS'])
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', '1.0'))
+SLOW_QUERY_LOG_SIZE = 200
+# When the log is full, statements are ranked by total time halved once per this many seconds idle.
+SLOW_QUERY_DECAY_SECONDS = 3600
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -69,6 +95,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Run core.warmup.warm_up() when config.wsgi / config.asgi are loaded, so
+# workers resolve URLs and build serializers before taking traffic.
+WARMUP_ON_STARTUP = True
+# Started in the background by warm_up(); each returns at once.
+WARMUP_BACKGROUND_TASKS = ['library.autocomplete.warm']
+
 
 
 DATABASES = {
@@ -78,6 +110,21 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = ['library.routers.BranchRouter']
+
+# Branch code -> database alias holding that branch's borrowings and
+# reservations (see library.routers). Unlisted branches use 'default'.
+# For a local setup, LIBRARY_BRANCH_SQLITE=north,south gives each listed
+# branch its own SQLite file; create its tables with
+# `python manage.py migrate --database branch_<code>`.
+LIBRARY_BRANCH_DATABASES = {}
+for _branch in filter(None, os.environ.get('LIBRARY_BRANCH_SQLITE', '').split(',')):
+    DATABASES[f'branch_{_branch}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_branch_{_branch}.sqlite3',
+    }
+    LIBRARY_BRANCH_DATABASES[_branch] = f'branch_{_branch}'
+
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -118,12 +165,78 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,  
     'EXCEPTION_HANDLER': 'config.exception_handlers.custom_exception_handler',
+    'DEFAULT_THROTTLE_RATES': {
+        'catalog_anon': '120/min',
+        'circulation': '120/min',
+        'token': '20/min',
+    },
 }
 
+# Throttle counters must live in a cache shared by all worker processes in
+# production and with an atomic incr(): set THROTTLE_REDIS_URL to use Redis
+# (the `redis` package is in requirements.txt). Without it each process keeps
+# its own in-memory counters and a warning is logged at startup.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+    },
+}
+if os.environ.get('THROTTLE_REDIS_URL'):
+    CACHES['throttle'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['THROTTLE_REDIS_URL'],
+    }
+THROTTLE_CACHE_ALIAS = 'throttle'
+# Allowed/rejected counters reported by throttle_stats() restart after this many seconds.
+THROTTLE_STATS_TTL = 24 * 60 * 60
+
+# Dotted path to the BorrowingService instance used by the circulation views.
+# 'library.services.ConditionalBorrowingService' selects the lock-free
+# conditional-update implementation.
+LIBRARY_BORROWING_SERVICE = 'library.services.DefaultBorrowingService'
+
+# Days a returned item waits on the hold shelf for the next reservation.
+# None hands it straight to the next patron as a new loan.
+LIBRARY_HOLD_PICKUP_DAYS = None
+
+# Renewals allowed per loan, manual (renew endpoint) or by `manage.py auto_renew`.
+LIBRARY_MAX_RENEWALS = 3
+
+# Overdue fines charged by `manage.py accrue_fines` (run daily) and on return.
+LIBRARY_FINE_DAILY_RATE = '0.50'
+LIBRARY_FINE_CAP = '10.00'
+
+# Live availability stream (library.availability, served by config.asgi).
+# Heartbeat comments keep idle streams open through proxies; every worker
+# polls the watched titles every LIBRARY_AVAILABILITY_SYNC_SECONDS to pick up
+# changes made by other workers (None with a single worker).
+LIBRARY_AVAILABILITY_HEARTBEAT_SECONDS = 15
+LIBRARY_AVAILABILITY_SYNC_SECONDS = 5
+LIBRARY_AVAILABILITY_MAX_SUBSCRIBERS = 10000
+LIBRARY_AVAILABILITY_MAX_BOOKS = 200
+
+# Idempotency-Key support for circulation POST endpoints (seconds).
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT_TIMEOUT = 5.0
+# How long an in-progress key stays with its worker before a duplicate may take it over.
+# The worker renews it while the request runs, so only a crashed worker loses its key.
+IDEMPOTENCY_LEASE = 4 * IDEMPOTENCY_WAIT_TIMEOUT
+
+# Written by `manage.py build_openapi_schema` and served by /api/schema/.
+OPENAPI_SCHEMA_PATH = BASE_DIR / 'build' / 'openapi.json'
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Pemberley Library API',
     'DESCRIPTION': 'API for managing the Pemberley Library system.',
@@ -0,0 +1,220 @@
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Unless IDEMPOTENCY_LEASE is set, an in-progress key is leased for this many wait timeouts.
+LEASE_FACTOR = 4
+# The owner renews its lease this many times per lease period while the view runs.
+RENEWALS_PER_LEASE = 3
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def _wait_timeout():
+    return getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 5.0)
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE', LEASE_FACTOR * _wait_timeout()))
+
+
+def _fingerprint(request):
+    try:
+        body = request.body
+    except RawPostDataException:
+        body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder).encode()
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    digest.update(body or b'')
+    return digest.hexdigest()
+
+
+def _replay(record):
+    body = json.loads(record.response_body) if record.response_body else None
+    return Response(body, status=record.status_code, headers={REPLAY_HEADER: 'true'})
+
+
+def _acquire(user, key, fingerprint):
+    """Insert the in-progress marker for ``key`` or resolve an existing one.
+
+    Returns ``(record, None)`` when the caller owns the key and must execute
+    the request, or ``(None, response)`` when the request must not run:
+    a replay of the stored response, a fingerprint mismatch, or a 409 while
+    a concurrent duplicate is still executing. The unique constraint on
+    ``(user, key)`` is what coalesces duplicates across workers.
+
+    The owner holds the key until ``locked_until`` and keeps renewing it
+    while the view runs (see ``_Lease``), so only a worker that crashed
+    mid-request lets its lease run out. The next duplicate then takes the
+    key over with a conditional UPDATE and runs the request itself.
+    """
+    poll_interval = getattr(settings, 'IDEMPOTENCY_POLL_INTERVAL', 0.05)
+    deadline = time.monotonic() + _wait_timeout()
+
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, expires_at=now + _ttl(), locked_until=now + _lease()
+                )
+            return record, None
+        except IntegrityError:
+            pass
+
+        existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if existing is None:
+            continue
+        if existing.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=existing.pk, expires_at__lte=now).delete()
+            continue
+        if existing.fingerprint != fingerprint:
+            return None, Response(
+                {'detail': 'Idempotency-Key was already used with a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if existing.state == IdempotencyKey.STATE_COMPLETED:
+            return None, _replay(existing)
+        if existing.locked_until is None or existing.locked_until <= now:
+            lease = now + _lease()
+            taken = IdempotencyKey.objects.filter(
+                pk=existing.pk, state=IdempotencyKey.STATE_IN_PROGRESS, locked_until=existing.locked_until
+            ).update(locked_until=lease)
+            if taken:
+                logger.warning('Idempotency-Key %s for user %s taken over after its lease expired', key, user)
+                existing.locked_until = lease
+                return existing, None
+            continue
+        if time.monotonic() >= deadline:
+            return None, Response(
+                {'detail': 'A request with this Idempotency-Key is still being processed'},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Retry-After': '1'},
+            )
+        time.sleep(poll_interval)
+
+
+class _Lease:
+    """Renews the owner's lease on an in-progress key while its view runs.
+
+    A background thread pushes ``locked_until`` forward every
+    ``lease / RENEWALS_PER_LEASE`` seconds, so a slow request keeps its key
+    however long it takes. Each renewal is conditional on the previous
+    ``locked_until``; if another worker has taken the key over the thread
+    stops and the stale owner can no longer store or release the key.
+    """
+
+    def __init__(self, record):
+        self.pk = record.pk
+        self.locked_until = record.locked_until
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def renew(self):
+        locked_until = timezone.now() + _lease()
+        renewed = IdempotencyKey.objects.filter(
+            pk=self.pk, state=IdempotencyKey.STATE_IN_PROGRESS, locked_until=self.locked_until
+        ).update(locked_until=locked_until)
+        if renewed:
+            self.locked_until = locked_until
+        return bool(renewed)
+
+    def _run(self):
+        interval = _lease().total_seconds() / RENEWALS_PER_LEASE
+        try:
+            while not self._stopped.wait(interval):
+                try:
+                    if not self.renew():
+                        logger.warning('Idempotency-Key %s lost its lease before the request finished', self.pk)
+                        return
+                except Exception:
+                    logger.exception('Could not renew the lease of Idempotency-Key %s', self.pk)
+        finally:
+            connections.close_all()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='idempotency-lease', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def owned(self):
+        return IdempotencyKey.objects.filter(pk=self.pk, locked_until=self.locked_until)
+
+
+def idempotent(view_method):
+    """Make a DRF view method honour the ``Idempotency-Key`` request header.
+
+    Requests without the header run unchanged. The first request for a key
+    runs the view and stores its status and body; duplicates within the TTL
+    get the stored response back without running the view again. If the view
+    raises, the key is released so the client can retry. The lease on the
+    key is renewed while the view runs, and only the current lease holder
+    stores or releases the key.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'detail': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        record, response = _acquire(request.user, key, _fingerprint(request))
+        if response is not None:
+            logger.info('Idempotency-Key %s for user %s resolved without executing (%s)', key, request.user, response.status_code)
+            return response
+
+        lease = _Lease(record)
+        lease.start()
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            lease.stop()
+            lease.owned().delete()
+            raise
+        lease.stop()
+        owned = lease.owned()
+
+        if response.status_code >= 500:
+            owned.delete()
+            return response
+
+        owned.update(
+            state=IdempotencyKey.STATE_COMPLETED,
+            status_code=response.status_code,
+            response_body=json.dumps(response.data, cls=JSONEncoder, separators=(',', ':')),
+        )
+        return response
+
+    return wrapper
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.schema import build_schema_artifact, load_schema_artifact
+
+
+class Command(BaseCommand):
+    help = 'Write the OpenAPI schema (and a gzip copy) served by /api/schema/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='defaults to settings.OPENAPI_SCHEMA_PATH')
+
+    def handle(self, *args, **options):
+        path = build_schema_artifact(options['output'])
+        artifact = load_schema_artifact(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {path} ({len(artifact.content)} bytes, {len(artifact.compressed)} gzipped, etag {artifact.etag})'
+        ))
@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+CHILD_SCRIPT = (
+    'import sys; sys.path.insert(0, {base!r}); '
+    'from core.warmup import profile_child; profile_child({url!r}, {warm!r})'
+)
+
+
+def parse_importtime(stderr):
+    """Parse ``python -X importtime`` output into ``(module, self_us, cumulative_us, depth)`` rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        depth = (len(name) - len(name.lstrip()) - 3) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Report per-module import time and time to first request, with and without worker warm-up.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/api/v1/library/books/', help='path requested as the first request')
+        parser.add_argument('--limit', type=int, default=20, help='number of modules to list')
+
+    def run_child(self, url, warm):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'))
+        script = CHILD_SCRIPT.format(base=str(settings.BASE_DIR), url=url, warm=warm)
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            capture_output=True, text=True, env=env, cwd=str(settings.BASE_DIR),
+        )
+        result_line = next((line for line in reversed(proc.stdout.splitlines()) if line.startswith('{')), None)
+        if proc.returncode != 0 or result_line is None:
+            raise CommandError(f'Profiling subprocess failed:\n{proc.stderr[-2000:]}')
+        return json.loads(result_line), parse_importtime(proc.stderr)
+
+    def handle(self, *args, **options):
+        cold, imports = self.run_child(options['url'], warm=False)
+        warm, _ = self.run_child(options['url'], warm=True)
+
+        top_level = [row for row in imports if row[3] == 0]
+        packages = defaultdict(int)
+        for name, _, cumulative_us, _ in top_level:
+            packages[name.split('.')[0]] += cumulative_us
+
+        self.stdout.write('Cumulative import time by package (ms):')
+        for package, total in sorted(packages.items(), key=lambda item: -item[1])[:options['limit']]:
+            self.stdout.write(f'  {total / 1000:9.1f}  {package}')
+
+        self.stdout.write('Slowest modules by cumulative import time (ms):')
+        for name, self_us, cumulative_us, _ in sorted(imports, key=lambda row: -row[2])[:options['limit']]:
+            self.stdout.write(f'  {cumulative_us / 1000:9.1f}  (self {self_us / 1000:7.1f})  {name}')
+
+        self.stdout.write('Startup phases (ms):')
+        for label, result in (('cold', cold), ('warm', warm)):
+            phases = '  '.join(f'{name}={value:.1f}' for name, value in result['timings'].items())
+            self.stdout.write(f'  {label:<5} {phases}  status={result["status"]}')
+
+        saved = cold['timings']['first_request'] - warm['timings']['first_request']
+        self.stdout.write(self.style.SUCCESS(f'Warm-up saves {saved:.1f} ms on the first request'))
@@ -0,0 +1,136 @@
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+
+from . import metrics, slow_queries
+
+
+def _wrap_connections(wrapper):
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+    return stack
+
+
+class ThresholdGZipMiddleware(GZipMiddleware):
+    """Gzip responses of at least ``GZIP_MIN_LENGTH`` bytes for clients that accept it.
+
+    Small responses (single objects, errors, short pages) are sent as-is
+    because compressing them costs more CPU than the bytes it saves.
+    Streaming responses are never compressed so event streams are flushed
+    to the client as they are produced.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming:
+            return response
+        if len(response.content) < getattr(settings, 'GZIP_MIN_LENGTH', 1024):
+            return response
+        return super().process_response(request, response)
+
+
+class MetricsMiddleware:
+    """Record latency, status and SQL usage of every request per route name.
+
+    The route is the URL pattern name (``library:book-list``), so all
+    requests to one endpoint share a series whatever their ids. SQL
+    statements are counted with an execute wrapper on every connection.
+    Works in both the WSGI and the ASGI handler.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        stats = _QueryStats()
+        start = time.perf_counter()
+        with _wrap_connections(stats):
+            response = self.get_response(request)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def _acall(self, request):
+        stats = _QueryStats()
+        start = time.perf_counter()
+        with _wrap_connections(stats):
+            response = await self.get_response(request)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def _record(request, response, stats, elapsed):
+        route = metrics.route_name(request)
+        metrics.HTTP_REQUEST_DURATION.labels(route, request.method).observe(elapsed)
+        metrics.HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        if stats.count:
+            metrics.DB_QUERIES.labels(route).inc(stats.count)
+            metrics.DB_QUERY_SECONDS.labels(route).inc(stats.seconds)
+
+
+class SlowQueryMiddleware:
+    """Add the slow SQL of a sample of requests to ``core.slow_queries.log``.
+
+    Only installed when ``SLOW_QUERY_THRESHOLD_MS`` is set. Requests left out
+    by ``SLOW_QUERY_SAMPLE_RATE`` run without any wrapper.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.threshold = slow_queries.threshold_seconds()
+        if self.threshold is None:
+            raise MiddlewareNotUsed
+        self.sample_rate = getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0)
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        if not self._sampled():
+            return self.get_response(request)
+        recorder = slow_queries.QueryRecorder(self.threshold, request)
+        with _wrap_connections(recorder):
+            return self.get_response(request)
+
+    async def _acall(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        recorder = slow_queries.QueryRecorder(self.threshold, request)
+        with _wrap_connections(recorder):
+            return await self.get_response(request)
+
+
+class _QueryStats:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 
 
@@ -10,6 +11,34 @@ class TimestampedModel(models.Model):
         abstract = True
 
 
+class IdempotencyKey(models.Model):
+    """Stored outcome of a POST made with an ``Idempotency-Key`` header."""
 
+    STATE_IN_PROGRESS = 'in_progress'
+    STATE_COMPLETED = 'completed'
 
+    STATE_CHOICES = [
+        (STATE_IN_PROGRESS, 'In progress'),
+        (STATE_COMPLETED, 'Completed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=STATE_IN_PROGRESS)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    # While in progress: when the worker running the request is presumed dead
+    # and a duplicate may take the key over.
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='core_idempotency_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} ({self.state})"
 
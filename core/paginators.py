@@ -0,0 +1,63 @@
+import logging
+
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_row_count(model, using='default'):
+    """Return the planner's row estimate for ``model``'s table, or ``None``.
+
+    Reads catalog statistics instead of scanning the table: ``pg_class`` on
+    PostgreSQL, ``information_schema`` on MySQL and ``sqlite_stat1`` (filled
+    by ``ANALYZE``) on SQLite.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table]
+    elif connection.vendor == 'mysql':
+        sql = 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s'
+        params = [table]
+    elif connection.vendor == 'sqlite':
+        sql, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]
+    else:
+        return None
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        logger.debug('Row estimate unavailable for %s', table)
+        return None
+    if not row or row[0] is None:
+        return None
+    value = row[0]
+    if isinstance(value, str):
+        value = value.split()[0]
+    estimate = int(value)
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that skips the exact ``COUNT(*)`` on large unfiltered tables.
+
+    When the queryset has no WHERE clause and the catalog estimate is above
+    ``threshold`` the estimate is used as the count; filtered or small
+    result sets are counted exactly.
+    """
+
+    threshold = 100_000
+
+    @cached_property
+    def count(self):
+        object_list = self.object_list
+        if isinstance(object_list, QuerySet) and not object_list.query.where:
+            estimate = estimate_row_count(object_list.model, using=object_list.db)
+            if estimate is not None and estimate > self.threshold:
+                return estimate
+        return super().count
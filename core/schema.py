@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+
+def schema_artifact_path():
+    return Path(getattr(settings, 'OPENAPI_SCHEMA_PATH', Path(settings.BASE_DIR) / 'build' / 'openapi.json'))
+
+
+def build_schema_artifact(path=None):
+    """Generate the OpenAPI schema and write ``path`` plus a ``.gz`` sibling.
+
+    Both files are written to a temporary name and moved into place, the
+    ``.gz`` first, so a running server never serves a half-written artifact.
+    Returns the path.
+    """
+    from drf_spectacular.renderers import OpenApiJsonRenderer
+    from drf_spectacular.settings import spectacular_settings
+
+    path = Path(path or schema_artifact_path())
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    content = OpenApiJsonRenderer().render(schema, renderer_context={})
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for target, payload in ((path.with_name(path.name + '.gz'), gzip.compress(content, 9)), (path, content)):
+        tmp = target.with_name(target.name + '.tmp')
+        tmp.write_bytes(payload)
+        os.replace(tmp, target)
+    return path
+
+
+class SchemaArtifact:
+    """Schema bytes, gzip bytes and their ETags, loaded once per file version."""
+
+    def __init__(self, content, compressed):
+        self.content = content
+        self.compressed = compressed
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        self.etag = '"%s"' % digest
+        # The gzip body is a different representation and needs its own validator.
+        self.gzip_etag = '"%s-gz"' % digest
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_schema_artifact(path=None):
+    """Return the cached ``SchemaArtifact`` for ``path`` or ``None`` if missing.
+
+    The files are re-read only when the modification time of either one
+    changes, so a rebuilt artifact is picked up without restarting workers.
+    A ``.gz`` that does not hold the loaded JSON (missing, or caught
+    mid-rebuild) is replaced by compressing the JSON itself.
+    """
+    path = Path(path or schema_artifact_path())
+    gz_path = path.with_name(path.name + '.gz')
+    try:
+        version = (path.stat().st_mtime_ns, _mtime(gz_path))
+    except FileNotFoundError:
+        return None
+
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _cache_lock:
+        content = path.read_bytes()
+        try:
+            compressed = gz_path.read_bytes()
+            if gzip.decompress(compressed) != content:
+                compressed = None
+        except (OSError, EOFError):
+            compressed = None
+        if compressed is None:
+            compressed = gzip.compress(content, 9)
+        artifact = SchemaArtifact(content, compressed)
+        _cache[path] = (version, artifact)
+    return artifact
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
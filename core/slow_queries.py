@@ -0,0 +1,192 @@
+"""Slow-query log: the SQL behind slow pages, with its query plan.
+
+``SlowQueryMiddleware`` wraps every connection of a sampled request
+(``SLOW_QUERY_SAMPLE_RATE``) in a ``QueryRecorder``. Statements running longer
+than ``SLOW_QUERY_THRESHOLD_MS`` are grouped by their normalized SQL (literals
+and placeholders replaced by ``?``, ``IN`` lists collapsed) and added to the
+process-wide ``log``: count, total and worst time, the routes that ran it,
+the redacted parameters of the worst run and the query plan from the first
+time it was seen. The log keeps at most ``SLOW_QUERY_LOG_SIZE`` statements.
+When full it drops the one with the least total time, halved for every
+``SLOW_QUERY_DECAY_SECONDS`` since it last ran, so statements that stopped
+running make room and a newly seen statement is never the one dropped.
+
+The log lives in the worker process, like the autocomplete index; each
+worker reports the statements it ran itself.
+"""
+import heapq
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, NotSupportedError, transaction
+
+from .metrics import route_name
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE)
+_VALUES_ROWS = re.compile(r'(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+')
+_WHITESPACE = re.compile(r'\s+')
+_EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+
+def threshold_seconds():
+    """The configured threshold in seconds, or ``None`` when the log is off."""
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    return None if threshold is None else threshold / 1000
+
+
+def normalize(sql):
+    """``sql`` with literals and parameters replaced so equal statements group together."""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _VALUES_ROWS.sub(r'\1, ...', sql)
+
+
+def redact(params):
+    """Describe ``params`` by type and size only, never by value."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {name: _redact_value(value) for name, value in params.items()}
+    return [_redact_value(value) for value in params]
+
+
+def _redact_value(value):
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (str, bytes)):
+        return f'<{type(value).__name__}:{len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def explain(connection, sql, params):
+    """The query plan of ``sql`` as a list of lines, or ``None`` if it cannot be explained.
+
+    Runs on a fresh backend cursor so the statement's own results and the
+    execute wrappers of the connection are left alone, and in a savepoint so
+    a failing EXPLAIN does not abort the caller's transaction.
+    """
+    if (params is None and '%s' in sql) or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        prefix = connection.ops.explain_query_prefix()
+        with transaction.atomic(using=connection.alias, savepoint=True), connection.wrap_database_errors:
+            cursor = connection.create_cursor()
+            try:
+                cursor.execute(f'{prefix} {sql}', params)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+    except (DatabaseError, NotSupportedError):
+        return None
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[3] for row in rows]
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+class SlowQuery:
+    __slots__ = ('sql', 'count', 'total', 'worst', 'params', 'routes', 'plan', 'database', 'last_seen')
+
+    def __init__(self, sql, database, plan):
+        self.sql = sql
+        self.database = database
+        self.plan = plan
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.params = None
+        self.routes = {}
+        self.last_seen = None
+
+    def as_dict(self):
+        return {
+            'sql': self.sql,
+            'database': self.database,
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total * 1000 / self.count, 3),
+            'max_ms': round(self.worst * 1000, 3),
+            'routes': dict(sorted(self.routes.items(), key=lambda item: -item[1])),
+            'params': self.params,
+            'plan': self.plan,
+            'last_seen': self.last_seen,
+        }
+
+
+class SlowQueryLog:
+    """Slow statements of this process grouped by normalized SQL, bounded in size."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def add(self, connection, sql, params, duration, route):
+        key = (connection.alias, normalize(sql))
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            # Explain outside the lock; a concurrent first sighting just explains twice.
+            entry = SlowQuery(key[1], connection.alias, explain(connection, sql, params))
+        with self.lock:
+            entry = self.entries.setdefault(key, entry)
+            entry.count += 1
+            entry.total += duration
+            if duration >= entry.worst:
+                entry.worst = duration
+                entry.params = redact(params)
+            entry.routes[route] = entry.routes.get(route, 0) + 1
+            entry.last_seen = time.time()
+            limit = getattr(settings, 'SLOW_QUERY_LOG_SIZE', 200)
+            if len(self.entries) > limit:
+                self._evict(len(self.entries) - limit, keep=key, now=entry.last_seen)
+
+    def _evict(self, count, keep, now):
+        half_life = getattr(settings, 'SLOW_QUERY_DECAY_SECONDS', 3600)
+
+        def weight(k):
+            entry = self.entries[k]
+            return entry.total * 0.5 ** ((now - entry.last_seen) / half_life)
+
+        for k in heapq.nsmallest(count, (k for k in self.entries if k != keep), key=weight):
+            del self.entries[k]
+
+    def top(self, limit=20):
+        """The statements with the most total time, as dicts."""
+        with self.lock:
+            entries = sorted(self.entries.values(), key=lambda entry: -entry.total)[:limit]
+            return [entry.as_dict() for entry in entries]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+log = SlowQueryLog()
+
+
+class QueryRecorder:
+    """Execute wrapper adding statements slower than ``threshold`` seconds to ``log``."""
+
+    __slots__ = ('threshold', 'request')
+
+    def __init__(self, threshold, request=None):
+        self.threshold = threshold
+        self.request = request
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= self.threshold:
+                # executemany gets a batch of parameter sets, possibly already consumed.
+                log.add(context['connection'], sql, None if many else params, duration, route_name(self.request))
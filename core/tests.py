@@ -1,2 +1,356 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core import metrics, slow_queries, throttling
+from core.management.commands.profile_startup import parse_importtime
+from core.renderers import FastJSONRenderer
+from core.warmup import warm_up
+from library.models import Author, Book
+
+User = get_user_model()
+
+RATES = {'catalog_anon': '3/min', 'circulation': '2/min', 'token': '2/min'}
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': RATES})
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        caches['throttle'].clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='thr', email='thr@example.com', password='pass')
+
+    def test_warns_when_counters_are_not_shared(self):
+        with self.assertLogs('core.throttling', 'WARNING'):
+            self.assertTrue(throttling.warn_if_not_shared())
+        redis = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}
+        with override_settings(CACHES={**settings.CACHES, 'throttle': redis}):
+            self.assertFalse(throttling.warn_if_not_shared())
+
+    def test_token_endpoint_is_throttled_with_retry_after(self):
+        payload = {'username': 'thr', 'password': 'pass'}
+        codes = [self.client.post('/api/v1/token/', payload, format='json').status_code for _ in range(3)]
+
+        self.assertEqual(codes, [200, 200, 429])
+        resp = self.client.post('/api/v1/token/', payload, format='json')
+        self.assertGreaterEqual(int(resp['Retry-After']), 1)
+        self.assertEqual(throttling.throttle_stats(['token']), {'token': {'allowed': 2, 'rejected': 2}})
+
+    def test_anonymous_catalog_is_throttled_but_authenticated_is_not(self):
+        codes = [self.client.get('/api/v1/library/books/').status_code for _ in range(4)]
+        self.assertEqual(codes, [200, 200, 200, 429])
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/v1/library/books/').status_code, 200)
+
+    def test_circulation_limit_is_per_user(self):
+        other = User.objects.create_user(username='thr2', email='thr2@example.com', password='pass')
+        self.client.force_authenticate(self.user)
+        codes = [self.client.get('/api/v1/library/borrowings/').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/v1/library/borrowings/').status_code, 200)
+
+    def test_previous_window_is_weighted_by_overlap(self):
+        request = APIRequestFactory().get('/')
+        request.user = self.user
+        clock = {'now': 120.0}
+
+        def make():
+            throttle = throttling.CirculationThrottle()
+            throttle.timer = lambda: clock['now']
+            return throttle
+
+        self.assertTrue(make().allow_request(request, None))
+        self.assertTrue(make().allow_request(request, None))
+        self.assertFalse(make().allow_request(request, None))
+
+        # Halfway through the next window half of the previous count remains.
+        clock['now'] = 210.0
+        self.assertTrue(make().allow_request(request, None))
+        blocked = make()
+        self.assertFalse(blocked.allow_request(request, None))
+        self.assertEqual(blocked.wait(), 30)
+
+
+class PrecomputedSchemaTests(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = self.tmp / 'openapi.json'
+
+    def test_build_command_and_view_serve_artifact_with_etag_and_gzip(self):
+        with override_settings(OPENAPI_SCHEMA_PATH=self.path, DEBUG=False):
+            call_command('build_openapi_schema', stdout=StringIO())
+            self.assertTrue(self.path.exists())
+
+            resp = self.client.get('/api/schema/')
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('/api/v1/library/books/', json.loads(resp.content)['paths'])
+            etag = resp['ETag']
+
+            resp = self.client.get('/api/schema/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 304)
+
+            resp = self.client.get('/api/schema/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(resp['Content-Encoding'], 'gzip')
+            self.assertEqual(json.loads(gzip.decompress(resp.content))['info']['title'], 'Pemberley Library API')
+            self.assertNotEqual(resp['ETag'], etag)
+            # A validator of one encoding does not revalidate the other.
+            resp = self.client.get('/api/schema/', HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(resp.status_code, 200)
+            gzip_etag = resp['ETag']
+            resp = self.client.get('/api/schema/', HTTP_IF_NONE_MATCH=gzip_etag, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(self.client.get('/api/schema/', HTTP_IF_NONE_MATCH=gzip_etag).status_code, 200)
+            # Proxies may weaken validators or send several.
+            resp = self.client.get('/api/schema/', HTTP_IF_NONE_MATCH=f'"other", W/{gzip_etag}', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(resp.status_code, 304)
+
+    def test_gzip_body_always_matches_the_json_it_is_served_with(self):
+        with override_settings(OPENAPI_SCHEMA_PATH=self.path, DEBUG=False):
+            call_command('build_openapi_schema', stdout=StringIO())
+            self.client.get('/api/schema/')
+            # A rebuild caught between its two renames: new JSON, old gzip.
+            self.path.write_bytes(b'{"info": {"title": "Rebuilt"}}')
+
+            resp = self.client.get('/api/schema/', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(json.loads(gzip.decompress(resp.content))['info']['title'], 'Rebuilt')
+
+    def test_missing_artifact_falls_back_to_live_schema_only_in_debug(self):
+        with override_settings(OPENAPI_SCHEMA_PATH=self.path, DEBUG=True):
+            self.assertEqual(self.client.get('/api/schema/').status_code, 200)
+        with override_settings(OPENAPI_SCHEMA_PATH=self.path, DEBUG=False):
+            self.assertEqual(self.client.get('/api/schema/').status_code, 503)
+
+
+warm_up_tasks_started = []
+
+
+def start_warm_up_task():
+    warm_up_tasks_started.append(True)
+
+
+class StartupWarmupTests(TestCase):
+    def test_warm_up_reports_each_phase(self):
+        warm_up_tasks_started.clear()
+        with override_settings(
+            OPENAPI_SCHEMA_PATH=Path(tempfile.mkdtemp()) / 'missing.json',
+            WARMUP_BACKGROUND_TASKS=['core.tests.start_warm_up_task'],
+        ):
+            phases = warm_up()
+        self.assertEqual(list(phases), ['translations', 'urls', 'serializers', 'schema', 'background'])
+        self.assertEqual(warm_up_tasks_started, [True])
+        self.assertTrue(all(value >= 0 for value in phases.values()))
+
+    def test_parse_importtime_reads_depth_and_times(self):
+        stderr = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       198 |        198 |   _io',
+            'import time:        40 |         40 |     encodings.aliases',
+            'import time:       310 |        350 |   encodings',
+        ])
+        self.assertEqual(parse_importtime(stderr), [
+            ('_io', 198, 198, 0),
+            ('encodings.aliases', 40, 40, 1),
+            ('encodings', 310, 350, 0),
+        ])
+
+
+class FastRendererAndCompressionTests(TestCase):
+    def test_fast_renderer_matches_drf_output(self):
+        data = {
+            'id': uuid.uuid4(),
+            'when': timezone.now(),
+            'day': date(2024, 5, 1),
+            'price': Decimal('1.50'),
+            'text': 'line\u2028break \u00fc',
+            'nested': [{'n': 1}, None, True],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+    def test_only_large_responses_are_gzipped(self):
+        author = Author.objects.create(name='Gzip Author')
+        for i in range(20):
+            Book.objects.create(title=f'Gzip {i}', author=author, ISBN=f'GZIP-{i}', book_description='text ' * 50)
+
+        resp = self.client.get('/api/v1/library/books/?page_size=20', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(resp.content))['results']), 20)
+
+        resp = self.client.get('/api/v1/library/books/?page_size=1&fields=title', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(resp.has_header('Content-Encoding'))
+        self.assertEqual(resp.json()['results'], [{'title': 'Gzip 0'}])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.client = APIClient()
+
+    def sample(self, text, key):
+        for line in text.splitlines():
+            if line.startswith(key + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_requests_are_recorded_per_route(self):
+        author = Author.objects.create(name='Metric Author')
+        Book.objects.create(title='Metric Book', author=author, ISBN='METRIC-1')
+        self.client.get('/api/v1/library/books/')
+        self.client.get('/api/v1/library/books/')
+        self.client.get(f'/api/v1/library/books/{uuid.uuid4()}/')
+
+        with override_settings(METRICS_TOKEN='scrape-token'):
+            text = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token').content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertEqual(self.sample(text, 'http_requests_total{route="library:book-list",method="GET",status="200"}'), 2)
+        self.assertEqual(self.sample(text, 'http_requests_total{route="library:book-detail",method="GET",status="404"}'), 1)
+        self.assertEqual(
+            self.sample(text, 'http_request_duration_seconds_count{route="library:book-list",method="GET"}'), 2
+        )
+        self.assertEqual(
+            self.sample(text, 'http_request_duration_seconds_bucket{route="library:book-list",method="GET",le="+Inf"}'), 2
+        )
+        self.assertGreater(self.sample(text, 'db_queries_total{route="library:book-list"}'), 0)
+        self.assertEqual(self.sample(text, 'api_exceptions_total{exception="Http404"}'), 1)
+
+    @override_settings(METRICS_TOKEN='scrape-token', METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_metrics_are_not_public(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.client.force_login(User.objects.create_user(username='metrics-staff', password='pw', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_circulation_events_are_counted(self):
+        from library import services
+
+        user = User.objects.create_user(username='metric', email='m@example.com', password='pw')
+        waiting = User.objects.create_user(username='metric2', email='m2@example.com', password='pw')
+        book = Book.objects.create(title='Counted', author=Author.objects.create(name='A'), ISBN='METRIC-2')
+        loan = services.borrow_book(user, book)
+        services.reserve_book(waiting, book)
+        services.return_book(loan)
+
+        text = metrics.render()
+        for event in ('borrow', 'reserve', 'return', 'handoff'):
+            self.assertEqual(self.sample(text, f'library_circulation_events_total{{event="{event}"}}'), 1, event)
+
+    def test_worker_files_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        counter = metrics.Counter('test_worker_events_total', 'Test counter.', ['kind'])
+        histogram = metrics.Histogram('test_worker_seconds', 'Test histogram.', buckets=(0.1, 1.0))
+        with override_settings(METRICS_DIR=directory):
+            metrics.reset()
+            counter.labels('a').inc()
+            histogram.observe(0.05)
+            histogram.observe(0.5)
+            # Another worker process writing its own file.
+            other = metrics._MappedValues(str(Path(directory) / 'metrics_999999.db'))
+            other.add('test_worker_events_total{kind="a"}', 2)
+            for i in range(2000):
+                other.add(f'test_worker_events_total{{kind="k{i}"}}', 1)
+
+            other.close()
+
+            text = metrics.render()
+            # The exited worker's file was folded into the aggregate; nothing is counted twice.
+            self.assertEqual(
+                sorted(path.name for path in Path(directory).glob('metrics_*.db')),
+                sorted(['metrics_aggregate.db', f'metrics_{os.getpid()}.db']),
+            )
+            self.assertEqual(metrics.render(), text)
+        self.assertEqual(self.sample(text, 'test_worker_events_total{kind="a"}'), 3)
+        self.assertEqual(self.sample(text, 'test_worker_events_total{kind="k1999"}'), 1)
+        self.assertEqual(self.sample(text, 'test_worker_seconds_bucket{le="0.1"}'), 1)
+        self.assertEqual(self.sample(text, 'test_worker_seconds_bucket{le="1.0"}'), 2)
+        self.assertEqual(self.sample(text, 'test_worker_seconds_bucket{le="+Inf"}'), 2)
+        self.assertAlmostEqual(self.sample(text, 'test_worker_seconds_sum'), 0.55)
+
+
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        slow_queries.log.clear()
+        self.addCleanup(slow_queries.log.clear)
+
+    def test_normalize_groups_statements_and_redacts_params(self):
+        self.assertEqual(
+            slow_queries.normalize("SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s, %s) AND c > 10\n LIMIT 21"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c > ? LIMIT ?',
+        )
+        self.assertEqual(
+            slow_queries.normalize('INSERT INTO "t2" ("a", "b") VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO "t2" ("a", "b") VALUES (?, ?), ...',
+        )
+        self.assertEqual(slow_queries.redact(['secret', 42, None, True]), ['<str:6>', '<int>', None, True])
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_statements_are_listed_with_plan_for_staff(self):
+        author = Author.objects.create(name='Slow Author')
+        Book.objects.create(title='Slow Book', author=author, ISBN='SLOW-1')
+        client = APIClient()
+        client.get('/api/v1/library/books/', {'search': 'slow'})
+        client.get('/api/v1/library/books/', {'search': 'other'})
+
+        self.assertEqual(client.get('/api/v1/slow-queries/').status_code, 401)
+        client.force_authenticate(User.objects.create_user(username='ops', password='pw', is_staff=True))
+        data = client.get('/api/v1/slow-queries/', {'limit': 200}).json()
+        self.assertTrue(data['enabled'])
+        listing = [row for row in data['results'] if 'library:book-list' in row['routes']]
+        count_query = next(row for row in listing if row['sql'].startswith('SELECT COUNT(*)') and 'LIKE' in row['sql'])
+        self.assertEqual(count_query['count'], 2)
+        self.assertIn(count_query['params'][0], ('<str:6>', '<str:7>'))
+        self.assertNotIn('other', json.dumps(data))
+        self.assertTrue(count_query['plan'])
+        totals = [row['total_ms'] for row in data['results']]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+
+        self.assertEqual(client.delete('/api/v1/slow-queries/').status_code, 204)
+        self.assertEqual(client.get('/api/v1/slow-queries/').json()['results'], [])
+
+    @override_settings(SLOW_QUERY_LOG_SIZE=2, SLOW_QUERY_DECAY_SECONDS=60)
+    def test_full_log_keeps_new_statements_and_drops_stale_ones(self):
+        log = slow_queries.log
+        log.add(connection, 'SELECT 1', [], 5.0, 'a')
+        log.add(connection, 'SELECT 1, 2', [], 1.0, 'b')
+        log.entries[('default', 'SELECT ?')].last_seen -= 600
+
+        log.add(connection, 'SELECT 1, 2, 3', [], 0.01, 'c')
+        self.assertEqual(sorted(row['sql'] for row in log.top()), ['SELECT ?, ?', 'SELECT ?, ?, ?'])
+        log.add(connection, 'SELECT 1, 2, 3, 4', [], 0.01, 'd')
+        self.assertEqual(sorted(row['sql'] for row in log.top()), ['SELECT ?, ?', 'SELECT ?, ?, ?, ?'])
+
+    def test_failed_explain_leaves_the_transaction_usable(self):
+        with transaction.atomic():
+            author = Author.objects.create(name='Explained')
+            self.assertIsNone(slow_queries.explain(connection, 'SELECT * FROM missing_table', []))
+            self.assertTrue(Author.objects.filter(pk=author.pk).exists())
+
+    def test_log_is_off_without_threshold(self):
+        APIClient().get('/api/v1/library/books/')
+        self.assertEqual(slow_queries.log.top(), [])
@@ -0,0 +1,161 @@
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY_PREFIX = 'throttle-stats'
+
+
+def _throttle_cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+
+# Backends whose values live in the worker process.
+_PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def warn_if_not_shared():
+    """Log a warning when the throttle cache is private to each worker process."""
+    alias = getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in _PROCESS_LOCAL_BACKENDS:
+        logger.warning(
+            'Throttle cache %r (%s) is per process: each worker enforces the rates on its own. '
+            'Set THROTTLE_REDIS_URL to share the counters.', alias, backend,
+        )
+        return True
+    return False
+
+
+def _incr(cache, key, timeout=None):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The key was evicted between add() and incr().
+        cache.set(key, 1, timeout)
+        return 1
+
+
+def record_decision(scope, allowed):
+    """Count a decision; counters restart ``THROTTLE_STATS_TTL`` seconds after they were created."""
+    decision = 'allowed' if allowed else 'rejected'
+    ttl = getattr(settings, 'THROTTLE_STATS_TTL', 24 * 60 * 60)
+    _incr(_throttle_cache(), f'{STATS_KEY_PREFIX}:{scope}:{decision}', ttl)
+
+
+def throttle_stats(scopes=None):
+    """Return ``{scope: {'allowed': n, 'rejected': n}}`` from the shared cache."""
+    scopes = scopes or list(api_settings.DEFAULT_THROTTLE_RATES or {})
+    keys = [f'{STATS_KEY_PREFIX}:{scope}:{decision}' for scope in scopes for decision in ('allowed', 'rejected')]
+    values = _throttle_cache().get_many(keys)
+    return {
+        scope: {
+            decision: values.get(f'{STATS_KEY_PREFIX}:{scope}:{decision}', 0)
+            for decision in ('allowed', 'rejected')
+        }
+        for scope in scopes
+    }
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """Sliding-window-counter throttle backed by a shared Django cache.
+
+    Each client keeps two integer counters (current and previous fixed
+    window); the previous one is weighted by how much of it still overlaps
+    the sliding window. A check is one ``add``/``incr`` and one ``get`` on
+    the cache, independent of the rate, and memory is two small keys per
+    active client. Counters live in the cache named by
+    ``THROTTLE_CACHE_ALIAS`` so all worker processes share them when that
+    cache is shared (Redis, Memcached).
+    """
+
+    def __init__(self):
+        self.cache = _throttle_cache()
+        super().__init__()
+
+    def get_rate(self):
+        # Read rates at request time so settings overrides are honoured.
+        return (api_settings.DEFAULT_THROTTLE_RATES or {}).get(self.scope)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = (self.now % self.duration) / self.duration
+        current_key = f'{self.key}:{window}'
+
+        self.current = _incr(self.cache, current_key, self.duration * 2)
+        self.previous = self.cache.get(f'{self.key}:{window - 1}', 0)
+
+        allowed = self.previous * (1 - self.elapsed) + self.current <= self.num_requests
+        if not allowed:
+            # Rejected attempts do not consume quota.
+            try:
+                self.cache.decr(current_key)
+            except ValueError:
+                pass
+            self.current -= 1
+            logger.warning('Throttled %s for scope %s', self.key, self.scope)
+        record_decision(self.scope, allowed)
+        return allowed
+
+    def wait(self):
+        """Seconds until the weighted count drops below the limit."""
+        limit = self.num_requests
+        if self.current < limit and self.previous:
+            needed = 1 - (limit - self.current - 1) / self.previous
+            remaining = max(0.0, needed - self.elapsed)
+        else:
+            # The current window alone is full: wait for it to become the
+            # previous window and decay enough.
+            needed = 1 - (limit - 1) / self.current if self.current else 0.0
+            remaining = (1 - self.elapsed) + max(0.0, needed)
+        return max(1, math.ceil(remaining * self.duration))
+
+
+class CatalogAnonThrottle(SlidingWindowThrottle):
+    """Limits anonymous catalog reads per client IP."""
+
+    scope = 'catalog_anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class CirculationThrottle(SlidingWindowThrottle):
+    """Limits circulation calls per authenticated user (per IP otherwise)."""
+
+    scope = 'circulation'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class TokenIssueThrottle(SlidingWindowThrottle):
+    """Limits JWT token issuance per client IP."""
+
+    scope = 'token'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
@@ -1,5 +1,18 @@
+import hmac
 import logging
-from rest_framework import viewsets
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views import View
+from rest_framework import permissions, status, viewsets
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import metrics, slow_queries
+from .schema import load_schema_artifact
 
 logger = logging.getLogger(__name__)
 
@@ -13,3 +26,101 @@ class BaseViewSet(viewsets.ModelViewSet):
 			pass
 		return super().handle_exception(exc)
 
+
+_gzip_re = re.compile(r'\bgzip\b')
+
+
+def _etag_matches(header, etag):
+	"""Weak comparison of ``etag`` with an ``If-None-Match`` list, as RFC 9110 asks."""
+	candidates = parse_etags(header)
+	return '*' in candidates or any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+class PrecomputedSchemaView(View):
+	"""Serve the OpenAPI schema written by ``manage.py build_openapi_schema``.
+
+	Responses carry an ETag (``304`` on a matching ``If-None-Match``) and are
+	sent gzip-encoded when the client accepts it, under an ETag of their own. Without an artifact the
+	schema is generated live only when ``DEBUG`` is on.
+	"""
+
+	live_view = None
+
+	def get(self, request, *args, **kwargs):
+		artifact = load_schema_artifact()
+		if artifact is None:
+			if settings.DEBUG:
+				return self._live_view()(request, *args, **kwargs)
+			logger.error('OpenAPI schema artifact missing; run manage.py build_openapi_schema')
+			return JsonResponse({'detail': 'Schema not available'}, status=503)
+
+		gzipped = bool(_gzip_re.search(request.headers.get('Accept-Encoding', '')))
+		etag = artifact.gzip_etag if gzipped else artifact.etag
+		if _etag_matches(request.headers.get('If-None-Match', ''), etag):
+			response = HttpResponseNotModified()
+		elif gzipped:
+			response = HttpResponse(artifact.compressed, content_type='application/vnd.oai.openapi+json')
+			response['Content-Encoding'] = 'gzip'
+		else:
+			response = HttpResponse(artifact.content, content_type='application/vnd.oai.openapi+json')
+		response['ETag'] = etag
+		response['Cache-Control'] = 'public, max-age=300'
+		patch_vary_headers(response, ('Accept-Encoding',))
+		return response
+
+	@classmethod
+	def _live_view(cls):
+		if cls.live_view is None:
+			from drf_spectacular.views import SpectacularAPIView
+
+			cls.live_view = SpectacularAPIView.as_view()
+		return cls.live_view
+
+
+class MetricsView(View):
+	"""Metrics of all worker processes in the Prometheus text format.
+
+	Served to staff users, to requests carrying ``METRICS_TOKEN`` as a bearer
+	token and to clients in ``METRICS_ALLOWED_IPS``; everyone else gets 403.
+	"""
+
+	def get(self, request, *args, **kwargs):
+		if not self._allowed(request):
+			return HttpResponseForbidden()
+		return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+	@staticmethod
+	def _allowed(request):
+		user = getattr(request, 'user', None)
+		if user is not None and user.is_staff:
+			return True
+		token = getattr(settings, 'METRICS_TOKEN', None)
+		scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+		if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+			return True
+		return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+
+class SlowQueryView(APIView):
+	"""Staff only: this worker's slow statements, most total time first (``?limit=``, default 20).
+
+	``DELETE`` clears the log, e.g. after adding an index.
+	"""
+
+	permission_classes = [permissions.IsAdminUser]
+
+	def get(self, request, *args, **kwargs):
+		try:
+			limit = min(max(int(request.query_params.get('limit', 20)), 1), 200)
+		except ValueError:
+			return Response({'detail': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+		return Response({
+			'enabled': slow_queries.threshold_seconds() is not None,
+			'threshold_ms': getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None),
+			'sample_rate': getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0),
+			'results': slow_queries.log.top(limit),
+		})
+
+	def delete(self, request, *args, **kwargs):
+		slow_queries.log.clear()
+		return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,120 @@
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _iter_callbacks(patterns):
+    from django.urls import URLPattern, URLResolver
+
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _iter_callbacks(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern.callback
+
+
+def _view_class(callback):
+    return getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+
+
+def warm_up():
+    """Prime lazily-built per-process state before a worker takes traffic.
+
+    Loads the translation catalog, resolves the URLconf (including the
+    reverse lookup tables), builds the fields of every serializer reachable
+    from a URL and loads the precomputed OpenAPI schema. Then it calls the
+    ``WARMUP_BACKGROUND_TASKS`` (dotted paths), which start slower work such
+    as index builds in their own threads and return at once. This thread
+    opens no database connection.
+    Returns the time spent per phase in milliseconds.
+    """
+    from django.conf import settings
+    from django.urls import get_resolver
+    from django.utils.module_loading import import_string
+    from django.utils import translation
+
+    phases = {}
+    clock = time.perf_counter()
+
+    def mark(name):
+        nonlocal clock
+        now = time.perf_counter()
+        phases[name] = round((now - clock) * 1000, 3)
+        clock = now
+
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('')
+    mark('translations')
+
+    resolver = get_resolver()
+    resolver.reverse_dict
+    callbacks = list(_iter_callbacks(resolver.url_patterns))
+    mark('urls')
+
+    seen = set()
+    for callback in callbacks:
+        serializer_class = getattr(_view_class(callback), 'serializer_class', None)
+        if serializer_class is None or serializer_class in seen:
+            continue
+        seen.add(serializer_class)
+        try:
+            serializer_class(context={}).fields
+        except Exception:
+            logger.debug('Could not pre-build fields for %s', serializer_class, exc_info=True)
+    mark('serializers')
+
+    from .schema import load_schema_artifact
+
+    load_schema_artifact()
+    mark('schema')
+
+    for path in getattr(settings, 'WARMUP_BACKGROUND_TASKS', ()):
+        try:
+            import_string(path)()
+        except Exception:
+            logger.exception('Could not start warm-up task %s', path)
+    mark('background')
+
+    logger.info('Worker warm-up finished in %.1f ms: %s', sum(phases.values()), phases)
+    return phases
+
+
+def profile_child(url, warm):
+    """Entry point of the subprocess started by ``manage.py profile_startup``.
+
+    Times Django setup, WSGI handler construction, the optional warm-up and
+    the first request to ``url``, and prints the timings as one JSON line.
+    """
+    timings = {}
+    clock = time.perf_counter()
+
+    def mark(name):
+        nonlocal clock
+        now = time.perf_counter()
+        timings[name] = round((now - clock) * 1000, 3)
+        clock = now
+
+    import django
+
+    django.setup()
+    mark('django_setup')
+
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import Client
+
+    WSGIHandler()
+    client = Client(SERVER_NAME='localhost')
+    mark('handler')
+
+    if warm:
+        warm_up()
+        mark('warm_up')
+
+    response = client.get(url)
+    mark('first_request')
+    response = client.get(url)
+    mark('second_request')
+
+    print(json.dumps({'timings': timings, 'status': response.status_code}))
@@ -2,25 +2,71 @@ from django.contrib import admin
 
 
 from . import apps
-from .models import Author, Book, Borrowing
+from . import services
+from .models import Author, Book, BookCopy, Borrowing, Branch, Reservation
+from core.paginators import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+	"""Changelist defaults for tables that grow to millions of rows."""
+
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+	list_per_page = 50
+
+
+@admin.register(Branch)
+class BranchAdmin(admin.ModelAdmin):
+	list_display = ('code', 'name')
+	search_fields = ('code', 'name')
 
 
 @admin.register(Author)
 class AuthorAdmin(admin.ModelAdmin):
 	list_display = ('name', 'birth_date', 'nationality')
+	search_fields = ('name',)
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
-	list_display = ('title', 'author', 'ISBN', 'status')
+class BookAdmin(LargeTableAdmin):
+	list_display = ('title', 'author', 'ISBN', 'status', 'branch')
+	list_select_related = ('author',)
+	list_filter = ('status', 'branch')
+	search_fields = ('=ISBN', 'title')
+	autocomplete_fields = ('author',)
+
+
+@admin.register(BookCopy)
+class BookCopyAdmin(LargeTableAdmin):
+	list_display = ('barcode', 'book', 'branch', 'status')
+	list_select_related = ('book',)
+	list_filter = ('status',)
+	search_fields = ('=barcode',)
+	raw_id_fields = ('book',)
 
 
 @admin.register(Borrowing)
-class BorrowingAdmin(admin.ModelAdmin):
+class BorrowingAdmin(LargeTableAdmin):
 	list_display = ('user', 'book', 'borrow_date', 'return_date', 'returned')
+	list_select_related = ('user', 'book')
+	list_filter = ('returned',)
+	raw_id_fields = ('user', 'book', 'copy')
+	actions = ['mark_returned']
 
+	@admin.action(description='Mark selected borrowings as returned')
+	def mark_returned(self, request, queryset):
+		returned, handed_off = services.get_borrowing_service().return_many(
+			queryset.filter(returned=False).values_list('pk', flat=True)
+		)
+		self.message_user(
+			request,
+			f'{returned} borrowings marked as returned; {handed_off} items passed to waiting reservations.',
+		)
 
-@admin.register(getattr(__import__('library.models', fromlist=['Reservation']), 'Reservation'))
-class ReservationAdmin(admin.ModelAdmin):
-	list_display = ('user', 'book', 'created_at', 'active')
 
+@admin.register(Reservation)
+class ReservationAdmin(LargeTableAdmin):
+	list_display = ('user', 'book', 'created_at', 'active', 'pickup_deadline')
+	list_select_related = ('user', 'book')
+	list_filter = ('active',)
+	raw_id_fields = ('user', 'book', 'held_copy')
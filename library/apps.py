@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_delete, pre_migrate
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+
+        from . import routers
+        from .models import Book, BookCopy, Branch
+
+        pre_migrate.connect(routers.migration_started, dispatch_uid='library-migration-started')
+        post_migrate.connect(routers.migration_finished, dispatch_uid='library-migration-finished')
+        for model in (Book, BookCopy, Branch, get_user_model()):
+            pre_delete.connect(
+                routers.delete_from_other_databases, sender=model, dispatch_uid=f'library-delete-{model._meta.label}'
+            )
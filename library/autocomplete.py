@@ -0,0 +1,337 @@
+"""In-process prefix index for type-ahead suggestions on titles and authors.
+
+Every title and author name is normalized (accents folded, case folded,
+punctuation collapsed) and indexed under its beginning and the beginning of
+its next few words, so "pot" finds "Harry Potter". The keys form one sorted
+array of integers searched with ``bisect``; for each block of keys the best
+objects by popularity are precomputed, so a short prefix matching half the
+catalog still only looks at a few candidates per block.
+
+The index is built once per process by a background refresher thread,
+started by the worker warm-up (``core.warmup``) or else by the first lookup;
+suggestions are empty until it is ready. The same thread then picks up
+titles changed since, every ``LIBRARY_AUTOCOMPLETE_REFRESH_SECONDS``, by
+reading ``Book.updated_at`` (which ``library.trending`` bumps with the
+score) and inserts them into a small sorted side list. Deletions and author
+renames are applied by the full rebuild every
+``LIBRARY_AUTOCOMPLETE_REBUILD_SECONDS``, which the thread runs while the
+old index keeps serving. Lookups never query the database.
+"""
+import bisect
+import heapq
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Author, Book
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+# Word starts indexed per title or name besides its beginning.
+MAX_WORD_STARTS = 4
+# Word starts past this offset are not indexed (offsets are stored in 8 bits).
+MAX_OFFSET = 0xFF
+BLOCK_SIZE = 256
+# Results for prefixes up to this length are memoized until the next rebuild.
+MEMO_PREFIX_LENGTH = 3
+
+DEFAULT_REFRESH_SECONDS = 5
+DEFAULT_REBUILD_SECONDS = 3600
+# Overlap when polling for changed titles, to absorb clock skew between hosts.
+SYNC_OVERLAP = timedelta(seconds=1)
+
+_SEPARATORS = re.compile(r'[\W_]+')
+_KEY_END = '\U0010ffff'
+
+
+def normalize(text):
+    """Accent-fold and case-fold ``text``, keeping words separated by single spaces."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    folded = ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+    return _SEPARATORS.sub(' ', folded).strip()
+
+
+def word_starts(normalized):
+    """Offsets in ``normalized`` at which it is indexed."""
+    offsets = [0] if normalized else []
+    start = 0
+    for _ in range(MAX_WORD_STARTS):
+        start = normalized.find(' ', start) + 1
+        if not start or start > MAX_OFFSET:
+            break
+        offsets.append(start)
+    return offsets
+
+
+class PrefixIndex:
+    """Sorted prefix keys over objects ranked by a popularity score.
+
+    Objects are numbered by slot. A key is not stored as a string: an entry
+    is ``slot << 8 | offset`` and stands for the normalized label of
+    ``slot`` from ``offset`` on, so the sorted ``entries`` array costs eight
+    bytes per key. ``pending`` holds the entries added since the build, and
+    ``removed`` the slots of objects replaced since. Memoized results are
+    dropped on every change.
+    """
+
+    def __init__(self, items=()):
+        self.pks = []
+        self.labels = []
+        self.normalized = []
+        self.scores = array('d')
+        self.slot_of = {}
+        self.pending = []
+        self.removed = set()
+        self._memo = {}
+
+        entries = []
+        for pk, label, score in items:
+            slot = self._add_object(pk, label, score)
+            entries.extend(slot << 8 | offset for offset in word_starts(self.normalized[slot]))
+        entries.sort(key=self._key)
+        self.entries = array('q', entries)
+        del entries
+        self.block_tops = [
+            array('q', self._best({entry >> 8 for entry in self.entries[start:start + BLOCK_SIZE]}, MAX_LIMIT))
+            for start in range(0, len(self.entries), BLOCK_SIZE)
+        ]
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def _key(self, entry):
+        return self.normalized[entry >> 8][entry & MAX_OFFSET:]
+
+    def _add_object(self, pk, label, score):
+        slot = len(self.pks)
+        self.pks.append(pk)
+        self.labels.append(label)
+        self.normalized.append(normalize(label))
+        self.scores.append(float(score or 0))
+        self.slot_of[pk] = slot
+        return slot
+
+    def _best(self, slots, limit):
+        # Ties go to the lower slot, i.e. to build order (alphabetical).
+        scores = self.scores
+        return heapq.nlargest(limit, slots, key=lambda slot: (scores[slot], -slot))
+
+    def upsert(self, pk, label, score=None):
+        """Add or update one object; ``score=None`` keeps its current score."""
+        slot = self.slot_of.get(pk)
+        if slot is not None:
+            if score is None:
+                score = self.scores[slot]
+            self._memo.clear()
+            if self.labels[slot] == label:
+                self.scores[slot] = float(score or 0)
+                return
+            self.removed.add(slot)
+        self._memo.clear()
+        slot = self._add_object(pk, label, score)
+        for offset in word_starts(self.normalized[slot]):
+            bisect.insort(self.pending, slot << 8 | offset, key=self._key)
+
+    def _range(self, entries, prefix):
+        lo = bisect.bisect_left(entries, prefix, key=self._key)
+        return lo, bisect.bisect_left(entries, prefix + _KEY_END, lo, key=self._key)
+
+    def _main_candidates(self, prefix):
+        if prefix in self._memo:
+            return self._memo[prefix]
+        lo, hi = self._range(self.entries, prefix)
+        first_block = -(-lo // BLOCK_SIZE)
+        last_block = hi // BLOCK_SIZE
+        if first_block < last_block:
+            candidates = {entry >> 8 for entry in self.entries[lo:first_block * BLOCK_SIZE]}
+            for block in range(first_block, last_block):
+                candidates.update(self.block_tops[block])
+            candidates.update(entry >> 8 for entry in self.entries[last_block * BLOCK_SIZE:hi])
+        else:
+            candidates = {entry >> 8 for entry in self.entries[lo:hi]}
+        best = self._best(candidates - self.removed, MAX_LIMIT)
+        if len(prefix) <= MEMO_PREFIX_LENGTH:
+            self._memo[prefix] = best
+        return best
+
+    def search(self, text, limit=DEFAULT_LIMIT):
+        """Return ``[(pk, label), ...]`` of the most popular objects matching ``text``."""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        candidates = set(self._main_candidates(prefix))
+        if self.pending:
+            lo, hi = self._range(self.pending, prefix)
+            candidates.update(entry >> 8 for entry in self.pending[lo:hi])
+        candidates -= self.removed
+        return [(self.pks[slot], self.labels[slot]) for slot in self._best(candidates, limit)]
+
+    def memory_usage(self):
+        """Approximate bytes held by the index, by part."""
+        getsizeof = sys.getsizeof
+        return {
+            'entries': getsizeof(self.entries) + getsizeof(self.pending) + len(self.pending) * 32,
+            'blocks': getsizeof(self.block_tops) + sum(getsizeof(top) for top in self.block_tops),
+            'keys': getsizeof(self.normalized) + sum(getsizeof(text) for text in self.normalized),
+            'labels': getsizeof(self.labels) + sum(getsizeof(label) for label in self.labels),
+            'objects': (
+                getsizeof(self.pks) + sum(getsizeof(pk) for pk in self.pks)
+                + getsizeof(self.scores) + getsizeof(self.slot_of)
+            ),
+        }
+
+
+class CatalogAutocomplete:
+    """Title and author indexes of one process, with their refresh state."""
+
+    def __init__(self, titles, authors, synced_at):
+        self.titles = titles
+        self.authors = authors
+        self.built_at = time.monotonic()
+        self.synced_at = synced_at
+        self._sync_lock = threading.Lock()
+
+    @classmethod
+    def build(cls, chunk_size=10000):
+        started = timezone.now()
+        clock = time.perf_counter()
+        titles = PrefixIndex(
+            Book.objects.order_by('title').values_list('pk', 'title', 'trending_score').iterator(chunk_size=chunk_size)
+        )
+        authors = PrefixIndex(
+            Author.objects.annotate(book_count=Count('books')).order_by('name')
+            .values_list('pk', 'name', 'book_count').iterator(chunk_size=chunk_size)
+        )
+        logger.info(
+            'Autocomplete index built: titles=%s authors=%s in %.2fs',
+            len(titles), len(authors), time.perf_counter() - clock,
+        )
+        return cls(titles, authors, started)
+
+    def sync(self):
+        """Apply titles (and their authors) changed since the last sync."""
+        if not self._sync_lock.acquire(blocking=False):
+            return 0
+        try:
+            started = timezone.now()
+            changed = (
+                Book.objects.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP)
+                .select_related('author')
+                .only('id', 'title', 'trending_score', 'author__id', 'author__name')
+            )
+            count = 0
+            for book in changed.iterator():
+                self.titles.upsert(book.pk, book.title, book.trending_score)
+                self.authors.upsert(book.author.pk, book.author.name)
+                count += 1
+            self.synced_at = started
+            return count
+        finally:
+            self._sync_lock.release()
+
+    def search(self, text, limit=DEFAULT_LIMIT):
+        return {
+            'titles': [{'id': pk, 'title': label} for pk, label in self.titles.search(text, limit)],
+            'authors': [{'id': pk, 'name': label} for pk, label in self.authors.search(text, limit)],
+        }
+
+    def memory_usage(self):
+        return {'titles': self.titles.memory_usage(), 'authors': self.authors.memory_usage()}
+
+
+_index = None
+_refreshing = threading.Event()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def refresh():
+    """One pass of the refresher: build, rebuild or sync the process-wide index."""
+    global _index
+    index = _index
+    if index is None or (
+        time.monotonic() - index.built_at >= _setting('LIBRARY_AUTOCOMPLETE_REBUILD_SECONDS', DEFAULT_REBUILD_SECONDS)
+    ):
+        _index = CatalogAutocomplete.build()
+    else:
+        index.sync()
+
+
+def _start_refresher():
+    """Start the thread that builds the index and keeps it fresh, once per process.
+
+    Lookups never touch the database: the thread builds the index, then
+    every ``LIBRARY_AUTOCOMPLETE_REFRESH_SECONDS`` syncs changed titles or,
+    when it is due, rebuilds it while the old index keeps serving.
+    """
+
+    def run():
+        while True:
+            try:
+                refresh()
+            except Exception:
+                logger.exception('Autocomplete index refresh failed')
+            finally:
+                connections.close_all()
+            time.sleep(_setting('LIBRARY_AUTOCOMPLETE_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS))
+
+    if not _refreshing.is_set():
+        _refreshing.set()
+        threading.Thread(target=run, name='autocomplete-refresh', daemon=True).start()
+
+
+# Threads do not survive fork(): a forked worker starts its own refresher.
+os.register_at_fork(after_in_child=_refreshing.clear)
+
+
+def warm():
+    """Start the background refresher, which builds the process-wide index."""
+    _start_refresher()
+
+
+def build():
+    """Build the process-wide index now, in the calling thread."""
+    global _index
+    _index = CatalogAutocomplete.build()
+    return _index
+
+
+def get_index():
+    """The process-wide index, or ``None`` while it is first built.
+
+    Only reads memory; the first lookup in a process that was not warmed up
+    starts the refresher.
+    """
+    index = _index
+    if index is None:
+        _start_refresher()
+    return index
+
+
+def reset():
+    """Drop the process-wide index; the next ``get_index()`` rebuilds it."""
+    global _index
+    _index = None
+
+
+def suggest(text, limit=DEFAULT_LIMIT):
+    index = get_index()
+    if index is None:
+        return {'titles': [], 'authors': []}
+    return index.search(text, max(1, min(limit, MAX_LIMIT)))
@@ -0,0 +1,246 @@
+"""Live availability of titles, pushed to clients as Server-Sent Events.
+
+Clients open ``GET /books/availability/stream/?books=<id>,<id>`` and get the
+current status of each title, then one event per status change. The
+borrowing service announces the titles a transition touched with
+``book_changed()``; once the transaction commits their statuses are read
+with one query and handed to the process-wide ``hub``, which forwards each
+change to the streams subscribed to that title.
+
+Backpressure is by conflation: a stream keeps only the latest status of
+each of its titles until it is written out, so a slow client skips
+intermediate states instead of buffering them, and memory per stream is
+bounded by the titles it watches. Idle streams are one coroutine waiting
+on an event, with a comment line sent every
+``LIBRARY_AVAILABILITY_HEARTBEAT_SECONDS`` to keep proxies from closing
+them.
+
+The hub lives in the worker process, like the slow-query log. Changes made
+by other workers are picked up by one poll of the watched titles every
+``LIBRARY_AVAILABILITY_SYNC_SECONDS`` per process (``None`` disables it for
+single-worker deployments). Streams need the ASGI application
+(``config.asgi``); the WSGI handler would hold a thread per client.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEARTBEAT_SECONDS = 15
+DEFAULT_SYNC_SECONDS = 5
+DEFAULT_MAX_SUBSCRIBERS = 10000
+DEFAULT_MAX_BOOKS = 200
+
+# Reconnection delay suggested to clients (milliseconds).
+RETRY_MS = 3000
+
+_LOOKUP_CHUNK = 500
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def heartbeat_seconds():
+    return _setting('LIBRARY_AVAILABILITY_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)
+
+
+def sync_seconds():
+    return _setting('LIBRARY_AVAILABILITY_SYNC_SECONDS', DEFAULT_SYNC_SECONDS)
+
+
+def max_subscribers():
+    return _setting('LIBRARY_AVAILABILITY_MAX_SUBSCRIBERS', DEFAULT_MAX_SUBSCRIBERS)
+
+
+def max_books():
+    return _setting('LIBRARY_AVAILABILITY_MAX_BOOKS', DEFAULT_MAX_BOOKS)
+
+
+class Subscriber:
+    """One stream: its titles and their latest statuses not yet written out."""
+
+    __slots__ = ('books', 'loop', 'pending', 'ready')
+
+    def __init__(self, books, loop):
+        self.books = frozenset(books)
+        self.loop = loop
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def deliver(self, statuses):
+        """Merge ``statuses`` into the pending changes; runs on ``loop``."""
+        for book_id, status in statuses.items():
+            if book_id in self.books:
+                self.pending[book_id] = status
+        if self.pending:
+            self.ready.set()
+
+    async def changes(self, timeout):
+        """The changes since the last call, waiting up to ``timeout`` seconds for one."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self.ready.clear()
+        changes, self.pending = self.pending, {}
+        return changes
+
+
+def _deliver(subscribers, statuses):
+    for subscriber in subscribers:
+        subscriber.deliver(statuses)
+
+
+class AvailabilityHub:
+    """Fan-out of title status changes to the subscribed streams of this process.
+
+    ``publish`` may be called from any thread; each event loop holding
+    subscribers gets one callback per publish.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+        self.statuses = {}
+        self.count = 0
+        self._syncing = None
+
+    def subscribe(self, books):
+        subscriber = Subscriber(books, asyncio.get_running_loop())
+        with self.lock:
+            for book_id in subscriber.books:
+                self.subscribers[book_id].add(subscriber)
+            self.count += 1
+            if sync_seconds() is not None and not self._sync_running():
+                self._syncing = subscriber.loop.create_task(self._sync())
+        return subscriber
+
+    def _sync_running(self):
+        task = self._syncing
+        return task is not None and not task.done() and not task.get_loop().is_closed()
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            for book_id in subscriber.books:
+                watchers = self.subscribers.get(book_id)
+                if watchers is None:
+                    continue
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self.subscribers[book_id]
+                    self.statuses.pop(book_id, None)
+            self.count -= 1
+
+    def watched(self, book_ids):
+        """The titles among ``book_ids`` that at least one stream watches."""
+        with self.lock:
+            return [book_id for book_id in book_ids if book_id in self.subscribers]
+
+    def seed(self, statuses):
+        """Record statuses read for a new stream, keeping any published since."""
+        with self.lock:
+            for book_id, status in statuses.items():
+                if book_id in self.subscribers:
+                    self.statuses.setdefault(book_id, status)
+
+    def publish(self, statuses):
+        """Forward the statuses that changed to the streams watching them."""
+        loops = defaultdict(set)
+        with self.lock:
+            changed = {}
+            for book_id, status in statuses.items():
+                if book_id in self.subscribers and self.statuses.get(book_id) != status:
+                    changed[book_id] = status
+                    for subscriber in self.subscribers[book_id]:
+                        loops[subscriber.loop].add(subscriber)
+            self.statuses.update(changed)
+        for loop, subscribers in loops.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, subscribers, changed)
+            except RuntimeError:
+                # The loop was closed with its streams; nothing left to notify.
+                pass
+        return len(changed)
+
+    async def _sync(self):
+        """Poll the watched titles so changes made by other workers reach this one."""
+        try:
+            while True:
+                await asyncio.sleep(sync_seconds())
+                with self.lock:
+                    books = list(self.subscribers)
+                    if not books:
+                        self._syncing = None
+                        return
+                try:
+                    self.publish(await current_statuses(books))
+                except Exception:
+                    logger.exception('Could not refresh the statuses of %s watched titles', len(books))
+        except asyncio.CancelledError:
+            with self.lock:
+                self._syncing = None
+            raise
+
+
+hub = AvailabilityHub()
+
+
+async def current_statuses(book_ids):
+    """``{book_id: status}`` of ``book_ids``, read in chunks."""
+    book_ids = list(book_ids)
+    statuses = {}
+    for start in range(0, len(book_ids), _LOOKUP_CHUNK):
+        async for book_id, status in Book.objects.filter(
+            pk__in=book_ids[start:start + _LOOKUP_CHUNK]
+        ).values_list('pk', 'status'):
+            statuses[book_id] = status
+    return statuses
+
+
+def book_changed(*book_ids):
+    """Publish the status of ``book_ids`` once the current transaction commits."""
+    book_ids = set(book_ids)
+    transaction.on_commit(lambda: publish_current(book_ids))
+
+
+def publish_current(book_ids):
+    """Read and publish the status of the watched titles among ``book_ids``."""
+    try:
+        watched = hub.watched(book_ids)
+        if watched:
+            hub.publish(dict(Book.objects.filter(pk__in=watched).values_list('pk', 'status')))
+    except Exception:
+        # Live availability is a convenience; the committed transition must not fail because of it.
+        logger.exception('Could not publish availability of %s titles', len(book_ids))
+
+
+def _event(book_id, status):
+    return f'event: availability\ndata: {json.dumps({"book": str(book_id), "status": status})}\n\n'
+
+
+async def stream(book_ids):
+    """The event stream of one client: current statuses, then changes and heartbeats."""
+    subscriber = hub.subscribe(book_ids)
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        statuses = await current_statuses(subscriber.books)
+        hub.seed(statuses)
+        if statuses:
+            yield ''.join(_event(book_id, status) for book_id, status in statuses.items())
+        while True:
+            changes = await subscriber.changes(heartbeat_seconds())
+            if changes:
+                yield ''.join(_event(book_id, status) for book_id, status in changes.items())
+            else:
+                yield ': heartbeat\n\n'
+    finally:
+        hub.unsubscribe(subscriber)
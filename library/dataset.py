@@ -0,0 +1,464 @@
+"""Synthetic library data for scale testing (``manage.py generate_dataset``).
+
+Everything is derived from one seed: each table draws from its own
+``random.Random`` stream, so the same seed and sizes give the same rows, and
+changing the number of loans does not change the titles generated.
+
+Distributions:
+
+* title popularity is Zipf-like (weight ``1 / rank ** zipf`` over a shuffled
+  catalogue), author output and patron activity likewise with milder
+  exponents;
+* loans are spread uniformly over ``history_days``; ``open_ratio`` of them
+  are still out (one per title, the most popular titles being the likeliest
+  to be out), ``overdue_ratio`` of those past their due date;
+* titles that are out get a queue of waiting reservations whose length is
+  geometric with mean ``mean_queue`` (at most ``max_queue``).
+
+Loans and reservations are written before the titles, so ``Book.status``
+and ``Book.trending_score`` (the forward-decayed sum of the generated
+events, see ``library.trending``) are exact when the titles are inserted.
+The whole load is one transaction per database: the deferred foreign keys
+of the loans are checked at commit, once their titles exist, and a failed
+run leaves nothing behind. Row ids also depend on ``label``, so datasets
+with different labels can be loaded into the same database.
+Only per-title counters and the ids of titles and patrons are kept in
+memory; rows are generated and written ``chunk_size`` at a time, with
+``bulk_create`` or, with ``raw=True``, a plain ``executemany`` of
+pre-adapted values that skips model instances altogether. The raw path
+also drops the secondary indexes of the circulation tables while loading
+and rebuilds them at the end, and it stores the generated ``created_at``
+of loans and reservations, so reservation queues keep their order;
+``bulk_create`` stamps them with the insertion time.
+"""
+import functools
+import heapq
+import itertools
+import math
+import random
+import time
+import uuid
+from array import array
+from contextlib import ExitStack, contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import routers, trending
+from .models import Author, Book, Borrowing, Branch, Reservation
+
+LOAN_DAYS = 14
+AUTHOR_EXPONENT = 0.8
+PATRON_EXPONENT = 0.6
+CATEGORIES = ['Fiction', 'History', 'Science', 'Poetry', 'Children', 'Biography', 'Travel', 'Philosophy', 'Art']
+LANGUAGES = ['pt', 'en', 'es', 'fr']
+SYLLABLES = ['ba', 'ca', 'de', 'fé', 'go', 'hu', 'la', 'mi', 'no', 'pê', 'qui', 'ro', 'sa', 'tu', 'vi', 'zo', 'ção']
+
+_DAY = 86400
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+
+
+def _stream(seed, name):
+    return random.Random(f'{seed}:{name}')
+
+
+def _zipf_cum_weights(count, exponent):
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def _ranked(count, rng):
+    """A random permutation of ``range(count)``: position = popularity rank."""
+    order = list(range(count))
+    rng.shuffle(order)
+    return order
+
+
+def _isbn13(number):
+    first12 = f'979{number:09d}'
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first12))
+    return first12 + str((10 - total % 10) % 10)
+
+
+def _words(rng, count):
+    return ' '.join(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))) for _ in range(count))
+
+
+def _is_uuid(field):
+    target = field.target_field if field.is_relation else field
+    return target.get_internal_type() == 'UUIDField'
+
+
+class _Writer:
+    """Insert rows of one model into one database, ``chunk_size`` at a time.
+
+    Rows are tuples in the order of ``fields``. UUIDs are given as 128-bit
+    integers and datetimes as UTC epoch seconds, so generating a row stays
+    cheap. With ``raw`` each of those is turned straight into the value the
+    backend stores (hex text and naive UTC text on SQLite) and the chunk is
+    sent with one ``executemany``; otherwise the rows become model instances
+    for ``bulk_create``. Columns not generated get their field default.
+    """
+
+    def __init__(self, model, alias, fields, chunk_size, raw):
+        self.model = model
+        self.alias = alias
+        self.fields = fields
+        self.chunk_size = chunk_size
+        self.raw = raw
+        self.pending = []
+        self.written = 0
+        connection = connections[alias]
+        meta = model._meta
+        columns = [meta.get_field(name) for name in fields]
+        self.converters = [
+            (i, converter) for i, converter in enumerate(self._converter(field, connection, raw) for field in columns)
+            if converter is not None
+        ]
+        if raw:
+            rest = [field for field in meta.concrete_fields if field not in columns]
+            now = timezone.now()
+            self.defaults = tuple(
+                field.get_db_prep_save(
+                    now if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+                    else field.get_default(),
+                    connection,
+                )
+                for field in rest
+            )
+            quote = connection.ops.quote_name
+            self.sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                quote(meta.db_table),
+                ', '.join(quote(field.column) for field in columns + rest),
+                ', '.join(['%s'] * (len(columns) + len(rest))),
+            )
+
+    @staticmethod
+    def _converter(field, connection, raw):
+        if _is_uuid(field):
+            if raw and not connection.features.has_native_uuid_field:
+                return lambda bits: None if bits is None else '%032x' % bits
+            return lambda bits: None if bits is None else uuid.UUID(int=bits)
+        internal_type = field.get_internal_type()
+        if internal_type == 'DateTimeField':
+            if raw and connection.vendor == 'sqlite':
+                return functools.lru_cache(maxsize=4)(lambda seconds: str(_NAIVE_EPOCH + timedelta(seconds=seconds)))
+            return lambda seconds: _EPOCH + timedelta(seconds=seconds)
+        if internal_type == 'DateField' and raw:
+            return connection.ops.adapt_datefield_value
+        return None
+
+    def add(self, row):
+        self.pending.append(row)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def _converted(self, rows):
+        converters = self.converters
+        for row in rows:
+            row = list(row)
+            for i, convert in converters:
+                row[i] = convert(row[i])
+            yield row
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        with transaction.atomic(using=self.alias):
+            if self.raw:
+                defaults = self.defaults
+                values = [row + list(defaults) for row in self._converted(rows)] if defaults else list(self._converted(rows))
+                with connections[self.alias].cursor() as cursor:
+                    cursor.executemany(self.sql, values)
+            else:
+                self.model.objects.using(self.alias).bulk_create(
+                    [self.model(**dict(zip(self.fields, row))) for row in self._converted(rows)],
+                    batch_size=self.chunk_size,
+                )
+        self.written += len(rows)
+
+
+_INDEX_DEFINITIONS = {
+    # Secondary (non-unique) indexes with the statement recreating them.
+    'sqlite': "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s "
+              "AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%%'",
+    'postgresql': "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s "
+                  "AND indexdef NOT LIKE 'CREATE UNIQUE%%'",
+}
+
+
+@contextmanager
+def deferred_indexes(models, alias):
+    """Drop the secondary indexes of ``models`` on ``alias`` and rebuild them on exit.
+
+    Building an index once over the loaded rows is much cheaper than
+    updating it row by row, especially for indexes led by random UUIDs.
+    Only SQLite and PostgreSQL are handled; elsewhere this does nothing.
+    """
+    connection = connections[alias]
+    query = _INDEX_DEFINITIONS.get(connection.vendor)
+    dropped = []
+    if query is not None:
+        with connection.cursor() as cursor:
+            for model in models:
+                cursor.execute(query, [model._meta.db_table])
+                for name, definition in cursor.fetchall():
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                    dropped.append(definition)
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for definition in dropped:
+                cursor.execute(definition)
+
+
+class DatasetGenerator:
+    """Generate and write a dataset; ``run()`` returns ``{table: (rows, seconds)}``."""
+
+    BORROWING_FIELDS = ('id', 'user_id', 'book_id', 'branch_id', 'borrow_date', 'return_date', 'returned',
+                        'created_at', 'updated_at')
+    RESERVATION_FIELDS = ('id', 'user_id', 'book_id', 'branch_id', 'active', 'created_at', 'updated_at')
+
+    def __init__(
+        self, *, seed=0, authors=100, books=1000, users=500, borrowings=10000, open_ratio=0.02, overdue_ratio=0.2,
+        mean_queue=0.5, max_queue=20, zipf=1.1, history_days=730, branches=(), chunk_size=5000, raw=False,
+        label='dataset', password=None, now=None, progress=None,
+    ):
+        self.seed = seed
+        self.counts = {'authors': authors, 'books': books, 'users': users, 'borrowings': borrowings}
+        self.open_ratio = open_ratio
+        self.overdue_ratio = overdue_ratio
+        self.mean_queue = mean_queue
+        self.max_queue = max_queue
+        self.zipf = zipf
+        self.history_days = history_days
+        self.branch_codes = list(branches)
+        self.chunk_size = chunk_size
+        self.raw = raw
+        self.label = label
+        self.password = password
+        self.now = int((now or timezone.now()).timestamp())
+        self.progress = progress or (lambda message: None)
+        self.stats = {}
+
+    def run(self):
+        with ExitStack() as stack:
+            stack.enter_context(transaction.atomic())
+            self.prepare()
+            for alias in self.circulation_aliases:
+                if alias != 'default':
+                    stack.enter_context(transaction.atomic(using=alias))
+            self.write_authors()
+            self.write_users()
+            self._write_circulation_and_books()
+        return self.stats
+
+    def _write_circulation_and_books(self):
+        with ExitStack() as stack:
+            if self.raw:
+                started = time.perf_counter()
+                stack.callback(
+                    lambda: self.progress(f'circulation loaded and indexed in {time.perf_counter() - started:.1f}s')
+                )
+                for alias in self.circulation_aliases:
+                    stack.enter_context(deferred_indexes([Borrowing, Reservation], alias))
+            self.write_circulation()
+        self.write_books()
+
+    def _timed(self, table, written, started):
+        elapsed = time.perf_counter() - started
+        self.stats[table] = (written, elapsed)
+        self.progress(f'{table}: {written} rows in {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f} rows/s)')
+
+    def prepare(self):
+        for code in self.branch_codes:
+            Branch.objects.get_or_create(code=code, defaults={'name': code.replace('-', ' ').title()})
+        self.branches = self.branch_codes or list(Branch.objects.order_by('code').values_list('code', flat=True))
+        self.circulation_aliases = sorted({routers.alias_for_branch(branch) for branch in self.branches or [None]})
+
+        ids = self._id_stream('ids')
+        self.author_ids = [ids.getrandbits(128) for _ in range(self.counts['authors'])]
+        self.book_ids = [ids.getrandbits(128) for _ in range(self.counts['books'])]
+
+        rng = _stream(self.seed, 'popularity')
+        self.book_by_rank = _ranked(self.counts['books'], rng)
+        self.book_weights = _zipf_cum_weights(self.counts['books'], self.zipf)
+        self.author_by_rank = _ranked(self.counts['authors'], rng)
+        self.author_weights = _zipf_cum_weights(self.counts['authors'], AUTHOR_EXPONENT)
+        self.book_branch = (
+            array('H', (rng.randrange(len(self.branches)) for _ in range(self.counts['books'])))
+            if self.branches else None
+        )
+        self.trending = array('d', bytes(8 * self.counts['books']))
+        self.borrowed = set()
+        self.landmark = trending._clock().landmark.timestamp()
+        self.half_life = trending.half_life().total_seconds()
+
+    def _id_stream(self, name):
+        # Ids depend on the label too, so a second dataset does not collide with the first.
+        return _stream(self.seed, f'{self.label}:{name}')
+
+    def branch_of(self, book):
+        return self.branches[self.book_branch[book]] if self.book_branch is not None else None
+
+    def write_authors(self):
+        started = time.perf_counter()
+        rng = _stream(self.seed, 'authors')
+        writer = _Writer(Author, 'default', ('id', 'name', 'nationality', 'birth_date'), self.chunk_size, self.raw)
+        for bits in self.author_ids:
+            writer.add((
+                bits,
+                _words(rng, 2).title(),
+                rng.choice(['Brasileira', 'Portuguesa', 'Argentina', 'Inglesa', 'Francesa']),
+                date(1900, 1, 1) + timedelta(days=rng.randrange(36500)),
+            ))
+        writer.flush()
+        self._timed('authors', writer.written, started)
+
+    def write_users(self):
+        started = time.perf_counter()
+        User = get_user_model()
+        password = make_password(self.password, salt=f'{self.label}{self.seed}') if self.password else '!'
+        now = self.now
+        writer = _Writer(
+            User, 'default', ('username', 'email', 'full_name', 'password', 'is_active', 'date_joined'),
+            self.chunk_size, raw=False,
+        )
+        rng = _stream(self.seed, 'users')
+        for i in range(self.counts['users']):
+            username = f'{self.label}-{i:08d}'
+            writer.add((username, f'{username}@example.com', _words(rng, 2).title(), password, True, now))
+        writer.flush()
+        self.user_ids = list(
+            User.objects.filter(username__startswith=f'{self.label}-').order_by('username').values_list('pk', flat=True)
+        )
+        rng = _stream(self.seed, 'activity')
+        self.user_by_rank = [self.user_ids[i] for i in _ranked(len(self.user_ids), rng)]
+        self.user_weights = _zipf_cum_weights(len(self.user_ids), PATRON_EXPONENT)
+        self._timed('users', writer.written, started)
+
+    def _record_event(self, book, timestamp, weight):
+        self.trending[book] += weight * 2 ** ((timestamp - self.landmark) / self.half_life)
+
+    def write_circulation(self):
+        started = time.perf_counter()
+        writers = {}
+
+        def writer(model, fields, alias):
+            if (model, alias) not in writers:
+                writers[model, alias] = _Writer(model, alias, fields, self.chunk_size, self.raw)
+            return writers[model, alias]
+
+        loan_writers = {
+            branch: writer(Borrowing, self.BORROWING_FIELDS, routers.alias_for_branch(branch))
+            for branch in self.branches or [None]
+        }
+        total = self.counts['borrowings']
+        open_count = min(int(total * self.open_ratio), self.counts['books'])
+        rng = _stream(self.seed, 'loans')
+        ids = self._id_stream('loan-ids')
+        history_start = self.now - self.history_days * _DAY
+        span = (self.history_days - LOAN_DAYS) * _DAY
+        for offset in range(0, total - open_count, self.chunk_size):
+            size = min(self.chunk_size, total - open_count - offset)
+            books = rng.choices(self.book_by_rank, cum_weights=self.book_weights, k=size)
+            users = rng.choices(self.user_by_rank, cum_weights=self.user_weights, k=size)
+            for book, user in zip(books, users):
+                borrowed_at = history_start + int(rng.random() * span)
+                branch = self.branch_of(book)
+                self._record_event(book, borrowed_at, trending.BORROW_WEIGHT)
+                loan_writers[branch].add(self._loan_row(ids, user, book, branch, borrowed_at, returned=True))
+            if (offset // self.chunk_size) % 100 == 99:
+                self.progress(f'borrowings: {offset + size}/{total}')
+
+        queue_rng = _stream(self.seed, 'queues')
+        reservation_ids = self._id_stream('reservation-ids')
+        reservations = 0
+        for book in self._open_loan_titles(open_count):
+            user = rng.choices(self.user_by_rank, cum_weights=self.user_weights)[0]
+            if rng.random() < self.overdue_ratio:
+                borrowed_at = self.now - LOAN_DAYS * _DAY - rng.randint(1, 30 * _DAY)
+            else:
+                borrowed_at = self.now - rng.randint(1, LOAN_DAYS * _DAY - 1)
+            branch = self.branch_of(book)
+            self.borrowed.add(book)
+            self._record_event(book, borrowed_at, trending.BORROW_WEIGHT)
+            loan_writers[branch].add(self._loan_row(ids, user, book, branch, borrowed_at, returned=False))
+            queue = writer(Reservation, self.RESERVATION_FIELDS, routers.alias_for_branch(branch))
+            for user_id, created in self._queue(queue_rng, user, borrowed_at):
+                self._record_event(book, created, trending.RESERVE_WEIGHT)
+                queue.add((reservation_ids.getrandbits(128), user_id, self.book_ids[book], branch, True, created, created))
+                reservations += 1
+
+        for item in writers.values():
+            item.flush()
+        self.loan_count = total - open_count + len(self.borrowed)
+        self.reservation_count = reservations
+        self._timed('borrowings and reservations', self.loan_count + reservations, started)
+
+    def _open_loan_titles(self, count):
+        """``count`` distinct titles, drawn by popularity without replacement."""
+        if count <= 0:
+            return []
+        rng = _stream(self.seed, 'open-loans')
+        keys = (
+            (math.log(1.0 - rng.random()) * rank ** self.zipf, book)
+            for rank, book in enumerate(self.book_by_rank, start=1)
+        )
+        return [book for _, book in heapq.nlargest(count, keys)]
+
+    def _queue(self, rng, holder, since):
+        if self.mean_queue <= 0:
+            return []
+        p = 1 / (1 + self.mean_queue)
+        length = min(self.max_queue, int(math.log(1.0 - rng.random()) / math.log(1 - p)))
+        waiting = []
+        for _ in range(length * 3):
+            if len(waiting) == length:
+                break
+            user = rng.choices(self.user_by_rank, cum_weights=self.user_weights)[0]
+            if user != holder and user not in waiting:
+                waiting.append(user)
+        times = sorted(rng.randint(since, self.now) for _ in waiting)
+        return list(zip(waiting, times))
+
+    def _loan_row(self, ids, user, book, branch, borrowed_at, returned):
+        return (
+            ids.getrandbits(128), user, self.book_ids[book], branch, borrowed_at, borrowed_at + LOAN_DAYS * _DAY,
+            returned, borrowed_at, borrowed_at,
+        )
+
+    def write_books(self):
+        started = time.perf_counter()
+        rng = _stream(self.seed, 'books')
+        first_number = Book.objects.count()
+        writer = _Writer(
+            Book, 'default',
+            ('id', 'title', 'author_id', 'category', 'language', 'publication_date', 'ISBN', 'isbn13', 'page_count',
+             'status', 'branch_id', 'trending_score'),
+            self.chunk_size, self.raw,
+        )
+        authors = rng.choices(self.author_by_rank, cum_weights=self.author_weights, k=self.counts['books'])
+        for book, bits in enumerate(self.book_ids):
+            isbn13 = _isbn13(first_number + book)
+            writer.add((
+                bits,
+                _words(rng, rng.randint(1, 5)).capitalize(),
+                self.author_ids[authors[book]],
+                rng.choice(CATEGORIES),
+                rng.choice(LANGUAGES),
+                date(1950, 1, 1) + timedelta(days=rng.randrange(27000)),
+                isbn13,
+                isbn13,
+                rng.randint(60, 900),
+                Book.STATUS_BORROWED if book in self.borrowed else Book.STATUS_AVAILABLE,
+                self.branch_of(book),
+                self.trending[book],
+            ))
+        writer.flush()
+        self._timed('books', writer.written, started)
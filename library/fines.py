@@ -0,0 +1,194 @@
+"""Overdue fines.
+
+A loan is charged ``LIBRARY_FINE_DAILY_RATE`` per day late, up to
+``LIBRARY_FINE_CAP`` per loan. ``accrue()`` (the daily ``accrue_fines``
+command) charges every overdue loan at once: one SELECT per chunk computes
+each loan's fine as of the day with a ``CASE`` on its due date and the
+amount already charged, the difference is inserted into ``FineLedger`` with
+``bulk_create`` and added to the patrons' ``PatronBalance`` with one UPDATE.
+The chunk's loans are locked first, skipping those a return is settling, so
+the daily run and a return never charge the same loan for the same day.
+A missed day is caught up by the next run, since the fine is recomputed from
+the due date rather than incremented.
+
+Returning a loan settles it: ``settle()`` charges whatever is due up to the
+day of return and closes the loan's ledger entries. Balance lookups read
+``PatronBalance`` and never sum the ledger.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Case, DecimalField, Exists, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import routers
+from .models import Borrowing, FineLedger, PatronBalance
+
+DEFAULT_DAILY_RATE = Decimal('0.50')
+DEFAULT_CAP = Decimal('10.00')
+
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+_CENT = Decimal('0.01')
+
+
+def daily_rate():
+    return Decimal(str(getattr(settings, 'LIBRARY_FINE_DAILY_RATE', DEFAULT_DAILY_RATE)))
+
+
+def fine_cap():
+    return Decimal(str(getattr(settings, 'LIBRARY_FINE_CAP', DEFAULT_CAP)))
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def fine_on(day):
+    """Expression for a loan's total fine as of ``day``: days late × rate, capped.
+
+    Days late count whole local days from the due date, so the expression
+    is a ``CASE`` over the due-date boundaries of the days before the cap is
+    reached. Only valid for loans due before ``day``.
+    """
+    rate, cap = daily_rate(), fine_cap()
+    capped_after = math.ceil(cap / rate)
+    return Case(
+        *[
+            When(return_date__gte=_day_start(day - timedelta(days=days)), then=Value(min(days * rate, cap)))
+            for days in range(1, capped_after)
+        ],
+        default=Value(cap),
+        output_field=_MONEY,
+    )
+
+
+def _charged():
+    return Coalesce(
+        Subquery(
+            FineLedger.objects.filter(borrowing_id=OuterRef('pk'))
+            .order_by()
+            .values('borrowing_id')
+            .annotate(total=Sum('amount'))
+            .values('total')
+        ),
+        Value(Decimal('0')),
+        output_field=_MONEY,
+    )
+
+
+def accrue(day=None, chunk_size=5000):
+    """Charge every open overdue loan its fine as of ``day`` (default: today).
+
+    Running it again for the same day charges nothing new. Returns
+    ``(entries, total)``: ledger rows written and the amount they add up to.
+    """
+    day = day or timezone.localdate()
+    if daily_rate() <= 0:
+        return 0, Decimal('0')
+    entries = 0
+    total = Decimal('0')
+    for alias in routers.circulation_aliases():
+        with routers.use_database(alias):
+            counts = _accrue(Borrowing.objects.filter(returned=False), day, chunk_size)
+        entries += counts[0]
+        total += counts[1]
+    return entries, total.quantize(_CENT)
+
+
+def _accrue(loans, day, chunk_size):
+    pending = (
+        loans.filter(return_date__lt=_day_start(day))
+        .filter(~Exists(FineLedger.objects.filter(borrowing_id=OuterRef('pk'), accrued_on=day)))
+        .annotate(fine=fine_on(day), charged=_charged())
+        .order_by('pk')
+        .values_list('pk', 'user_id', 'branch_id', 'fine', 'charged')
+    )
+    entries = 0
+    total = Decimal('0')
+    last_pk = None
+    while True:
+        chunk = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        ledger = [
+            FineLedger(borrowing_id=pk, user_id=user_id, branch_id=branch_id, accrued_on=day, amount=(fine - charged).quantize(_CENT))
+            for pk, user_id, branch_id, fine, charged in rows
+            if fine > charged
+        ]
+        if not ledger:
+            continue
+        with routers.atomic():
+            ledger = _claim(ledger, day)
+            if not ledger:
+                continue
+            FineLedger.objects.bulk_create(ledger)
+            _add_to_balances(ledger)
+        entries += len(ledger)
+        total += sum(entry.amount for entry in ledger)
+    return entries, total
+
+
+def _claim(entries, day):
+    """The ``entries`` whose loans this transaction could lock and that are still uncharged for ``day``.
+
+    A loan being returned is locked by its return, which settles it; it is
+    skipped here rather than waited for. A loan settled between the chunk's
+    SELECT and the lock already has its entry for the day and is dropped.
+    Skipped loans are caught up by the next run.
+    """
+    locked = set(
+        Borrowing.objects.select_for_update(skip_locked=True)
+        .filter(pk__in=[entry.borrowing_id for entry in entries])
+        .values_list('pk', flat=True)
+    )
+    charged = set(
+        FineLedger.objects.filter(borrowing_id__in=locked, accrued_on=day).values_list('borrowing_id', flat=True)
+    )
+    return [entry for entry in entries if entry.borrowing_id in locked and entry.borrowing_id not in charged]
+
+
+def _add_to_balances(entries):
+    """Add the amounts of ``entries`` to their patrons' balances with one UPDATE."""
+    added = defaultdict(Decimal)
+    for entry in entries:
+        added[entry.user_id] += entry.amount
+    PatronBalance.objects.bulk_create([PatronBalance(user_id=user_id) for user_id in added], ignore_conflicts=True)
+    PatronBalance.objects.filter(user_id__in=list(added)).update(
+        balance=F('balance') + Case(
+            *[When(user_id=user_id, then=Value(amount)) for user_id, amount in added.items()],
+            output_field=_MONEY,
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def settle(borrowing_pks, day=None):
+    """Charge returned loans what they owe up to ``day`` and close their entries.
+
+    Called by the borrowing service inside the transaction that marks the
+    loans returned, on the database pinned for them.
+    """
+    day = day or timezone.localdate()
+    borrowing_pks = list(borrowing_pks)
+    if daily_rate() > 0:
+        _accrue(Borrowing.objects.filter(pk__in=borrowing_pks), day, len(borrowing_pks) or 1)
+    FineLedger.objects.filter(borrowing_id__in=borrowing_pks, closed=False).update(closed=True)
+
+
+def balance(user):
+    """Outstanding fines of ``user`` across all circulation databases."""
+    user_id = getattr(user, 'pk', user)
+    return sum(
+        (
+            PatronBalance.objects.using(alias).filter(user_id=user_id).values_list('balance', flat=True).first()
+            or Decimal('0')
+            for alias in routers.circulation_aliases()
+        ),
+        Decimal('0'),
+    ).quantize(_CENT)
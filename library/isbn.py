@@ -0,0 +1,91 @@
+"""ISBN normalization.
+
+``Book.ISBN`` keeps whatever form a title was catalogued with (ISBN-10 or
+ISBN-13, with or without hyphens, or a local code). ``Book.isbn13`` holds the
+canonical 13-digit form of real ISBNs so scanned barcodes resolve with one
+equality lookup.
+"""
+import re
+
+_SEPARATORS = re.compile(r'[\s\-‐‑–—.]+')
+_ISBN10 = re.compile(r'^\d{9}[\dX]$')
+_ISBN13 = re.compile(r'^97[89]\d{10}$')
+
+
+class InvalidISBN(ValueError):
+    pass
+
+
+def _isbn13_check_digit(first12):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def _isbn10_check_digit(first9):
+    total = sum(int(digit) * (10 - i) for i, digit in enumerate(first9))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def to_isbn13(value):
+    """Canonical ISBN-13 of ``value``, or ``None`` if it is not shaped like an ISBN.
+
+    Accepts ISBN-10 and ISBN-13 with any hyphens or spaces, an ``ISBN``
+    prefix and a lower-case ``x`` check digit. Raises ``InvalidISBN`` when
+    the value is shaped like an ISBN but its check digit is wrong.
+    """
+    compact = _SEPARATORS.sub('', str(value or '')).upper()
+    if compact.startswith('ISBN'):
+        compact = compact[4:].lstrip(':')
+    if _ISBN13.match(compact):
+        if compact[-1] != _isbn13_check_digit(compact[:12]):
+            raise InvalidISBN(f'{value!r} has an invalid ISBN-13 check digit')
+        return compact
+    if _ISBN10.match(compact):
+        if compact[-1] != _isbn10_check_digit(compact[:9]):
+            raise InvalidISBN(f'{value!r} has an invalid ISBN-10 check digit')
+        first12 = '978' + compact[:9]
+        return first12 + _isbn13_check_digit(first12)
+    return None
+
+
+def backfill_isbn13(model, chunk_size=1000, stdout=None):
+    """Fill ``isbn13`` for rows saved before it existed, ``chunk_size`` rows at a time.
+
+    Walks the rows still without ``isbn13`` in primary key order, so each
+    chunk is one indexed range read plus one bulk UPDATE and an interrupted
+    run can simply be restarted. Rows whose ISBN is not an ISBN, has a bad
+    check digit or duplicates another title's ISBN are left empty and
+    counted. ``model`` is passed in so migrations can use their historical
+    model. Returns ``(filled, skipped)``.
+    """
+    pending = model._default_manager.filter(isbn13__isnull=True).order_by('pk')
+    filled = skipped = 0
+    last_pk = None
+    while True:
+        chunk = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+        rows = list(chunk.only('pk', 'ISBN')[:chunk_size])
+        if not rows:
+            break
+        last_pk = rows[-1].pk
+
+        canonical = {}
+        for row in rows:
+            try:
+                row.isbn13 = to_isbn13(row.ISBN)
+            except InvalidISBN:
+                row.isbn13 = None
+            if row.isbn13 is None or row.isbn13 in canonical:
+                skipped += 1
+                continue
+            canonical[row.isbn13] = row
+        taken = set(
+            model._default_manager.filter(isbn13__in=list(canonical)).values_list('isbn13', flat=True)
+        )
+        updates = [row for isbn13, row in canonical.items() if isbn13 not in taken]
+        skipped += len(canonical) - len(updates)
+        model._default_manager.bulk_update(updates, ['isbn13'])
+        filled += len(updates)
+        if stdout is not None:
+            stdout.write(f'isbn13 backfill: filled={filled} skipped={skipped} last_pk={last_pk}\n')
+    return filled, skipped
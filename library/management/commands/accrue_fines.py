@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from library import fines
+
+
+class Command(BaseCommand):
+    help = 'Charge overdue fines on open loans (run daily; rerunning for the same day charges nothing).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', default=None, help='day to accrue for, YYYY-MM-DD (default: today)')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            day = parse_date(options['date'])
+            if day is None:
+                raise CommandError(f"Invalid --date: {options['date']}")
+        entries, total = fines.accrue(day, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Charged {total} in fines over {entries} borrowings'))
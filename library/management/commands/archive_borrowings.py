@@ -0,0 +1,65 @@
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from library import routers
+from library.models import ArchivedBorrowing, Borrowing
+
+
+class Command(BaseCommand):
+    help = 'Move returned loans due more than N days ago into the borrowing archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=365)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        total = 0
+        for alias in routers.circulation_aliases():
+            total += self.archive(alias, routers.archive_alias(alias), cutoff, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} returned borrowings'))
+
+    def archive(self, alias, target, cutoff, chunk_size):
+        """Copy one chunk at a time to ``target`` and delete it from ``alias``.
+
+        Chunks are selected through the returned/return_date index. The copy
+        ignores rows already archived, so a run interrupted between the two
+        commits is completed by the next run.
+        """
+        returned = Borrowing.objects.using(alias).filter(returned=True, return_date__lt=cutoff).order_by()
+        total = 0
+        while True:
+            with ExitStack() as stack:
+                stack.enter_context(transaction.atomic(using=alias))
+                if target != alias:
+                    stack.enter_context(transaction.atomic(using=target))
+                batch = list(
+                    returned.values(
+                        'id', 'user_id', 'book_id', 'copy_id', 'branch_id', 'borrow_date', 'return_date', 'updated_at',
+                    )[:chunk_size]
+                )
+                if not batch:
+                    break
+                ArchivedBorrowing.objects.using(target).bulk_create(
+                    [
+                        ArchivedBorrowing(
+                            id=row['id'],
+                            user_id=row['user_id'],
+                            book_id=row['book_id'],
+                            copy_id=row['copy_id'],
+                            branch_id=row['branch_id'],
+                            borrow_date=row['borrow_date'],
+                            return_date=row['return_date'],
+                            closed_at=row['updated_at'],
+                        )
+                        for row in batch
+                    ],
+                    ignore_conflicts=True,
+                )
+                Borrowing.objects.using(alias).filter(pk__in=[row['id'] for row in batch]).delete()
+            total += len(batch)
+        return total
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from library import services
+
+
+class Command(BaseCommand):
+    help = 'Renew open loans due soon whose titles nobody else has reserved (run nightly).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--within-days', type=int, default=2, help='renew loans due within this many days')
+        parser.add_argument('--extra-days', type=int, default=7, help='days added to each renewed loan')
+
+    def handle(self, *args, **options):
+        renewed = services.get_borrowing_service().auto_renew(
+            within_days=options['within_days'], extra_days=options['extra_days'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Renewed {renewed} borrowings'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from library.isbn import backfill_isbn13
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Fill Book.isbn13 for titles catalogued before it existed, in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        stdout = self.stdout if options['verbosity'] > 1 else None
+        filled, skipped = backfill_isbn13(Book, chunk_size=options['chunk_size'], stdout=stdout)
+        self.stdout.write(self.style.SUCCESS(f'Filled isbn13 for {filled} books; skipped {skipped} without a valid or with a duplicate ISBN'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from library import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "patrons who borrowed this also borrowed" index from the full loan history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=None, help='Neighbours kept per title.')
+        parser.add_argument('--max-books-per-user', type=int, default=recommendations.MAX_BOOKS_PER_USER)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        written = recommendations.build_index(
+            k=options['top_k'],
+            max_books_per_user=options['max_books_per_user'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} neighbour pairs'))
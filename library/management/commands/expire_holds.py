@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from library import services
+
+
+class Command(BaseCommand):
+    help = 'Expire hold-shelf reservations past their pickup deadline and advance the queues.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='holds expired per transaction')
+
+    def handle(self, *args, **options):
+        service = services.get_borrowing_service()
+        total_expired = total_promoted = 0
+        while True:
+            expired, promoted = service.expire_holds(limit=options['chunk_size'])
+            if not expired:
+                break
+            total_expired += expired
+            total_promoted += promoted
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {total_expired} holds; {total_promoted} reservations moved to the hold shelf'
+        ))
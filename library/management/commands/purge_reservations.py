@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from library import routers
+from library.models import ArchivedReservation, Reservation
+
+
+class Command(BaseCommand):
+    help = 'Move closed reservations older than N days into the reservation archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=30)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        total = 0
+        for alias in routers.circulation_aliases():
+            total += self.archive(alias, cutoff, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} closed reservations'))
+
+    def archive(self, alias, cutoff, chunk_size):
+        """Archive closed reservations of one circulation database next to them."""
+        closed = Reservation.objects.using(alias).filter(active=False, updated_at__lt=cutoff).order_by()
+        total = 0
+        while True:
+            with transaction.atomic(using=alias):
+                batch = list(
+                    closed.values('id', 'user_id', 'book_id', 'branch_id', 'created_at', 'updated_at', 'expired')[:chunk_size]
+                )
+                if not batch:
+                    break
+                ArchivedReservation.objects.using(alias).bulk_create(
+                    [
+                        ArchivedReservation(
+                            id=row['id'],
+                            user_id=row['user_id'],
+                            book_id=row['book_id'],
+                            branch_id=row['branch_id'],
+                            created_at=row['created_at'],
+                            closed_at=row['updated_at'],
+                            expired=row['expired'],
+                        )
+                        for row in batch
+                    ],
+                    ignore_conflicts=True,
+                )
+                Reservation.objects.using(alias).filter(pk__in=[row['id'] for row in batch]).delete()
+            total += len(batch)
+        return total
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from library import trending
+
+
+class Command(BaseCommand):
+    help = 'Move the trending landmark to now so that stored trending scores stay small. Run daily.'
+
+    def handle(self, *args, **options):
+        factor = trending.rescale()
+        self.stdout.write(self.style.SUCCESS(f'Rescaled trending scores by 1/{factor:.4g}'))
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_reservation_hold_shelf'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='status',
+            field=models.CharField(choices=[('available', 'Available'), ('borrowed', 'Borrowed'), ('reserved', 'Reserved')], db_index=True, default='available', max_length=20),
+        ),
+    ]
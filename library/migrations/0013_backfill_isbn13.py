@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from library.isbn import backfill_isbn13
+
+
+def backfill(apps, schema_editor):
+    backfill_isbn13(apps.get_model('library', 'Book'))
+
+
+class Migration(migrations.Migration):
+    # Each chunk commits on its own; an interrupted backfill is finished by
+    # `manage.py backfill_isbn13`.
+    atomic = False
+
+    dependencies = [
+        ('library', '0012_book_isbn13'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
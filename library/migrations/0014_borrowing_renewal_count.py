@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_backfill_isbn13'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowing',
+            name='renewal_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
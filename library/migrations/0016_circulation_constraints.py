@@ -0,0 +1,55 @@
+import django.db.models.deletion
+import library.models
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0015_fines'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='borrowing',
+            name='book',
+            field=library.models.CirculationForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='borrowings', to='library.book'),
+        ),
+        migrations.AlterField(
+            model_name='borrowing',
+            name='branch',
+            field=library.models.CirculationForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='library.branch'),
+        ),
+        migrations.AlterField(
+            model_name='borrowing',
+            name='copy',
+            field=library.models.CirculationForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='borrowings', to='library.bookcopy'),
+        ),
+        migrations.AlterField(
+            model_name='borrowing',
+            name='user',
+            field=library.models.CirculationForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='borrowings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='book',
+            field=library.models.CirculationForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='library.book'),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='branch',
+            field=library.models.CirculationForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='library.branch'),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='held_copy',
+            field=library.models.CirculationForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='library.bookcopy'),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='user',
+            field=library.models.CirculationForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,9 +1,13 @@
 import uuid
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
 from core.models import TimestampedModel
 
+from . import isbn, routers
+
 
 class Author(models.Model):
 	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -16,6 +20,30 @@ class Author(models.Model):
 		return self.name
 
 
+class Branch(models.Model):
+	"""A library branch. Its circulation rows may live in their own database."""
+
+	code = models.SlugField(max_length=32, primary_key=True)
+	name = models.CharField(max_length=255)
+
+	def __str__(self):
+		return self.name
+
+
+class BookQuerySet(models.QuerySet):
+	def with_available_copies(self):
+		available = (
+			BookCopy.objects.filter(book=models.OuterRef('pk'), status=BookCopy.STATUS_AVAILABLE)
+			.order_by()
+			.values('book')
+			.annotate(total=models.Count('pk'))
+			.values('total')
+		)
+		return self.annotate(
+			available_copies=Coalesce(models.Subquery(available), 0)
+		)
+
+
 class Book(TimestampedModel):
 	STATUS_AVAILABLE = 'available'
 	STATUS_BORROWED = 'borrowed'
@@ -36,26 +64,190 @@ class Book(TimestampedModel):
 	publisher = models.CharField(max_length=255, blank=True)
 	publication_date = models.DateField(null=True, blank=True)
 	ISBN = models.CharField(max_length=32, unique=True)
+	# Canonical ISBN-13 of ``ISBN`` (None for local codes and legacy invalid or
+	# duplicate ISBNs), set when ``ISBN`` is saved.
+	isbn13 = models.CharField(max_length=13, unique=True, null=True, blank=True, editable=False)
 	page_count = models.PositiveIntegerField(null=True, blank=True)
 	last_edition = models.DateField(null=True, blank=True)
 	language = models.CharField(max_length=50, blank=True)
 	cover_url = models.URLField(blank=True)
-	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_AVAILABLE)
+	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_AVAILABLE, db_index=True)
+	branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='books')
+	# Exponentially decayed borrow/reservation count, kept by library.trending.
+	trending_score = models.FloatField(default=0, editable=False)
+
+	objects = BookQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['branch', 'status'], name='library_book_branch_status_idx'),
+			models.Index(fields=['-trending_score', 'id'], name='library_book_trending_idx'),
+			models.Index(fields=['category', '-trending_score', 'id'], name='library_book_cat_trending_idx'),
+			models.Index(fields=['updated_at'], name='library_book_updated_idx'),
+		]
 
 	def __str__(self):
 		return self.title
 
+	def clean(self):
+		super().clean()
+		try:
+			isbn.to_isbn13(self.ISBN)
+		except isbn.InvalidISBN as exc:
+			raise ValidationError({'ISBN': str(exc)})
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		book = super().from_db(db, field_names, values)
+		book._loaded_isbn = book.__dict__.get('ISBN')
+		return book
+
+	def _canonical_isbn13(self):
+		"""``isbn13`` for the current ``ISBN``, or None when it is invalid or taken.
+
+		Validation belongs to ``clean()`` and the API; legacy rows with a bad
+		check digit or a duplicate ISBN are saved without a canonical form,
+		as ``backfill_isbn13`` leaves them.
+		"""
+		try:
+			isbn13 = isbn.to_isbn13(self.ISBN)
+		except isbn.InvalidISBN:
+			return None
+		if isbn13 is not None and Book.objects.filter(isbn13=isbn13).exclude(pk=self.pk).exists():
+			return None
+		return isbn13
+
+	def save(self, *args, **kwargs):
+		update_fields = kwargs.get('update_fields')
+		if update_fields is None or 'ISBN' in update_fields:
+			# Only a changed ISBN is canonicalized again, so saving other fields
+			# never trips over a legacy row's ISBN.
+			if self._state.adding or self.ISBN != getattr(self, '_loaded_isbn', None):
+				self.isbn13 = self._canonical_isbn13()
+				if update_fields is not None:
+					kwargs['update_fields'] = {*update_fields, 'isbn13'}
+		super().save(*args, **kwargs)
+		self._loaded_isbn = self.ISBN
+
+
+class TrendingClock(models.Model):
+	"""Landmark time of the stored trending scores (a single row).
+
+	Scores are kept relative to ``landmark`` so that decay never has to be
+	applied on increment; see ``library.trending``.
+	"""
+
+	landmark = models.DateTimeField(default=timezone.now)
+
+	def __str__(self):
+		return f"trending landmark {self.landmark:%Y-%m-%d %H:%M}"
+
+
+class BookNeighbor(models.Model):
+	"""A title often borrowed by the patrons who borrowed ``book``.
+
+	Only the top neighbours of each book are kept; ``score`` is the number of
+	patrons who borrowed both (see ``library.recommendations``).
+	"""
+
+	book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbors')
+	neighbor = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+	score = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['book', 'neighbor'], name='library_neighbor_unique'),
+		]
+		indexes = [
+			models.Index(fields=['book', '-score'], name='library_neighbor_rank_idx'),
+		]
+
+	def __str__(self):
+		return f"{self.book_id} ~ {self.neighbor_id} ({self.score})"
+
+
+class BookCopy(TimestampedModel):
+	"""A physical item of a ``Book``.
+
+	Titles with copies are circulated per copy; ``Book.status`` then only
+	tracks whether at least one copy is available.
+	"""
+
+	STATUS_AVAILABLE = Book.STATUS_AVAILABLE
+	STATUS_BORROWED = Book.STATUS_BORROWED
+	STATUS_RESERVED = Book.STATUS_RESERVED
+
+	STATUS_CHOICES = Book.STATUS_CHOICES
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='copies')
+	barcode = models.CharField(max_length=64, unique=True)
+	branch = models.CharField(max_length=100, blank=True)
+	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_AVAILABLE)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['book', 'status'], name='library_copy_book_status_idx'),
+		]
+
+	def __str__(self):
+		return f"{self.book} [{self.barcode}]"
+
+
+class CirculationForeignKey(models.ForeignKey):
+	"""Reference from a loan or reservation to the catalog, users or branches.
+
+	The database constraint is created only where the router's
+	``allow_migrate`` allows it, i.e. in ``default``: branch databases hold
+	circulation tables without the tables they point to (see
+	``library.routers``), so migrations applied there leave it out and
+	deletes are carried over by ``routers.delete_from_other_databases``.
+	The field deconstructs to its declared options on every database, so
+	the migration autodetector never sees a difference.
+	"""
+
+	@property
+	def db_constraint(self):
+		return self._db_constraint and routers.catalog_constraints_allowed()
+
+	@db_constraint.setter
+	def db_constraint(self, value):
+		self._db_constraint = value
+
+	def deconstruct(self):
+		name, path, args, kwargs = super().deconstruct()
+		kwargs.pop('db_constraint', None)
+		if not self._db_constraint:
+			kwargs['db_constraint'] = False
+		return name, path, args, kwargs
+
 
 class Borrowing(TimestampedModel):
+	"""A loan. ``branch`` is the branch of the title and decides which
+	database holds the row (see ``library.routers``).
+	"""
+
 	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-	user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='borrowings')
-	book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='borrowings')
+	user = CirculationForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='borrowings')
+	book = CirculationForeignKey(Book, on_delete=models.CASCADE, related_name='borrowings')
+	copy = CirculationForeignKey(
+		BookCopy, on_delete=models.SET_NULL, null=True, blank=True, related_name='borrowings'
+	)
+	branch = CirculationForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
 	borrow_date = models.DateTimeField(default=timezone.now)
 	return_date = models.DateTimeField()
 	returned = models.BooleanField(default=False)
+	last_reminded_at = models.DateTimeField(null=True, blank=True)
+	# Renewals so far, manual or automatic; capped by LIBRARY_MAX_RENEWALS.
+	renewal_count = models.PositiveSmallIntegerField(default=0)
 
 	class Meta:
-		ordering = ['-borrow_date']
+		indexes = [
+			models.Index(fields=['returned', 'return_date'], name='library_borrow_open_due_idx'),
+			models.Index(fields=['user', 'returned', 'return_date'], name='library_borrow_user_open_idx'),
+			models.Index(fields=['branch', 'returned', 'return_date'], name='library_borrow_branch_due_idx'),
+			models.Index(fields=['branch', 'user', 'returned'], name='library_borrow_branch_user_idx'),
+		]
 
 	def clean(self):
 		if self.return_date <= self.borrow_date:
@@ -72,14 +264,153 @@ class Borrowing(TimestampedModel):
 
 
 class Reservation(TimestampedModel):
+	"""A patron's place in a title's queue.
+
+	A reservation is *waiting* while ``pickup_deadline`` is empty and *on the
+	hold shelf* once an item has been set aside for it; an unclaimed hold
+	expires after the deadline.
+	"""
+
 	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-	user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reservations')
-	book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations')
+	user = CirculationForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reservations')
+	book = CirculationForeignKey(Book, on_delete=models.CASCADE, related_name='reservations')
 	active = models.BooleanField(default=True)
+	pickup_deadline = models.DateTimeField(null=True, blank=True)
+	held_copy = CirculationForeignKey(BookCopy, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+	expired = models.BooleanField(default=False)
+	branch = CirculationForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
 
 	class Meta:
 		ordering = ['-created_at']
+		indexes = [
+			models.Index(
+				fields=['book', 'created_at'],
+				condition=models.Q(active=True),
+				name='library_resv_active_queue_idx',
+			),
+			models.Index(
+				fields=['pickup_deadline'],
+				condition=models.Q(active=True),
+				name='library_resv_hold_deadline_idx',
+			),
+			models.Index(
+				fields=['branch', 'book', 'created_at'],
+				condition=models.Q(active=True),
+				name='library_resv_branch_queue_idx',
+			),
+			# Closed reservations by age, for the archiving job (purge_reservations).
+			models.Index(
+				fields=['updated_at'],
+				condition=models.Q(active=False),
+				name='library_resv_closed_age_idx',
+			),
+		]
+
+	@property
+	def on_hold_shelf(self):
+		return self.active and self.pickup_deadline is not None
 
 	def __str__(self):
 		return f"Reservation: {self.user} -> {self.book}"
 
+
+class ArchivedReservation(models.Model):
+	"""Closed reservation moved out of the live ``Reservation`` table."""
+
+	id = models.UUIDField(primary_key=True, editable=False)
+	user = models.ForeignKey(
+		settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+	)
+	book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+	branch = models.ForeignKey(
+		Branch, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False, related_name='+'
+	)
+	created_at = models.DateTimeField()
+	closed_at = models.DateTimeField()
+	expired = models.BooleanField(default=False)
+	archived_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return f"Archived reservation: {self.user_id} -> {self.book_id}"
+
+
+class ArchivedBorrowing(models.Model):
+	"""Returned loan moved out of the live ``Borrowing`` table.
+
+	Stored next to the live rows, or in ``LIBRARY_ARCHIVE_DATABASE`` when
+	that is set (see ``library.routers``).
+	"""
+
+	id = models.UUIDField(primary_key=True, editable=False)
+	user = models.ForeignKey(
+		settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+	)
+	book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+	copy = models.ForeignKey(
+		BookCopy, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False, related_name='+'
+	)
+	branch = models.ForeignKey(
+		Branch, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False, related_name='+'
+	)
+	borrow_date = models.DateTimeField()
+	return_date = models.DateTimeField()
+	closed_at = models.DateTimeField()
+	archived_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['user', 'borrow_date'], name='library_arch_borrow_user_idx'),
+			models.Index(fields=['borrow_date'], name='library_arch_borrow_date_idx'),
+		]
+
+	def __str__(self):
+		return f"Archived borrowing: {self.user_id} -> {self.book_id}"
+
+
+class FineLedger(models.Model):
+	"""Overdue fine charged for a loan on one day (see ``library.fines``).
+
+	Entries are only ever inserted; ``amount`` is what that day's accrual
+	added, so the entries of a loan sum to its fine. Returning the loan
+	closes them.
+	"""
+
+	borrowing = models.ForeignKey(Borrowing, on_delete=models.DO_NOTHING, db_constraint=False, related_name='fines')
+	user = models.ForeignKey(
+		settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+	)
+	branch = models.ForeignKey(
+		Branch, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False, related_name='+'
+	)
+	accrued_on = models.DateField()
+	amount = models.DecimalField(max_digits=10, decimal_places=2)
+	closed = models.BooleanField(default=False)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['borrowing', 'accrued_on'], name='library_fine_loan_day_unique'),
+		]
+		indexes = [
+			models.Index(fields=['user', 'accrued_on'], name='library_fine_user_day_idx'),
+		]
+
+	def __str__(self):
+		return f"Fine {self.amount} on {self.accrued_on}: {self.borrowing_id}"
+
+
+class PatronBalance(models.Model):
+	"""Running total of a patron's fines, kept in step with ``FineLedger``.
+
+	Like the ledger it lives in each circulation database; a patron's
+	balance is the sum of their rows (one primary key lookup per database).
+	"""
+
+	user = models.OneToOneField(
+		settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, primary_key=True, db_constraint=False, related_name='+'
+	)
+	balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"Balance {self.balance}: {self.user_id}"
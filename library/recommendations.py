@@ -0,0 +1,177 @@
+"""Precomputed "patrons who borrowed this also borrowed" index.
+
+``build_index`` scans the whole loan history once, grouped by patron, and
+counts how many patrons borrowed each pair of titles. Only the ``top_k``
+best neighbours of each title are stored in ``BookNeighbor``, so a lookup is
+one read of the (book, score) index. ``record_loan`` applies a new loan to
+the stored pairs between full rebuilds.
+"""
+import heapq
+import logging
+from collections import Counter, defaultdict
+from itertools import combinations, groupby
+from math import isqrt
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from . import routers
+from .models import ArchivedBorrowing, BookNeighbor, Borrowing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 20
+
+# Titles per patron taken into account. Pair counting is quadratic in this
+# number, and very heavy borrowers say little about any single title.
+MAX_BOOKS_PER_USER = 200
+
+
+def top_k():
+    return getattr(settings, 'LIBRARY_RECOMMENDATIONS_TOP_K', DEFAULT_TOP_K)
+
+
+def _history_streams(chunk_size):
+    for alias in routers.circulation_aliases():
+        yield (
+            Borrowing.objects.using(alias).order_by('user_id')
+            .values_list('user_id', 'book_id').iterator(chunk_size=chunk_size)
+        )
+    for alias in routers.archive_aliases():
+        yield (
+            ArchivedBorrowing.objects.using(alias).order_by('user_id')
+            .values_list('user_id', 'book_id').iterator(chunk_size=chunk_size)
+        )
+
+
+def _pair_key(low, high):
+    return high * (high - 1) // 2 + low
+
+
+def _pair_from_key(key):
+    high = (1 + isqrt(8 * key + 1)) // 2
+    return key - high * (high - 1) // 2, high
+
+
+def count_pairs(rows, max_books_per_user=MAX_BOOKS_PER_USER):
+    """Count co-borrowed title pairs from ``(user_id, book_id)`` rows sorted by user.
+
+    Titles are mapped to dense integers and each unordered pair is stored
+    once as a single integer key, which keeps the sparse counter compact.
+    The key does not depend on the number of titles, so each patron's pairs
+    are counted as soon as their rows end and memory stays proportional to
+    the distinct pairs rather than to the whole history. Returns
+    ``(book_ids, counts)``; ``select_top_neighbors`` decodes the keys.
+    """
+    index = {}
+    book_ids = []
+    counts = Counter()
+    for _, user_rows in groupby(rows, key=lambda row: row[0]):
+        books = set()
+        for _, book_id in user_rows:
+            if book_id not in index:
+                index[book_id] = len(book_ids)
+                book_ids.append(book_id)
+            books.add(index[book_id])
+            if len(books) >= max_books_per_user:
+                break
+        if len(books) > 1:
+            counts.update(_pair_key(low, high) for low, high in combinations(sorted(books), 2))
+    return book_ids, counts
+
+
+def select_top_neighbors(book_ids, counts, k):
+    """Return ``{book_id: [(score, neighbor_id), ...]}`` with the ``k`` best neighbours."""
+    heaps = defaultdict(list)
+    for key, score in counts.items():
+        low, high = _pair_from_key(key)
+        for book, neighbor in ((low, high), (high, low)):
+            heap = heaps[book]
+            if len(heap) < k:
+                heapq.heappush(heap, (score, neighbor))
+            elif (score, neighbor) > heap[0]:
+                heapq.heapreplace(heap, (score, neighbor))
+    return {
+        book_ids[book]: [(score, book_ids[neighbor]) for score, neighbor in sorted(heap, reverse=True)]
+        for book, heap in heaps.items()
+    }
+
+
+def build_index(k=None, max_books_per_user=MAX_BOOKS_PER_USER, chunk_size=5000, batch_size=1000):
+    """Rebuild ``BookNeighbor`` from the full loan history. Returns the number of rows written."""
+    k = k or top_k()
+    rows = heapq.merge(*_history_streams(chunk_size), key=lambda row: row[0])
+    book_ids, counts = count_pairs(rows, max_books_per_user)
+    neighbors = select_top_neighbors(book_ids, counts, k)
+    logger.info('Recommendation index: %s titles, %s pairs counted', len(book_ids), len(counts))
+
+    with transaction.atomic():
+        BookNeighbor.objects.all().delete()
+        BookNeighbor.objects.bulk_create(
+            (
+                BookNeighbor(book_id=book_id, neighbor_id=neighbor_id, score=score)
+                for book_id, ranked in neighbors.items()
+                for score, neighbor_id in ranked
+            ),
+            batch_size=batch_size,
+        )
+    return sum(len(ranked) for ranked in neighbors.values())
+
+
+def record_loan(user_id, book_id, loan_id):
+    """Add one new loan to the stored neighbour pairs.
+
+    Pairs with the patron's earlier titles that are already stored are
+    incremented; new pairs are stored only for titles that have fewer than
+    ``top_k`` neighbours. Pairs left out this way are picked up by the next
+    ``build_index``. Earlier titles come from the live and the archived
+    history, as in ``build_index``; a title the patron borrowed before
+    changes nothing.
+    """
+    sources = [Borrowing.objects.using(alias) for alias in routers.circulation_aliases()]
+    sources += [ArchivedBorrowing.objects.using(alias) for alias in routers.archive_aliases()]
+    earlier = set()
+    for queryset in sources:
+        earlier.update(
+            queryset.filter(user_id=user_id).exclude(pk=loan_id)
+            .order_by('-borrow_date').values_list('book_id', flat=True)[:MAX_BOOKS_PER_USER]
+        )
+    if not earlier or book_id in earlier:
+        return
+
+    with transaction.atomic():
+        BookNeighbor.objects.filter(book_id=book_id, neighbor_id__in=earlier).update(score=F('score') + 1)
+        BookNeighbor.objects.filter(book_id__in=earlier, neighbor_id=book_id).update(score=F('score') + 1)
+
+        stored = set(
+            BookNeighbor.objects.filter(book_id=book_id, neighbor_id__in=earlier).values_list('neighbor_id', flat=True)
+        ) | set(
+            BookNeighbor.objects.filter(book_id__in=earlier, neighbor_id=book_id).values_list('book_id', flat=True)
+        )
+        missing = earlier - stored
+        if not missing:
+            return
+        sizes = dict(
+            BookNeighbor.objects.filter(book_id__in=missing | {book_id})
+            .values('book_id').annotate(total=Count('pk')).values_list('book_id', 'total')
+        )
+        k = top_k()
+        room = k - sizes.get(book_id, 0)
+        new_pairs = []
+        for other in missing:
+            if room > 0:
+                new_pairs.append(BookNeighbor(book_id=book_id, neighbor_id=other, score=1))
+                room -= 1
+            if sizes.get(other, 0) < k:
+                new_pairs.append(BookNeighbor(book_id=other, neighbor_id=book_id, score=1))
+        BookNeighbor.objects.bulk_create(new_pairs, ignore_conflicts=True)
+
+
+def neighbors(book_id, limit=10):
+    """The best stored neighbours of ``book_id``: one read of the (book, score) index."""
+    return list(
+        BookNeighbor.objects.filter(book_id=book_id)
+        .select_related('neighbor')
+        .order_by('-score')[:limit]
+    )
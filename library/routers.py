@@ -0,0 +1,373 @@
+"""Placement of circulation rows in per-branch databases.
+
+``LIBRARY_BRANCH_DATABASES`` maps a branch code to the database alias that
+holds that branch's circulation tables (borrowings, reservations, fines). The
+catalog, copies and users always live in ``default``; so do the circulation
+rows of branches that are not listed and of titles without a branch. With
+the setting empty every query goes to ``default``, exactly as without the
+router.
+
+Writes for one branch are routed by pinning its database for the duration
+of a service call (``use_database``); queries that span branches are run on
+every circulation database and merged (``fan_out``).
+
+Archived loans are kept next to the live rows they came from, or all in
+``LIBRARY_ARCHIVE_DATABASE`` when that alias is set.
+
+Foreign keys from loans and reservations to the catalog, users and branches
+are real constraints in ``default`` only. Deleting a book, copy, user or
+branch applies the same ``on_delete`` rules to the rows of the other
+circulation databases (``delete_from_other_databases``).
+"""
+import contextvars
+import functools
+import heapq
+import inspect
+import itertools
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import PROTECT, ProtectedError, SET_NULL
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.db.models import prefetch_related_objects
+
+CIRCULATION_MODELS = frozenset({
+    'borrowing', 'reservation', 'archivedreservation', 'archivedborrowing', 'fineledger', 'patronbalance',
+})
+ARCHIVE_MODELS = frozenset({'archivedborrowing'})
+
+_pinned_alias = contextvars.ContextVar('library_circulation_alias', default=None)
+_migrating_alias = contextvars.ContextVar('library_migrating_alias', default=None)
+
+
+def is_circulation_model(model):
+    return model._meta.app_label == 'library' and model._meta.model_name in CIRCULATION_MODELS
+
+
+def branch_databases():
+    return getattr(settings, 'LIBRARY_BRANCH_DATABASES', None) or {}
+
+
+def circulation_aliases():
+    """Every database holding circulation rows, ``default`` first."""
+    return list(dict.fromkeys([DEFAULT_DB_ALIAS, *branch_databases().values()]))
+
+
+def archive_database():
+    return getattr(settings, 'LIBRARY_ARCHIVE_DATABASE', None)
+
+
+def archive_alias(alias):
+    """Database receiving the archived loans of circulation database ``alias``."""
+    return archive_database() or alias
+
+
+def archive_aliases():
+    """Every database holding archived loans."""
+    return list(dict.fromkeys(archive_alias(alias) for alias in circulation_aliases()))
+
+
+def is_archive_model(model):
+    return model._meta.app_label == 'library' and model._meta.model_name in ARCHIVE_MODELS
+
+
+def alias_for_branch(branch):
+    """Database alias for a branch (a ``Branch``, its code, or ``None``)."""
+    code = getattr(branch, 'pk', branch)
+    if code is None:
+        return DEFAULT_DB_ALIAS
+    return branch_databases().get(code, DEFAULT_DB_ALIAS)
+
+
+def circulation_alias(obj):
+    """Database holding the circulation rows of ``obj`` (a book, loan or reservation)."""
+    if is_circulation_model(type(obj)) and obj._state.db:
+        return obj._state.db
+    return alias_for_branch(getattr(obj, 'branch_id', None))
+
+
+def pinned_alias():
+    return _pinned_alias.get()
+
+
+@contextmanager
+def use_database(alias):
+    """Send circulation queries without an explicit ``using()`` to ``alias``."""
+    token = _pinned_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _pinned_alias.reset(token)
+
+
+def pinned_to(argument):
+    """Run a service method with the circulation database of ``argument`` pinned.
+
+    ``argument`` names the parameter holding the book, loan or reservation
+    the call operates on.
+    """
+
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            obj = signature.bind(*args, **kwargs).arguments[argument]
+            with use_database(circulation_alias(obj)):
+                return method(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def atomic():
+    """``transaction.atomic()`` on ``default`` and on the pinned branch database.
+
+    The two transactions commit one after the other; there is no two-phase
+    commit across databases.
+    """
+    alias = _pinned_alias.get()
+    with ExitStack() as stack:
+        if alias not in (None, DEFAULT_DB_ALIAS):
+            stack.enter_context(transaction.atomic(using=alias))
+        stack.enter_context(transaction.atomic())
+        yield
+
+
+def catalog_constraints_allowed():
+    """Whether foreign keys from circulation rows to the catalog may be database constraints.
+
+    Outside migrations they always are. While a database is being migrated
+    the routers decide, through ``allow_migrate`` with the
+    ``catalog_constraints`` hint.
+    """
+    alias = _migrating_alias.get()
+    return alias is None or router.allow_migrate(alias, 'library', catalog_constraints=True)
+
+
+def migration_started(sender, using, **kwargs):
+    _migrating_alias.set(using)
+
+
+def migration_finished(sender, using, **kwargs):
+    _migrating_alias.set(None)
+
+
+def delete_from_other_databases(sender, instance, using, **kwargs):
+    """Apply the ``on_delete`` rules of loans and reservations outside ``using``.
+
+    Connected to ``pre_delete``; the collector only cascades within the
+    database the object is deleted from. As with ``atomic()``, each
+    database commits on its own.
+    """
+    from .models import Borrowing, Reservation
+
+    aliases = [alias for alias in circulation_aliases() if alias != using]
+    if not aliases:
+        return
+    for model in (Borrowing, Reservation):
+        for field in model._meta.concrete_fields:
+            if not field.is_relation or not isinstance(instance, field.related_model):
+                continue
+            for alias in aliases:
+                rows = model._base_manager.using(alias).filter(**{field.attname: instance.pk})
+                if field.remote_field.on_delete is PROTECT:
+                    if rows.exists():
+                        raise ProtectedError(
+                            f'Cannot delete {instance!r}: {model._meta.verbose_name_plural} in {alias!r} refer to it',
+                            set(rows[:10]),
+                        )
+                elif field.remote_field.on_delete is SET_NULL:
+                    rows.update(**{field.attname: None})
+                else:
+                    rows.delete()
+
+
+class BranchRouter:
+    """Route circulation models to the database of the branch they belong to."""
+
+    def _route(self, model, instance):
+        if is_archive_model(model) and archive_database():
+            return archive_database()
+        if is_circulation_model(model):
+            if instance is not None and is_circulation_model(type(instance)):
+                return circulation_alias(instance)
+            return _pinned_alias.get()
+        if instance is not None and is_circulation_model(type(instance)):
+            # Books, copies and users referenced by a loan live in default,
+            # whichever database the loan itself was read from.
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_circulation_model(type(obj1)) or is_circulation_model(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if hints.get('catalog_constraints'):
+            # The catalog and users are only in default.
+            return db == DEFAULT_DB_ALIAS
+        if db == DEFAULT_DB_ALIAS:
+            return None
+        if db == archive_database():
+            return app_label == 'library' and model_name in ARCHIVE_MODELS
+        if db not in branch_databases().values():
+            return None
+        return app_label == 'library' and model_name in CIRCULATION_MODELS
+
+
+def _ordering_key(model, ordering):
+    fields = []
+    for name in [*ordering, 'pk']:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        if name != 'pk':
+            try:
+                name = model._meta.get_field(name).attname
+            except FieldDoesNotExist:
+                raise ValueError(f'Cannot merge results ordered by {name!r} across databases')
+        fields.append((name, descending))
+
+    def compare(a, b):
+        for name, descending in fields:
+            x, y = getattr(a, name), getattr(b, name)
+            if x == y:
+                continue
+            # NULLs sort first, as on SQLite.
+            if x is None or (y is not None and x < y):
+                result = -1
+            else:
+                result = 1
+            return -result if descending else result
+        return 0
+
+    return functools.cmp_to_key(compare)
+
+
+class MergedQuerySet:
+    """Read-only union of one query run on several databases.
+
+    Supports what pagination and detail lookups need: ``count()``,
+    ``exists()``, ``get()``, slicing and iteration, plus ``filter()``,
+    ``exclude()`` and ``order_by()`` which are applied on every database.
+    Slicing ``[start:stop]`` reads at most ``stop`` rows from each database
+    and merges them in the query's ordering. ``select_related()`` relations
+    cannot be joined across databases, so they are prefetched for the rows
+    actually returned instead.
+    """
+
+    ordered = True
+
+    def __init__(self, querysets, prefetch=()):
+        self.model = querysets[0].model
+        self.prefetch = tuple(prefetch)
+        query = querysets[0].query
+        ordering = list(query.order_by or (self.model._meta.ordering if query.default_ordering else ()))
+        self._key = _ordering_key(self.model, ordering)
+        # The primary key breaks ties so every database returns rows in the
+        # same total order that the merge assumes.
+        self.querysets = [qs.order_by(*ordering, 'pk') for qs in querysets]
+
+    def _clone(self, method, *args, **kwargs):
+        return MergedQuerySet([getattr(qs, method)(*args, **kwargs) for qs in self.querysets], self.prefetch)
+
+    def filter(self, *args, **kwargs):
+        return self._clone('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._clone('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._clone('order_by', *fields)
+
+    def all(self):
+        return self
+
+    def count(self):
+        return sum(qs.count() for qs in self.querysets)
+
+    def exists(self):
+        return any(qs.exists() for qs in self.querysets)
+
+    def get(self, *args, **kwargs):
+        found = []
+        for qs in self.querysets:
+            found.extend(qs.filter(*args, **kwargs)[:2])
+            if len(found) > 1:
+                raise self.model.MultipleObjectsReturned(
+                    f'get() returned more than one {self.model._meta.object_name}'
+                )
+        if not found:
+            raise self.model.DoesNotExist(f'{self.model._meta.object_name} matching query does not exist.')
+        self._prefetch(found)
+        return found[0]
+
+    def _prefetch(self, objects):
+        if self.prefetch and objects:
+            prefetch_related_objects(objects, *self.prefetch)
+        return objects
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            if key < 0:
+                raise ValueError('Negative indexing is not supported.')
+            try:
+                return self[key:key + 1][0]
+            except IndexError:
+                raise IndexError('MergedQuerySet index out of range') from None
+        start, stop = key.start or 0, key.stop
+        if (start < 0) or (stop is not None and stop < 0) or key.step is not None:
+            raise ValueError('Only non-negative slices without a step are supported.')
+        parts = [qs if stop is None else qs[:stop] for qs in self.querysets]
+        merged = heapq.merge(*parts, key=self._key)
+        return self._prefetch(list(itertools.islice(merged, start, stop)))
+
+    def __iter__(self):
+        return iter(self[0:None])
+
+    def __len__(self):
+        return self.count()
+
+
+def _select_related_paths(select_related, prefix=''):
+    for name, nested in select_related.items():
+        yield prefix + name
+        yield from _select_related_paths(nested, f'{prefix}{name}__')
+
+
+def fan_out(queryset, aliases=None):
+    """Run ``queryset`` on every circulation database and merge the results.
+
+    Returns ``queryset`` itself when there is only one circulation database,
+    so single-database deployments keep using plain querysets.
+    """
+    aliases = aliases or circulation_aliases()
+    if len(aliases) == 1:
+        return queryset.using(aliases[0])
+    prefetch = ()
+    if isinstance(queryset.query.select_related, dict):
+        prefetch = tuple(_select_related_paths(queryset.query.select_related))
+    elif queryset.query.select_related:
+        raise ValueError('fan_out() needs explicit select_related() fields')
+    base = queryset.select_related(None)
+    return MergedQuerySet([base.using(alias) for alias in aliases], prefetch)
+
+
+def on_branch(queryset, branch):
+    """Restrict ``queryset`` to one branch, on that branch's database."""
+    alias = alias_for_branch(branch)
+    queryset = queryset.using(alias).filter(branch_id=getattr(branch, 'pk', branch))
+    if alias != DEFAULT_DB_ALIAS and isinstance(queryset.query.select_related, dict):
+        paths = tuple(_select_related_paths(queryset.query.select_related))
+        queryset = queryset.select_related(None).prefetch_related(*paths)
+    return queryset
@@ -1,8 +1,8 @@
 from rest_framework import serializers
 from django.utils import timezone
 
-from .models import Author, Book, Borrowing
-from . import services
+from .models import ArchivedBorrowing, Author, Book, BookCopy, Borrowing, Reservation
+from . import isbn, services
 
 
 class ReservationSerializer(serializers.ModelSerializer):
@@ -10,9 +10,9 @@ class ReservationSerializer(serializers.ModelSerializer):
     book = serializers.PrimaryKeyRelatedField(queryset=Book.objects.all())
 
     class Meta:
-        model = getattr(__import__('library.models', fromlist=['Reservation']), 'Reservation')
-        fields = ['id', 'user', 'book', 'created_at', 'active']
-        read_only_fields = ['id', 'user', 'created_at', 'active']
+        model = Reservation
+        fields = ['id', 'user', 'book', 'branch', 'created_at', 'active', 'pickup_deadline']
+        read_only_fields = ['id', 'user', 'branch', 'created_at', 'active', 'pickup_deadline']
 
     def create(self, validated_data):
         request = self.context.get('request')
@@ -21,29 +21,98 @@ class ReservationSerializer(serializers.ModelSerializer):
 
         book = validated_data['book']
         try:
-            reservation = services.reserve_book(request.user, book)
+            reservation = self._service().reserve(request.user, book)
         except Exception as exc:
             raise serializers.ValidationError(str(exc))
         return reservation
 
+    def _service(self):
+        return self.context.get('borrowing_service') or services.get_borrowing_service()
+
+
+class AuthorBookSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Book
+        fields = ['id', 'title', 'ISBN', 'status', 'publication_date']
+
 
 class AuthorSerializer(serializers.ModelSerializer):
+    """Author with the ``book_count``/``available_count`` annotations when present.
+
+    Pass ``include_books=True`` to nest the titles prefetched into
+    ``first_books`` (see ``AuthorViewSet``).
+    """
+
+    book_count = serializers.IntegerField(read_only=True)
+    available_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Author
-        fields = ['id', 'name', 'biography', 'birth_date', 'nationality']
+        fields = ['id', 'name', 'biography', 'birth_date', 'nationality', 'book_count', 'available_count']
+
+    def __init__(self, *args, include_books=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        if include_books:
+            self.fields['books'] = AuthorBookSerializer(source='first_books', many=True, read_only=True)
 
 
 class BookSerializer(serializers.ModelSerializer):
+    """Book representation with optional sparse fieldsets.
+
+    Pass ``fields`` to keep only those output fields and ``expand`` to choose
+    which relations are nested. When ``fields`` is given, ``author`` is the
+    author's id unless ``'author'`` is in ``expand``; without ``fields`` the
+    full representation (nested author) is returned as before.
+    """
+
+    EXPANDABLE_FIELDS = ('author',)
+
     author = AuthorSerializer(read_only=True)
     author_id = serializers.PrimaryKeyRelatedField(queryset=Author.objects.all(), source='author', write_only=True)
+    available_copies = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
         fields = [
             'id', 'title', 'subtitle', 'author', 'author_id', 'book_description', 'category',
-            'publisher', 'publication_date', 'ISBN', 'page_count', 'last_edition', 'language', 'cover_url', 'status'
+            'publisher', 'publication_date', 'ISBN', 'isbn13', 'page_count', 'last_edition', 'language', 'cover_url',
+            'status', 'branch', 'available_copies',
         ]
 
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        keep = set(fields) | set(expand)
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+        if 'author' in self.fields and 'author' not in expand:
+            self.fields['author'] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    def get_available_copies(self, book) -> int:
+        # Querysets built with ``with_available_copies()`` carry the count; a
+        # book saved or loaded elsewhere (create, update, lookups) counts its copies.
+        annotated = getattr(book, 'available_copies', None)
+        if annotated is not None:
+            return annotated
+        return book.copies.filter(status=BookCopy.STATUS_AVAILABLE).count()
+
+    def validate_ISBN(self, value):
+        if self.instance is not None and value == self.instance.ISBN:
+            return value
+        try:
+            isbn13 = isbn.to_isbn13(value)
+        except isbn.InvalidISBN as exc:
+            raise serializers.ValidationError(str(exc))
+        if isbn13 is not None:
+            same = Book.objects.filter(isbn13=isbn13)
+            if self.instance is not None:
+                same = same.exclude(pk=self.instance.pk)
+            if same.exists():
+                raise serializers.ValidationError(f'A book with ISBN {isbn13} already exists')
+        return value
+
     def update(self, instance, validated_data):
         request = self.context.get('request')
         if request is not None and not request.user.is_staff:
@@ -59,8 +128,8 @@ class BorrowingSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Borrowing
-        fields = ['id', 'user', 'book', 'borrow_date', 'return_date', 'returned']
-        read_only_fields = ['id', 'user', 'borrow_date', 'return_date', 'returned']
+        fields = ['id', 'user', 'book', 'copy', 'branch', 'borrow_date', 'return_date', 'returned', 'renewal_count']
+        read_only_fields = ['id', 'user', 'copy', 'branch', 'borrow_date', 'return_date', 'returned', 'renewal_count']
 
     def create(self, validated_data):
         request = self.context.get('request')
@@ -71,8 +140,29 @@ class BorrowingSerializer(serializers.ModelSerializer):
         days = request.data.get('days', 14)
 
         try:
-            borrowing = services.borrow_book(request.user, book, days=int(days))
+            borrowing = self._service().borrow(request.user, book, days=int(days))
         except Exception as exc:
             raise serializers.ValidationError(str(exc))
 
         return borrowing
+
+    def _service(self):
+        return self.context.get('borrowing_service') or services.get_borrowing_service()
+
+
+class BorrowingHistorySerializer(serializers.Serializer):
+    """A loan from the live table or from the archive."""
+
+    id = serializers.UUIDField(read_only=True)
+    book = serializers.PrimaryKeyRelatedField(read_only=True)
+    branch = serializers.PrimaryKeyRelatedField(read_only=True)
+    borrow_date = serializers.DateTimeField(read_only=True)
+    return_date = serializers.DateTimeField(read_only=True)
+    returned = serializers.SerializerMethodField()
+    archived = serializers.SerializerMethodField()
+
+    def get_returned(self, obj):
+        return getattr(obj, 'returned', True)
+
+    def get_archived(self, obj):
+        return isinstance(obj, ArchivedBorrowing)
@@ -1,9 +1,115 @@
+import functools
+import logging
+import random
+import time
+from collections import defaultdict
 from datetime import timedelta
-from django.db import transaction
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.utils.module_loading import import_string
 
-from .models import Book, Borrowing, Reservation
+from core import metrics
+
+from . import availability, fines, recommendations, routers, trending
+from .models import Book, BookCopy, Borrowing, Reservation
+
+logger = logging.getLogger(__name__)
+
+
+# Number of free copies tried per checkout on backends without SKIP LOCKED.
+COPY_CLAIM_CANDIDATES = 5
+
+# Pickup window used by the hold sweep when LIBRARY_HOLD_PICKUP_DAYS is unset.
+DEFAULT_HOLD_PICKUP_DAYS = 3
+
+# Renewals allowed per loan when LIBRARY_MAX_RENEWALS is unset.
+DEFAULT_MAX_RENEWALS = 3
+
+
+def hold_pickup_deadline():
+    """Pickup deadline for an item placed on the hold shelf now.
+
+    ``None`` when ``LIBRARY_HOLD_PICKUP_DAYS`` is unset, in which case returns
+    hand the item straight to the next reservation.
+    """
+    days = getattr(settings, 'LIBRARY_HOLD_PICKUP_DAYS', None)
+    if not days:
+        return None
+    return timezone.now() + timedelta(days=int(days))
+
+
+def max_renewals():
+    return int(getattr(settings, 'LIBRARY_MAX_RENEWALS', DEFAULT_MAX_RENEWALS))
+
+
+def _competing_reservations():
+    """Active reservations of the outer loan's title by anyone but its borrower."""
+    return Reservation.objects.filter(book=OuterRef('book_id'), active=True).exclude(user=OuterRef('user_id'))
+
+
+def _active_borrowings(user):
+    return routers.fan_out(Borrowing.objects.filter(user=user, returned=False)).count()
+
+
+CIRCULATION_EVENTS = metrics.Counter(
+    'library_circulation_events_total',
+    'Borrows, returns, renewals, reservations and reservation hand-offs.',
+    ['event'],
+)
+
+
+def _counted(event):
+    """Count successful calls of a service method as circulation ``event``."""
+    counter = CIRCULATION_EVENTS.labels(event)
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            result = method(*args, **kwargs)
+            counter.inc()
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _create_loan(**fields):
+    """Create a loan and feed it to the recommendation index once committed."""
+    loan = Borrowing.objects.create(**fields)
+    transaction.on_commit(lambda: _record_loan(loan))
+    return loan
+
+
+def _record_loan(loan):
+    try:
+        recommendations.record_loan(loan.user_id, loan.book_id, loan.pk)
+    except Exception:
+        # Recommendations are derived data; a failure here must not surface
+        # as a failed checkout. The next full rebuild repairs the index.
+        logger.exception('Could not record loan %s in the recommendation index', loan.pk)
+
+
+def _record_trending(record, book):
+    """Count a checkout or hold towards ``book``'s trending score once committed.
+
+    The score UPDATE runs after the transaction so it never holds the book's
+    row lock for the rest of a checkout.
+    """
+    book_id = getattr(book, 'pk', book)
+
+    def apply():
+        try:
+            record(book_id)
+        except Exception:
+            # Trending is a ranking hint; losing one event must not fail the checkout.
+            logger.exception('Could not record a trending event for book %s', book_id)
+
+    transaction.on_commit(apply)
 
 
 class BorrowingError(Exception):
@@ -29,71 +135,413 @@ class BorrowingService:
     easier to test and to inject into views (Dependency Inversion).
     """
 
+    @_counted('borrow')
+    @routers.pinned_to('book')
     def borrow(self, user, book, days: int = 14):
         if not getattr(user, 'is_active', True):
             raise InactiveUserError('User account is inactive')
 
-        active_count = Borrowing.objects.filter(user=user, returned=False).count()
-        if active_count >= 5:
+        if _active_borrowings(user) >= 5:
             raise MaxActiveBorrowingsExceeded('User has reached the active borrow limit (5)')
 
+        return_date = timezone.now() + timedelta(days=int(days))
+
+        held = self._held_reservation(user, book)
+        if held is not None:
+            return self._pick_up(user, book, held, return_date)
+
         if book.status != Book.STATUS_AVAILABLE:
             raise BookNotAvailable('Book is not available for borrowing')
 
-        return_date = timezone.now() + timedelta(days=int(days))
+        with routers.atomic():
+            availability.book_changed(book.pk)
+            copy = self._claim_copy(book)
+            if copy is not None:
+                borrowing = _create_loan(
+                    user=user,
+                    book=book,
+                    copy=copy,
+                    branch_id=book.branch_id,
+                    borrow_date=timezone.now(),
+                    return_date=return_date,
+                )
+                if self._mark_book_borrowed_if_exhausted(book.pk):
+                    book.status = Book.STATUS_BORROWED
+                _record_trending(trending.record_borrow, book)
+                return borrowing
+
+            if BookCopy.objects.filter(book_id=book.pk).exists():
+                raise BookNotAvailable('Book is not available for borrowing')
 
-        with transaction.atomic():
             locked_book = Book.objects.select_for_update().get(pk=book.pk)
             if locked_book.status != Book.STATUS_AVAILABLE:
                 raise BookNotAvailable('Book is not available for borrowing')
             locked_book.status = Book.STATUS_BORROWED
             locked_book.save(update_fields=['status'])
+            book.status = locked_book.status
 
-            borrowing = Borrowing.objects.create(
+            borrowing = _create_loan(
                 user=user,
-                book=locked_book,
+                book=book,
+                branch_id=book.branch_id,
                 borrow_date=timezone.now(),
                 return_date=return_date,
             )
+            _record_trending(trending.record_borrow, book)
 
         return borrowing
 
+    @_counted('return')
+    @routers.pinned_to('borrowing')
     def return_borrowing(self, borrowing: Borrowing):
-        with transaction.atomic():
+        if borrowing.copy_id is not None:
+            return self._return_copy(borrowing)
+
+        with routers.atomic():
             if borrowing.returned:
                 return borrowing
 
             borrowing.returned = True
             borrowing.save(update_fields=['returned'])
+            fines.settle([borrowing.pk])
+            availability.book_changed(borrowing.book_id)
 
             book = Book.objects.select_for_update().get(pk=borrowing.book.pk)
-            next_reservation = (
-                Reservation.objects.filter(book=book, active=True)
-                .order_by('created_at')
-                .first()
-            )
+            reservation, new_borrowing = self._advance_queue(book.pk)
 
-            if next_reservation:
-                reserve_user = next_reservation.user
-                next_reservation.active = False
-                next_reservation.save(update_fields=['active'])
-
-                new_borrowing = Borrowing.objects.create(
-                    user=reserve_user,
-                    book=book,
-                    borrow_date=timezone.now(),
-                    return_date=timezone.now() + timedelta(days=14),
-                )
+            if new_borrowing is not None:
                 book.status = Book.STATUS_BORROWED
                 book.save(update_fields=['status'])
+                borrowing.book.status = book.status
 
                 return new_borrowing
 
-            book.status = Book.STATUS_AVAILABLE
+            book.status = Book.STATUS_RESERVED if reservation is not None else Book.STATUS_AVAILABLE
             book.save(update_fields=['status'])
+            borrowing.book.status = book.status
 
         return borrowing
 
+    def _claim_copy(self, book):
+        """Claim a free copy of ``book`` and mark it borrowed.
+
+        Where the backend supports it, candidates are locked with SKIP LOCKED
+        so concurrent checkouts of a hot title pick different copies instead
+        of queueing on one row. The conditional UPDATE is the actual claim and
+        keeps the operation correct on backends without row locks (SQLite).
+        Returns ``None`` when no copy could be claimed.
+        """
+        candidates = BookCopy.objects.filter(book_id=book.pk, status=BookCopy.STATUS_AVAILABLE).order_by()
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)[:1]
+        else:
+            candidates = candidates[:COPY_CLAIM_CANDIDATES]
+
+        for copy in candidates:
+            claimed = BookCopy.objects.filter(pk=copy.pk, status=BookCopy.STATUS_AVAILABLE).update(
+                status=BookCopy.STATUS_BORROWED
+            )
+            if claimed:
+                copy.status = BookCopy.STATUS_BORROWED
+                return copy
+        return None
+
+    def _return_copy(self, borrowing: Borrowing):
+        with routers.atomic():
+            marked = Borrowing.objects.filter(pk=borrowing.pk, returned=False).update(returned=True)
+            if not marked:
+                borrowing.returned = True
+                return borrowing
+            borrowing.returned = True
+            fines.settle([borrowing.pk])
+            availability.book_changed(borrowing.book_id)
+
+            reservation, new_borrowing = self._advance_queue(borrowing.book_id, borrowing.copy_id)
+            if new_borrowing is not None:
+                return new_borrowing
+            if reservation is not None:
+                return borrowing
+
+            BookCopy.objects.filter(pk=borrowing.copy_id).update(status=BookCopy.STATUS_AVAILABLE)
+            if self._mark_book_available_if_restocked(borrowing.book_id):
+                borrowing.book.status = Book.STATUS_AVAILABLE
+
+        return borrowing
+
+    def _advance_queue(self, book_id, copy_id=None):
+        """Give a returned item to the oldest waiting reservation.
+
+        Returns ``(reservation, new_borrowing)``. With a hold shelf configured
+        the item is set aside and ``new_borrowing`` is ``None``; otherwise the
+        loan is created immediately. ``(None, None)`` means nobody is waiting.
+        """
+        reservation = self._claim_next_reservation(book_id, copy_id)
+        if reservation is None:
+            return None, None
+        CIRCULATION_EVENTS.labels('handoff').inc()
+        if reservation.pickup_deadline is not None:
+            if copy_id is not None:
+                BookCopy.objects.filter(pk=copy_id).update(status=BookCopy.STATUS_RESERVED)
+            return reservation, None
+        return reservation, _create_loan(
+            user_id=reservation.user_id,
+            book_id=book_id,
+            copy_id=copy_id,
+            branch_id=reservation.branch_id,
+            borrow_date=timezone.now(),
+            return_date=timezone.now() + timedelta(days=14),
+        )
+
+    @staticmethod
+    def _claim_next_reservation(book_id, copy_id=None):
+        """Claim the oldest waiting reservation for ``book_id``.
+
+        With ``LIBRARY_HOLD_PICKUP_DAYS`` set the reservation moves to the
+        hold shelf (it stays active with a pickup deadline); otherwise it is
+        deactivated for an immediate hand-off. The claim is a conditional
+        UPDATE, so two concurrent returns never pick the same reservation.
+        """
+        pickup_deadline = hold_pickup_deadline()
+        if pickup_deadline is not None:
+            changes = {'pickup_deadline': pickup_deadline, 'held_copy_id': copy_id}
+        else:
+            changes = {'active': False}
+        changes['updated_at'] = timezone.now()
+
+        waiting = Reservation.objects.filter(active=True, pickup_deadline__isnull=True)
+        for reservation in (
+            waiting.filter(book_id=book_id)
+            .order_by('created_at')[:COPY_CLAIM_CANDIDATES]
+        ):
+            if waiting.filter(pk=reservation.pk).update(**changes):
+                for field, value in changes.items():
+                    setattr(reservation, field, value)
+                return reservation
+        return None
+
+    @staticmethod
+    def _held_reservation(user, book):
+        if hold_pickup_deadline() is None:
+            return None
+        return (
+            Reservation.objects.filter(
+                book_id=book.pk, user=user, active=True, pickup_deadline__gte=timezone.now()
+            )
+            .order_by('pickup_deadline')
+            .first()
+        )
+
+    def _pick_up(self, user, book, reservation, return_date):
+        """Turn a hold-shelf reservation into a loan for its patron."""
+        with routers.atomic():
+            closed = Reservation.objects.filter(pk=reservation.pk, active=True).update(
+                active=False, updated_at=timezone.now()
+            )
+            if not closed:
+                raise BookNotAvailable('Hold is no longer available for pickup')
+            reservation.active = False
+            availability.book_changed(book.pk)
+            if reservation.held_copy_id is not None:
+                BookCopy.objects.filter(pk=reservation.held_copy_id).update(status=BookCopy.STATUS_BORROWED)
+            elif Book.objects.filter(pk=book.pk, status=Book.STATUS_RESERVED).update(status=Book.STATUS_BORROWED):
+                book.status = Book.STATUS_BORROWED
+
+            borrowing = _create_loan(
+                user=user,
+                book_id=book.pk,
+                copy_id=reservation.held_copy_id,
+                branch_id=book.branch_id,
+                borrow_date=timezone.now(),
+                return_date=return_date,
+            )
+            _record_trending(trending.record_borrow, book)
+            return borrowing
+
+    @staticmethod
+    def _mark_book_borrowed_if_exhausted(book_id) -> bool:
+        """Flip ``Book.status`` to borrowed once its last free copy is taken.
+
+        The book row is only written on that transition, so checkouts of a
+        title with spare copies never contend on it.
+        """
+        free_copy = BookCopy.objects.filter(book_id=OuterRef('pk'), status=BookCopy.STATUS_AVAILABLE)
+        return bool(
+            Book.objects.filter(pk=book_id, status=Book.STATUS_AVAILABLE)
+            .filter(~Exists(free_copy))
+            .update(status=Book.STATUS_BORROWED)
+        )
+
+    @staticmethod
+    def _mark_book_available_if_restocked(book_id) -> bool:
+        free_copy = BookCopy.objects.filter(book_id=OuterRef('pk'), status=BookCopy.STATUS_AVAILABLE)
+        return bool(
+            Book.objects.filter(pk=book_id)
+            .exclude(status=Book.STATUS_AVAILABLE)
+            .filter(Exists(free_copy))
+            .update(status=Book.STATUS_AVAILABLE)
+        )
+
+    def return_many(self, borrowings, chunk_size: int = 500):
+        """Return a batch of borrowings with set-based writes.
+
+        ``borrowings`` is a queryset (or iterable of instances). Open loans are
+        processed in chunks: each chunk is marked returned with one UPDATE and
+        the freed copies and books are released with one UPDATE per table.
+        Only titles that actually have waiting reservations go through the
+        per-item queue hand-off. Each circulation database is processed in
+        turn. Returns ``(returned, handed_off)`` counts.
+        """
+        pks = [getattr(item, 'pk', item) for item in borrowings]
+        returned = handed_off = 0
+        for alias in routers.circulation_aliases():
+            with routers.use_database(alias):
+                counts = self._return_many(pks, chunk_size)
+            returned += counts[0]
+            handed_off += counts[1]
+        CIRCULATION_EVENTS.labels('return').inc(returned)
+        return returned, handed_off
+
+    def _return_many(self, pks, chunk_size):
+        returned = handed_off = 0
+        for start in range(0, len(pks), chunk_size):
+            with routers.atomic():
+                rows = list(
+                    Borrowing.objects.select_for_update()
+                    .filter(pk__in=pks[start:start + chunk_size], returned=False)
+                    .order_by()
+                    .values_list('pk', 'book_id', 'copy_id')
+                )
+                if not rows:
+                    continue
+                Borrowing.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(returned=True)
+                fines.settle(pk for pk, _, _ in rows)
+                availability.book_changed(*{book_id for _, book_id, _ in rows})
+                returned += len(rows)
+
+                queued_books = set(
+                    Reservation.objects.filter(
+                        book_id__in={book_id for _, book_id, _ in rows},
+                        active=True,
+                        pickup_deadline__isnull=True,
+                    ).values_list('book_id', flat=True)
+                )
+                freed_copies = []
+                freed_books = set()
+                for _, book_id, copy_id in rows:
+                    if book_id in queued_books:
+                        reservation, new_borrowing = self._advance_queue(book_id, copy_id)
+                        if reservation is not None:
+                            handed_off += 1
+                            if copy_id is None:
+                                Book.objects.filter(pk=book_id).update(
+                                    status=Book.STATUS_BORROWED if new_borrowing else Book.STATUS_RESERVED
+                                )
+                            continue
+                    if copy_id is not None:
+                        freed_copies.append((copy_id, book_id))
+                    else:
+                        freed_books.add(book_id)
+
+                if freed_copies:
+                    BookCopy.objects.filter(pk__in=[copy_id for copy_id, _ in freed_copies]).update(
+                        status=BookCopy.STATUS_AVAILABLE
+                    )
+                    Book.objects.filter(pk__in={book_id for _, book_id in freed_copies}).exclude(
+                        status=Book.STATUS_AVAILABLE
+                    ).update(status=Book.STATUS_AVAILABLE)
+                if freed_books:
+                    Book.objects.filter(pk__in=freed_books).update(status=Book.STATUS_AVAILABLE)
+
+        return returned, handed_off
+
+    def expire_holds(self, now=None, limit: int = 1000):
+        """Expire missed pickups and pass the items on, using set-based writes.
+
+        Up to ``limit`` holds whose deadline has passed are deactivated with
+        one UPDATE. The next waiting reservations of every affected title are
+        found with one windowed query and moved to the hold shelf with one
+        bulk UPDATE; items nobody is waiting for are released with one UPDATE
+        per table. Each circulation database is processed in turn, with up to
+        ``limit`` holds from each. Returns ``(expired, promoted)`` counts.
+        """
+        now = now or timezone.now()
+        expired = promoted = 0
+        for alias in routers.circulation_aliases():
+            with routers.use_database(alias):
+                counts = self._expire_holds(now, limit)
+            expired += counts[0]
+            promoted += counts[1]
+        return expired, promoted
+
+    def _expire_holds(self, now, limit):
+        pickup_deadline = hold_pickup_deadline() or now + timedelta(days=DEFAULT_HOLD_PICKUP_DAYS)
+
+        with routers.atomic():
+            expired = list(
+                Reservation.objects.select_for_update()
+                .filter(active=True, pickup_deadline__lt=now)
+                .order_by('pickup_deadline')
+                .values_list('pk', 'book_id', 'held_copy_id')[:limit]
+            )
+            if not expired:
+                return 0, 0
+            Reservation.objects.filter(pk__in=[pk for pk, _, _ in expired]).update(
+                active=False, expired=True, updated_at=now
+            )
+
+            slots = defaultdict(list)
+            for _, book_id, copy_id in expired:
+                slots[book_id].append(copy_id)
+            availability.book_changed(*slots)
+
+            queue_position = Window(RowNumber(), partition_by=[F('book_id')], order_by=F('created_at').asc())
+            waiting = defaultdict(list)
+            for reservation in (
+                Reservation.objects.filter(book_id__in=list(slots), active=True, pickup_deadline__isnull=True)
+                .annotate(queue_position=queue_position)
+                .filter(queue_position__lte=max(len(copies) for copies in slots.values()))
+                .order_by('book_id', 'queue_position')
+            ):
+                waiting[reservation.book_id].append(reservation)
+
+            promoted = []
+            freed_copies = {}
+            freed_books = set()
+            for book_id, copy_ids in slots.items():
+                candidates = waiting.get(book_id, [])
+                for copy_id in copy_ids:
+                    if candidates:
+                        reservation = candidates.pop(0)
+                        reservation.pickup_deadline = pickup_deadline
+                        reservation.held_copy_id = copy_id
+                        promoted.append(reservation)
+                    elif copy_id is not None:
+                        freed_copies[copy_id] = book_id
+                    else:
+                        freed_books.add(book_id)
+
+            if promoted:
+                for reservation in promoted:
+                    reservation.updated_at = now
+                Reservation.objects.bulk_update(
+                    promoted, ['pickup_deadline', 'held_copy', 'updated_at'], batch_size=500
+                )
+            if freed_copies:
+                BookCopy.objects.filter(pk__in=list(freed_copies), status=BookCopy.STATUS_RESERVED).update(
+                    status=BookCopy.STATUS_AVAILABLE
+                )
+                Book.objects.filter(pk__in=set(freed_copies.values())).exclude(
+                    status=Book.STATUS_AVAILABLE
+                ).update(status=Book.STATUS_AVAILABLE)
+            if freed_books:
+                Book.objects.filter(pk__in=freed_books, status=Book.STATUS_RESERVED).update(
+                    status=Book.STATUS_AVAILABLE
+                )
+
+        return len(expired), len(promoted)
+
+    @_counted('reserve')
+    @routers.pinned_to('book')
     def reserve(self, user, book):
         if not getattr(user, 'is_active', True):
             raise InactiveUserError('User account is inactive')
@@ -102,12 +550,17 @@ class BorrowingService:
         if exists:
             raise BorrowingError('User already has an active reservation for this book')
 
-        reservation = Reservation.objects.create(user=user, book=book)
+        reservation = Reservation.objects.create(user=user, book=book, branch_id=book.branch_id)
+        _record_trending(trending.record_reservation, book)
         return reservation
 
+    @_counted('renew')
+    @routers.pinned_to('borrowing')
     def renew(self, borrowing: Borrowing, extra_days: int = 7):
         if borrowing.returned:
             raise BorrowingError('Cannot renew a returned borrowing')
+        if borrowing.renewal_count >= max_renewals():
+            raise BorrowingError(f'Cannot renew: the limit of {max_renewals()} renewals has been reached')
 
         other_reservation_exists = (
             Reservation.objects.filter(book=borrowing.book, active=True)
@@ -118,12 +571,162 @@ class BorrowingService:
             raise BorrowingError('Cannot renew: another user has an active reservation for this book')
 
         borrowing.return_date = borrowing.return_date + timedelta(days=int(extra_days))
-        borrowing.save(update_fields=['return_date'])
+        borrowing.renewal_count += 1
+        borrowing.save(update_fields=['return_date', 'renewal_count'])
         return borrowing
 
+    def auto_renew(self, within_days: int = 2, extra_days: int = 7, now=None):
+        """Renew every open loan due within ``within_days`` that nobody else is waiting for.
+
+        Loans already overdue, at the renewal limit (``LIBRARY_MAX_RENEWALS``)
+        or whose title has an active reservation by another patron are left
+        alone. Each circulation database gets one ``UPDATE ... WHERE NOT
+        EXISTS (...)``, so the competing-reservation check and the renewal
+        happen atomically in the database. Returns the number of loans renewed.
+        """
+        now = now or timezone.now()
+        renewed = 0
+        for alias in routers.circulation_aliases():
+            with routers.use_database(alias):
+                renewed += (
+                    Borrowing.objects.filter(
+                        returned=False,
+                        return_date__gte=now,
+                        return_date__lt=now + timedelta(days=int(within_days)),
+                        renewal_count__lt=max_renewals(),
+                    )
+                    .filter(~Exists(_competing_reservations()))
+                    .update(
+                        return_date=F('return_date') + timedelta(days=int(extra_days)),
+                        renewal_count=F('renewal_count') + 1,
+                        updated_at=now,
+                    )
+                )
+        CIRCULATION_EVENTS.labels('auto_renew').inc(renewed)
+        return renewed
+
+
+class ConditionalUpdateBorrowingService(BorrowingService):
+    """Borrowing rules implemented without row locks.
+
+    A single-item book is claimed with ``UPDATE ... WHERE status='available'``
+    and the affected row count decides the winner, so a checkout is one
+    conditional UPDATE plus the INSERT. Transient lock errors (SQLite's
+    ``database is locked``, deadlocks, serialization failures) are retried
+    with bounded, jittered exponential backoff.
+    """
+
+    max_attempts = 5
+    backoff_base = 0.01
+    backoff_max = 0.25
+
+    LOCK_ERROR_MARKERS = ('database is locked', 'deadlock', 'could not serialize', 'lock wait timeout')
+
+    @_counted('borrow')
+    @routers.pinned_to('book')
+    def borrow(self, user, book, days: int = 14):
+        if not getattr(user, 'is_active', True):
+            raise InactiveUserError('User account is inactive')
+
+        if _active_borrowings(user) >= 5:
+            raise MaxActiveBorrowingsExceeded('User has reached the active borrow limit (5)')
+
+        return_date = timezone.now() + timedelta(days=int(days))
+
+        held = self._held_reservation(user, book)
+        if held is not None:
+            return self._run_with_retry(lambda: self._pick_up(user, book, held, return_date))
+        return self._run_with_retry(lambda: self._claim_and_create(user, book, return_date))
+
+    @_counted('return')
+    @routers.pinned_to('borrowing')
+    def return_borrowing(self, borrowing: Borrowing):
+        if borrowing.copy_id is not None:
+            return self._run_with_retry(lambda: self._return_copy(borrowing))
+        return self._run_with_retry(lambda: self._return_single(borrowing))
+
+    def _claim_and_create(self, user, book, return_date):
+        availability.book_changed(book.pk)
+        free_copy = BookCopy.objects.filter(book_id=OuterRef('pk'))
+        claimed = (
+            Book.objects.filter(pk=book.pk, status=Book.STATUS_AVAILABLE)
+            .filter(~Exists(free_copy))
+            .update(status=Book.STATUS_BORROWED)
+        )
+        copy = None
+        if claimed:
+            book.status = Book.STATUS_BORROWED
+        else:
+            copy = self._claim_copy(book)
+            if copy is None:
+                raise BookNotAvailable('Book is not available for borrowing')
+            if self._mark_book_borrowed_if_exhausted(book.pk):
+                book.status = Book.STATUS_BORROWED
+
+        borrowing = _create_loan(
+            user=user,
+            book_id=book.pk,
+            copy=copy,
+            branch_id=book.branch_id,
+            borrow_date=timezone.now(),
+            return_date=return_date,
+        )
+        _record_trending(trending.record_borrow, book)
+        return borrowing
+
+    def _return_single(self, borrowing: Borrowing):
+        if not Borrowing.objects.filter(pk=borrowing.pk, returned=False).update(returned=True):
+            borrowing.returned = True
+            return borrowing
+        borrowing.returned = True
+        fines.settle([borrowing.pk])
+        availability.book_changed(borrowing.book_id)
+
+        reservation, new_borrowing = self._advance_queue(borrowing.book_id)
+        if new_borrowing is not None:
+            return new_borrowing
+
+        next_status = Book.STATUS_RESERVED if reservation is not None else Book.STATUS_AVAILABLE
+        Book.objects.filter(pk=borrowing.book_id, status=Book.STATUS_BORROWED).update(status=next_status)
+        return borrowing
+
+    def _run_with_retry(self, operation):
+        attempt = 0
+        while True:
+            try:
+                with routers.atomic():
+                    return operation()
+            except OperationalError as exc:
+                attempt += 1
+                if attempt >= self.max_attempts or not self._is_lock_error(exc):
+                    raise
+                time.sleep(self._backoff(attempt))
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _is_lock_error(self, exc) -> bool:
+        message = str(exc).lower()
+        return any(marker in message for marker in self.LOCK_ERROR_MARKERS)
+
 
 DefaultBorrowingService = BorrowingService()
 
+ConditionalBorrowingService = ConditionalUpdateBorrowingService()
+
+
+def get_borrowing_service():
+    """Return the service configured by ``LIBRARY_BORROWING_SERVICE``.
+
+    The setting is a dotted path to a service instance; it defaults to
+    ``DefaultBorrowingService`` (row-locking implementation).
+    """
+    path = getattr(settings, 'LIBRARY_BORROWING_SERVICE', None)
+    if not path:
+        return DefaultBorrowingService
+    return import_string(path)
+
 
 def borrow_book(user, book, days: int = 14):
     return DefaultBorrowingService.borrow(user, book, days=days)
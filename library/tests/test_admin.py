@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.paginators import EstimatedCountPaginator
+from library import services
+from library.models import Author, Book, BookCopy, Borrowing, Reservation
+
+User = get_user_model()
+
+
+class CirculationAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='root', email='root@example.com', password='pw')
+        self.client.force_login(self.admin)
+        self.author = Author.objects.create(name='Admin Author')
+
+    def _loans(self, count, start=0):
+        loans = []
+        for i in range(start, start + count):
+            user = User.objects.create_user(username=f'adm{i}', email=f'adm{i}@example.com', password='pw')
+            book = Book.objects.create(title=f'Admin {i}', author=self.author, ISBN=f'ISBN-ADM-{i}')
+            loans.append(services.DefaultBorrowingService.borrow(user, book))
+        return loans
+
+    def _changelist_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse('admin:library_borrowing_changelist'))
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_borrowing_changelist_query_count_does_not_grow_with_rows(self):
+        self._loans(2)
+        few = self._changelist_queries()
+        self._loans(8, start=2)
+        self.assertEqual(self._changelist_queries(), few)
+
+    def test_mark_returned_action_uses_batched_return(self):
+        loans = self._loans(3)
+        copy_book = Book.objects.create(title='Copies', author=self.author, ISBN='ISBN-ADM-C')
+        BookCopy.objects.create(book=copy_book, barcode='ADM-C1')
+        loans.append(services.DefaultBorrowingService.borrow(self.admin, copy_book))
+        waiting = User.objects.create_user(username='waiting', email='waiting@example.com', password='pw')
+        Reservation.objects.create(user=waiting, book=loans[0].book)
+
+        resp = self.client.post(
+            reverse('admin:library_borrowing_changelist'),
+            {'action': 'mark_returned', '_selected_action': [str(loan.pk) for loan in loans]},
+            follow=True,
+        )
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, '4 borrowings marked as returned; 1 items passed')
+        self.assertFalse(Borrowing.objects.filter(pk__in=[loan.pk for loan in loans], returned=False).exists())
+        self.assertTrue(Borrowing.objects.filter(user=waiting, book=loans[0].book, returned=False).exists())
+        self.assertEqual(Book.objects.get(pk=loans[0].book_id).status, Book.STATUS_BORROWED)
+        self.assertEqual(Book.objects.get(pk=loans[1].book_id).status, Book.STATUS_AVAILABLE)
+        self.assertEqual(Book.objects.get(pk=copy_book.pk).status, Book.STATUS_AVAILABLE)
+        self.assertEqual(BookCopy.objects.get(barcode='ADM-C1').status, BookCopy.STATUS_AVAILABLE)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def test_uses_catalog_estimate_for_large_unfiltered_tables(self):
+        author = Author.objects.create(name='Est')
+        for i in range(5):
+            Book.objects.create(title=f'Est {i}', author=author, ISBN=f'ISBN-EST-{i}')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        paginator = EstimatedCountPaginator(Book.objects.order_by('pk'), 2)
+        paginator.threshold = 1
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(paginator.count, 5)
+        self.assertNotIn('COUNT', ' '.join(q['sql'].upper() for q in ctx.captured_queries))
+
+        with CaptureQueriesContext(connection) as ctx:
+            filtered = EstimatedCountPaginator(Book.objects.filter(title='Est 1').order_by('pk'), 2)
+            filtered.threshold = 1
+            self.assertEqual(filtered.count, 1)
+        self.assertIn('COUNT', ctx.captured_queries[-1]['sql'].upper())
@@ -0,0 +1,49 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from library.models import Author, Book
+
+
+class AuthorCatalogTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.austen = Author.objects.create(name='Jane Austen')
+        self.bronte = Author.objects.create(name='Charlotte Brontë')
+        self.idle = Author.objects.create(name='Anon')
+        for i, title in enumerate(['Persuasion', 'Emma', 'Sense and Sensibility', 'Pride and Prejudice']):
+            Book.objects.create(
+                title=title, author=self.austen, ISBN=f'AUTH-A{i}',
+                status=Book.STATUS_BORROWED if i == 0 else Book.STATUS_AVAILABLE,
+            )
+        Book.objects.create(title='Jane Eyre', author=self.bronte, ISBN='AUTH-B0', status=Book.STATUS_RESERVED)
+
+    def test_list_is_paginated_with_annotated_counts(self):
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/v1/library/authors/', {'page_size': 2}).json()
+
+        self.assertEqual(data['count'], 3)
+        self.assertIsNotNone(data['next'])
+        self.assertEqual(
+            [(row['name'], row['book_count'], row['available_count']) for row in data['results']],
+            [('Anon', 0, 0), ('Charlotte Brontë', 1, 0)],
+        )
+
+    def test_search_and_order_by_counts(self):
+        data = self.client.get('/api/v1/library/authors/', {'search': 'austen'}).json()
+        self.assertEqual([row['name'] for row in data['results']], ['Jane Austen'])
+
+        data = self.client.get('/api/v1/library/authors/', {'ordering': '-book_count'}).json()
+        self.assertEqual([row['name'] for row in data['results']], ['Jane Austen', 'Charlotte Brontë', 'Anon'])
+
+    def test_include_books_prefetches_the_first_titles_per_author(self):
+        with self.assertNumQueries(3):
+            data = self.client.get('/api/v1/library/authors/', {'include_books': 2}).json()
+
+        books = {row['name']: [book['title'] for book in row['books']] for row in data['results']}
+        self.assertEqual(books, {'Anon': [], 'Charlotte Brontë': ['Jane Eyre'], 'Jane Austen': ['Emma', 'Persuasion']})
+        self.assertNotIn('books', self.client.get('/api/v1/library/authors/').json()['results'][0])
+
+        detail = self.client.get(f'/api/v1/library/authors/{self.austen.pk}/', {'include_books': 1}).json()
+        self.assertEqual((detail['book_count'], [book['title'] for book in detail['books']]), (4, ['Emma']))
+        self.assertEqual(self.client.get('/api/v1/library/authors/', {'include_books': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/library/authors/', {'include_books': 500}).status_code, 400)
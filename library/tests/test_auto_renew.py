@@ -0,0 +1,81 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from library import services
+from library.models import Author, Book, Borrowing, Reservation
+
+User = get_user_model()
+
+
+@override_settings(LIBRARY_MAX_RENEWALS=2)
+class AutoRenewTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        author = Author.objects.create(name='Renew Author')
+        self.users = [
+            User.objects.create_user(username=f'renewer{i}', email=f'r{i}@example.com', password='pw') for i in range(3)
+        ]
+        self.books = [
+            Book.objects.create(title=f'Renew {i}', author=author, ISBN=f'ISBN-AR-{i}', status=Book.STATUS_BORROWED)
+            for i in range(6)
+        ]
+
+    def loan(self, book, due_in, user=None, renewal_count=0):
+        return Borrowing.objects.create(
+            user=user or self.users[0],
+            book=book,
+            borrow_date=self.now - timedelta(days=14),
+            return_date=self.now + due_in,
+            renewal_count=renewal_count,
+        )
+
+    def test_renews_only_eligible_loans_in_one_statement(self):
+        due_soon = self.loan(self.books[0], timedelta(days=1))
+        own_reservation = self.loan(self.books[1], timedelta(hours=5))
+        Reservation.objects.create(user=self.users[0], book=self.books[1])
+        contested = self.loan(self.books[2], timedelta(days=1))
+        Reservation.objects.create(user=self.users[1], book=self.books[2])
+        inactive_reservation = self.loan(self.books[3], timedelta(days=1))
+        Reservation.objects.create(user=self.users[1], book=self.books[3], active=False)
+        due_later = self.loan(self.books[4], timedelta(days=5))
+        at_limit = self.loan(self.books[5], timedelta(days=1), renewal_count=2)
+        overdue = self.loan(self.books[5], -timedelta(days=1), user=self.users[2])
+
+        with CaptureQueriesContext(connection) as queries:
+            renewed = services.DefaultBorrowingService.auto_renew(within_days=2, extra_days=7, now=self.now)
+        self.assertEqual(renewed, 3)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('NOT EXISTS', queries[0]['sql'].upper())
+
+        for loan in (due_soon, own_reservation, inactive_reservation):
+            before = loan.return_date
+            loan.refresh_from_db()
+            self.assertEqual(loan.return_date, before + timedelta(days=7))
+            self.assertEqual(loan.renewal_count, 1)
+        for loan in (contested, due_later, at_limit, overdue):
+            before = loan.return_date, loan.renewal_count
+            loan.refresh_from_db()
+            self.assertEqual((loan.return_date, loan.renewal_count), before)
+
+    def test_manual_renewals_count_towards_the_limit(self):
+        loan = self.loan(self.books[0], timedelta(days=1))
+        services.DefaultBorrowingService.renew(loan, extra_days=3)
+        services.DefaultBorrowingService.renew(loan, extra_days=3)
+        loan.refresh_from_db()
+        self.assertEqual(loan.renewal_count, 2)
+        with self.assertRaises(services.BorrowingError):
+            services.DefaultBorrowingService.renew(loan, extra_days=3)
+        self.assertEqual(services.DefaultBorrowingService.auto_renew(within_days=30, now=self.now), 0)
+
+    def test_command_reports_renewed_loans(self):
+        self.loan(self.books[0], timedelta(days=1))
+        out = StringIO()
+        call_command('auto_renew', '--within-days', '2', stdout=out)
+        self.assertIn('Renewed 1 borrowings', out.getvalue())
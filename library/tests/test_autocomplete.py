@@ -0,0 +1,120 @@
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library import autocomplete, trending
+from library.autocomplete import PrefixIndex, normalize
+from library.models import Author, Book
+
+
+def test_normalize_folds_accents_case_and_punctuation():
+    assert normalize('  Ação — e Reação: O LIVRO! ') == 'acao e reacao o livro'
+    assert normalize('Gödel, Escher, Bach') == 'godel escher bach'
+
+
+def test_prefix_index_ranks_matches_by_popularity():
+    ids = [uuid.uuid4() for _ in range(4)]
+    index = PrefixIndex([
+        (ids[0], 'Harry Potter', 5.0),
+        (ids[1], 'Harpsichord Music', 9.0),
+        (ids[2], 'A História do Brasil', 1.0),
+        (ids[3], 'Hardware Basics', 0.0),
+    ])
+
+    assert index.search('har', limit=2) == [(ids[1], 'Harpsichord Music'), (ids[0], 'Harry Potter')]
+    assert index.search('histo') == [(ids[2], 'A História do Brasil')]
+    assert index.search('POTT') == [(ids[0], 'Harry Potter')]
+    assert index.search('') == []
+
+    index.upsert(ids[3], 'Hardware Basics', 20.0)
+    assert index.search('har', limit=1) == [(ids[3], 'Hardware Basics')]
+    index.upsert(ids[0], 'Harry Potter and the Stone')
+    assert [pk for pk, _ in index.search('har')] == [ids[3], ids[1], ids[0]]
+    assert index.search('stone') == [(ids[0], 'Harry Potter and the Stone')]
+
+
+def test_prefix_index_top_n_spans_many_blocks():
+    items = [(i, f'Title {i:05d}', float(i % 1000)) for i in range(5000)]
+    index = PrefixIndex(items)
+
+    top = [pk for pk, _ in index.search('title', limit=5)]
+    assert top == [999, 1999, 2999, 3999, 4999]
+    assert [pk for pk, _ in index.search('title 01', limit=3)] == [1999, 1998, 1997]
+
+
+def test_prefix_index_memo_skips_replaced_objects():
+    items = [(i, f'Title {i:02d}', float(i)) for i in range(autocomplete.MAX_LIMIT + 5)]
+    index = PrefixIndex(items)
+    assert len(index.search('t', limit=autocomplete.MAX_LIMIT)) == autocomplete.MAX_LIMIT
+
+    for pk, _, score in items[-autocomplete.MAX_LIMIT:]:
+        index.upsert(pk, f'Renamed {pk:02d}', score)
+    assert [pk for pk, _ in index.search('t', limit=3)] == [4, 3, 2]
+
+
+class AutocompleteEndpointTests(TestCase):
+    def setUp(self):
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+        self.tolkien = Author.objects.create(name='J. R. R. Tolkien')
+        self.other = Author.objects.create(name='Tolstói')
+        Book.objects.create(title='The Hobbit', author=self.tolkien, ISBN='AC-1', trending_score=3)
+        Book.objects.create(title='The Two Towers', author=self.tolkien, ISBN='AC-2', trending_score=7)
+        Book.objects.create(title='Guerra e Paz', author=self.other, ISBN='AC-3')
+        autocomplete.build()
+
+    def test_suggests_titles_and_authors(self):
+        client = APIClient()
+        data = client.get('/api/v1/library/autocomplete/', {'q': 'tol'}).json()
+        self.assertEqual(data['titles'], [])
+        self.assertEqual([row['name'] for row in data['authors']], ['J. R. R. Tolkien', 'Tolstói'])
+
+        data = client.get('/api/v1/library/autocomplete/', {'q': 'the', 'limit': 1}).json()
+        self.assertEqual([row['title'] for row in data['titles']], ['The Two Towers'])
+
+    def test_picks_up_new_and_renamed_titles_incrementally(self):
+        client = APIClient()
+        client.get('/api/v1/library/autocomplete/', {'q': 'the'})
+
+        Book.objects.create(title='The Silmarillion', author=self.tolkien, ISBN='AC-4', trending_score=10)
+        guerra = Book.objects.get(ISBN='AC-3')
+        guerra.title = 'War and Peace'
+        guerra.save()
+        # Lookups only read memory; the refresher applies the changes.
+        with self.assertNumQueries(0):
+            data = client.get('/api/v1/library/autocomplete/', {'q': 'peac'}).json()
+        self.assertEqual(data['titles'], [])
+        autocomplete.refresh()
+
+        data = client.get('/api/v1/library/autocomplete/', {'q': 'the'}).json()
+        self.assertEqual([row['title'] for row in data['titles']], ['The Silmarillion', 'The Two Towers', 'The Hobbit'])
+        data = client.get('/api/v1/library/autocomplete/', {'q': 'guerra'}).json()
+        self.assertEqual(data['titles'], [])
+        data = client.get('/api/v1/library/autocomplete/', {'q': 'peac'}).json()
+        self.assertEqual([row['title'] for row in data['titles']], ['War and Peace'])
+
+    def test_popularity_changes_reach_the_index(self):
+        client = APIClient()
+        Book.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        hobbit = Book.objects.get(ISBN='AC-1')
+        with mock.patch.object(trending, 'growth', return_value=1.0):
+            trending.record(hobbit, 5)
+        autocomplete.refresh()
+
+        data = client.get('/api/v1/library/autocomplete/', {'q': 'the', 'limit': 1}).json()
+        self.assertEqual([row['title'] for row in data['titles']], ['The Hobbit'])
+
+    def test_first_lookup_starts_the_build_without_waiting_for_it(self):
+        autocomplete.reset()
+        with mock.patch.object(autocomplete, '_start_refresher') as start:
+            data = APIClient().get('/api/v1/library/autocomplete/', {'q': 'the'}).json()
+        self.assertEqual(data, {'titles': [], 'authors': []})
+        start.assert_called_once_with()
+
+    def test_rejects_bad_limit(self):
+        resp = APIClient().get('/api/v1/library/autocomplete/', {'q': 'the', 'limit': 'x'})
+        self.assertEqual(resp.status_code, 400)
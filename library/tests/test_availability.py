@@ -0,0 +1,102 @@
+import asyncio
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from library import availability, services
+from library.availability import AvailabilityHub
+from library.models import Author, Book
+
+User = get_user_model()
+
+STREAM_URL = '/api/v1/library/books/availability/stream/'
+
+
+@override_settings(LIBRARY_AVAILABILITY_SYNC_SECONDS=None)
+class AvailabilityHubTests(SimpleTestCase):
+    async def test_subscribers_get_the_latest_status_of_their_books_only(self):
+        hub = AvailabilityHub()
+        watched, shared, other = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        first = hub.subscribe([watched, shared])
+        second = hub.subscribe([shared])
+
+        # Published from worker threads while nobody is reading: only the latest status is kept.
+        await asyncio.to_thread(hub.publish, {watched: 'borrowed', other: 'borrowed'})
+        await asyncio.to_thread(hub.publish, {watched: 'available', shared: 'reserved'})
+        self.assertEqual(hub.publish({shared: 'reserved'}), 0)
+
+        self.assertEqual(await first.changes(1), {watched: 'available', shared: 'reserved'})
+        self.assertEqual(await second.changes(1), {shared: 'reserved'})
+        self.assertEqual(await first.changes(0.01), {})
+
+        hub.unsubscribe(first)
+        hub.unsubscribe(second)
+        self.assertEqual(hub.count, 0)
+        self.assertEqual(hub.watched([watched, shared, other]), [])
+
+
+@override_settings(LIBRARY_AVAILABILITY_SYNC_SECONDS=None, LIBRARY_AVAILABILITY_HEARTBEAT_SECONDS=0.05)
+class AvailabilityStreamTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name='Stream Author')
+        self.book = Book.objects.create(title='Streamed', author=author, ISBN='ISBN-SSE-1')
+        self.user = User.objects.create_user(username='streamer', email='s@example.com', password='pw')
+
+    def borrow(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return services.DefaultBorrowingService.borrow(self.user, self.book)
+
+    def give_back(self, borrowing):
+        with self.captureOnCommitCallbacks(execute=True):
+            services.DefaultBorrowingService.return_many([borrowing])
+
+    async def test_stream_sends_current_status_changes_and_heartbeats(self):
+        response = await self.async_client.get(STREAM_URL, {'books': str(self.book.pk)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        received = asyncio.Queue()
+
+        async def read():
+            async for chunk in response.streaming_content:
+                await received.put(chunk)
+
+        async def next_events():
+            # Heartbeats may arrive between events while the test thread works.
+            while (chunk := await received.get()) == b': heartbeat\n\n':
+                pass
+            return self.parse(chunk)
+
+        reader = asyncio.create_task(read())
+        self.assertEqual(await received.get(), b'retry: 3000\n\n')
+        self.assertEqual(await next_events(), [{'book': str(self.book.pk), 'status': 'available'}])
+
+        borrowing = await sync_to_async(self.borrow)()
+        self.assertEqual(await next_events(), [{'book': str(self.book.pk), 'status': 'borrowed'}])
+        await sync_to_async(self.give_back)(borrowing)
+        self.assertEqual(await next_events(), [{'book': str(self.book.pk), 'status': 'available'}])
+        self.assertEqual(await received.get(), b': heartbeat\n\n')
+
+        # The server cancels the response task when the client disconnects.
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+        self.assertEqual(availability.hub.count, 0)
+
+    @override_settings(LIBRARY_AVAILABILITY_MAX_BOOKS=1)
+    async def test_rejects_bad_subscriptions(self):
+        response = await self.async_client.get(STREAM_URL, {'books': 'not-an-id'})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(STREAM_URL, {'books': f'{uuid.uuid4()},{uuid.uuid4()}'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_refused_under_wsgi(self):
+        response = self.client.get(STREAM_URL, {'books': str(self.book.pk)})
+        self.assertEqual(response.status_code, 501)
+
+    @staticmethod
+    def parse(chunk):
+        events = chunk.decode().strip().split('\n\n')
+        return [json.loads(event.split('data: ', 1)[1]) for event in events]
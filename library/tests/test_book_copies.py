@@ -0,0 +1,125 @@
+import pytest
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from library import services
+from library.models import Author, Book, BookCopy, Borrowing, Reservation
+from library.serializers import BookSerializer
+
+User = get_user_model()
+
+
+@pytest.fixture
+def title_with_copies():
+    author = Author.objects.create(name='Copies Author')
+    book = Book.objects.create(title='Hot Title', author=author, ISBN='ISBN-COPIES')
+    for i in range(2):
+        BookCopy.objects.create(book=book, barcode=f'BC-{i}', branch='main')
+    return book
+
+
+def _user(name):
+    return User.objects.create_user(username=name, email=f'{name}@example.com', password='pw')
+
+
+@pytest.mark.django_db
+def test_borrow_claims_distinct_copies_until_exhausted(title_with_copies):
+    book = title_with_copies
+    first = services.DefaultBorrowingService.borrow(_user('c1'), book)
+    book.refresh_from_db()
+    assert book.status == Book.STATUS_AVAILABLE
+
+    second = services.DefaultBorrowingService.borrow(_user('c2'), book)
+    assert {first.copy_id, second.copy_id} == set(book.copies.values_list('pk', flat=True))
+    assert not book.copies.filter(status=BookCopy.STATUS_AVAILABLE).exists()
+    book.refresh_from_db()
+    assert book.status == Book.STATUS_BORROWED
+
+    with pytest.raises(services.BookNotAvailable):
+        services.DefaultBorrowingService.borrow(_user('c3'), book)
+
+
+@pytest.mark.django_db
+def test_return_copy_frees_copy_and_restores_book_status(title_with_copies):
+    book = title_with_copies
+    borrowings = [services.DefaultBorrowingService.borrow(_user(f'r{i}'), book) for i in range(2)]
+
+    services.DefaultBorrowingService.return_borrowing(borrowings[0])
+
+    book.refresh_from_db()
+    assert book.status == Book.STATUS_AVAILABLE
+    assert BookCopy.objects.get(pk=borrowings[0].copy_id).status == BookCopy.STATUS_AVAILABLE
+    assert Borrowing.objects.get(pk=borrowings[0].pk).returned
+
+
+@pytest.mark.django_db
+def test_return_copy_hands_same_copy_to_next_reservation(title_with_copies):
+    book = title_with_copies
+    borrowing = services.DefaultBorrowingService.borrow(_user('h1'), book)
+    waiting = _user('h2')
+    Reservation.objects.create(user=waiting, book=book)
+
+    handed = services.DefaultBorrowingService.return_borrowing(borrowing)
+
+    assert handed.user == waiting
+    assert handed.copy_id == borrowing.copy_id
+    assert BookCopy.objects.get(pk=borrowing.copy_id).status == BookCopy.STATUS_BORROWED
+    assert not Reservation.objects.filter(user=waiting, active=True).exists()
+
+
+@pytest.mark.django_db
+def test_book_api_exposes_available_copy_count(title_with_copies):
+    services.DefaultBorrowingService.borrow(_user('api1'), title_with_copies)
+
+    resp = APIClient().get(f'/api/v1/library/books/{title_with_copies.id}/')
+
+    assert resp.status_code == 200
+    assert resp.json()['available_copies'] == 1
+
+
+@pytest.mark.django_db
+def test_available_copy_count_does_not_depend_on_the_annotation(title_with_copies, django_assert_num_queries):
+    services.DefaultBorrowingService.borrow(_user('api2'), title_with_copies)
+
+    assert BookSerializer(Book.objects.get(pk=title_with_copies.pk)).data['available_copies'] == 1
+    annotated = Book.objects.with_available_copies().get(pk=title_with_copies.pk)
+    with django_assert_num_queries(0):
+        assert BookSerializer(annotated, fields=['available_copies']).data['available_copies'] == 1
+
+
+@pytest.fixture
+def shelf():
+    author = Author.objects.create(name='Shelf Author')
+    books = []
+    for i in range(20):
+        book = Book.objects.create(title=f'Shelf {i:02d}', author=author, ISBN=f'SHELF-{i}')
+        BookCopy.objects.create(book=book, barcode=f'SH-{i}', branch='main')
+        books.append(book)
+    return books
+
+
+@pytest.mark.django_db
+def test_book_endpoints_count_copies_in_the_listing_query(shelf, django_assert_num_queries):
+    client = APIClient()
+    with django_assert_num_queries(1):
+        resp = client.post('/api/v1/library/books/bulk/', {'ids': [str(b.pk) for b in shelf], 'full': True}, format='json')
+    assert [row['available_copies'] for row in resp.json()['results']] == [1] * 20
+
+    reader = _user('shelf-reader')
+    for book in shelf[:5]:
+        services.DefaultBorrowingService.borrow(reader, book)
+    # The patron, their open loans, then all the titles at once.
+    with django_assert_num_queries(3):
+        resp = client.get(f'/api/v1/library/users/{reader.pk}/borrowed-books/')
+    assert sorted(row['available_copies'] for row in resp.json()) == [0] * 5
+
+    book = Book.objects.get(pk=shelf[7].pk)
+    book.ISBN = '0-306-40615-2'
+    book.save()
+    with django_assert_num_queries(1):
+        resp = client.get('/api/v1/library/books/by-isbn/9780306406157/')
+    assert resp.json()['available_copies'] == 1
+    with django_assert_num_queries(1):
+        client.post('/api/v1/library/books/by-isbn/', {'isbns': ['0306406152']}, format='json')
+    with django_assert_num_queries(2):
+        client.get(f'/api/v1/library/books/{book.pk}/also-borrowed/')
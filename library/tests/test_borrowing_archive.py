@@ -0,0 +1,75 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library.models import ArchivedBorrowing, Author, Book, Borrowing
+
+User = get_user_model()
+
+
+class BorrowingArchiveTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name='Archive Author')
+        self.books = [Book.objects.create(title=f'Old {i}', author=author, ISBN=f'ISBN-ARCH-{i}') for i in range(4)]
+        self.user = User.objects.create_user(username='archivist', email='a@example.com', password='pw')
+        now = timezone.now()
+
+        def loan(book, borrowed_days_ago, returned):
+            borrow_date = now - timedelta(days=borrowed_days_ago)
+            return Borrowing.objects.create(
+                user=self.user, book=book, borrow_date=borrow_date,
+                return_date=borrow_date + timedelta(days=14), returned=returned,
+            )
+
+        self.ancient = loan(self.books[0], 800, returned=True)
+        self.old = loan(self.books[1], 500, returned=True)
+        self.recent = loan(self.books[2], 20, returned=True)
+        self.open = loan(self.books[3], 3, returned=False)
+
+    def test_command_moves_old_returned_loans_in_chunks(self):
+        out = StringIO()
+        call_command('archive_borrowings', '--older-than-days', '365', '--chunk-size', '1', stdout=out)
+
+        self.assertIn('Archived 2 returned borrowings', out.getvalue())
+        self.assertEqual(set(Borrowing.objects.values_list('pk', flat=True)), {self.recent.pk, self.open.pk})
+        archived = ArchivedBorrowing.objects.get(pk=self.old.pk)
+        self.assertEqual((archived.user_id, archived.book_id), (self.user.pk, self.books[1].pk))
+        self.assertEqual(archived.borrow_date, self.old.borrow_date)
+
+    def test_history_unions_live_and_archived_loans(self):
+        call_command('archive_borrowings', '--older-than-days', '365', stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        rows = client.get('/api/v1/library/borrowings/history/').json()['results']
+        self.assertEqual([row['id'] for row in rows], [str(b.pk) for b in (self.open, self.recent, self.old, self.ancient)])
+        self.assertEqual([row['archived'] for row in rows], [False, False, True, True])
+        self.assertEqual([row['returned'] for row in rows], [False, True, True, True])
+
+        since = (timezone.now() - timedelta(days=600)).date().isoformat()
+        until = (timezone.now() - timedelta(days=100)).date().isoformat()
+        rows = client.get('/api/v1/library/borrowings/history/', {'from': since, 'to': until}).json()['results']
+        self.assertEqual([row['id'] for row in rows], [str(self.old.pk)])
+
+        recent = (timezone.now() - timedelta(days=30)).date().isoformat()
+        rows = client.get('/api/v1/library/borrowings/history/', {'from': recent}).json()['results']
+        self.assertEqual([row['archived'] for row in rows], [False, False])
+
+    def test_history_rejects_bad_dates(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        resp = client.get('/api/v1/library/borrowings/history/', {'from': 'yesterday'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_staff_history_of_another_user_needs_a_numeric_id(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='desk', password='pw', is_staff=True))
+        rows = client.get('/api/v1/library/borrowings/history/', {'user_id': self.user.pk}).json()['results']
+        self.assertEqual(len(rows), 4)
+        resp = client.get('/api/v1/library/borrowings/history/', {'user_id': 'abc'})
+        self.assertEqual(resp.status_code, 400)
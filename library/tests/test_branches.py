@@ -0,0 +1,191 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import ProtectedError
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library import routers, services
+from library.models import Author, Book, BookCopy, Borrowing, Branch, Reservation
+
+User = get_user_model()
+
+NORTH_DB = 'branch_north'
+
+BRANCH_DATABASES = {'north': NORTH_DB}
+DATABASES = [DEFAULT_DB_ALIAS, NORTH_DB]
+
+
+@pytest.fixture(scope='module', autouse=True)
+def north_database(django_db_setup, django_db_blocker):
+    """A second in-memory SQLite database standing in for the north branch's own.
+
+    It exists only while this module runs; the alias is removed again so
+    later tests see the configured databases unchanged.
+    """
+    default = connections.settings[DEFAULT_DB_ALIAS]
+    connections.settings[NORTH_DB] = {**default, 'NAME': '', 'TEST': {**default['TEST'], 'NAME': None}}
+    connection = connections[NORTH_DB]
+    with django_db_blocker.unblock():
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield NORTH_DB
+    finally:
+        with django_db_blocker.unblock():
+            connection.creation.destroy_test_db('', verbosity=0)
+        del connections[NORTH_DB]
+        del connections.settings[NORTH_DB]
+
+
+@pytest.fixture
+def catalog():
+    north = Branch.objects.create(code='north', name='North')
+    south = Branch.objects.create(code='south', name='South')
+    author = Author.objects.create(name='Branch Author')
+    return {
+        'north': Book.objects.create(title='North book', author=author, ISBN='BR-N', branch=north),
+        'north2': Book.objects.create(title='North book 2', author=author, ISBN='BR-N2', branch=north),
+        'south': Book.objects.create(title='South book', author=author, ISBN='BR-S', branch=south),
+    }
+
+
+@pytest.fixture
+def reader():
+    return User.objects.create_user(username='branchy', email='branchy@example.com', password='pw')
+
+
+@pytest.mark.django_db(databases=DATABASES)
+def test_without_branch_databases_everything_stays_in_default(catalog, reader):
+    borrowing = services.borrow_book(reader, catalog['north'])
+
+    assert borrowing.branch_id == 'north'
+    assert Borrowing.objects.using(DEFAULT_DB_ALIAS).filter(branch_id='north').count() == 1
+    assert not Borrowing.objects.using(NORTH_DB).exists()
+
+
+@pytest.mark.django_db(databases=DATABASES)
+@override_settings(LIBRARY_BRANCH_DATABASES=BRANCH_DATABASES)
+def test_circulation_rows_are_written_to_the_branch_database(catalog, reader):
+    loan = services.borrow_book(reader, catalog['north'])
+    other = User.objects.create_user(username='waiting', email='w@example.com', password='pw')
+    services.reserve_book(other, catalog['north'])
+
+    assert Borrowing.objects.using(NORTH_DB).filter(pk=loan.pk).exists()
+    assert not Borrowing.objects.using(DEFAULT_DB_ALIAS).exists()
+    assert Reservation.objects.using(NORTH_DB).filter(user=other, branch_id='north').exists()
+    catalog['north'].refresh_from_db()
+    assert catalog['north'].status == Book.STATUS_BORROWED
+
+    handed_off = services.return_book(loan)
+    assert handed_off.user_id == other.pk
+    assert handed_off._state.db == NORTH_DB
+    assert Borrowing.objects.using(NORTH_DB).get(pk=loan.pk).returned
+
+
+@pytest.mark.django_db(databases=DATABASES)
+@override_settings(LIBRARY_BRANCH_DATABASES=BRANCH_DATABASES)
+def test_active_loan_limit_counts_every_branch(catalog, reader):
+    author = catalog['north'].author
+    for i in range(3):
+        services.borrow_book(reader, Book.objects.create(title=f'N{i}', author=author, ISBN=f'BR-N-{i}', branch_id='north'))
+    for i in range(2):
+        services.borrow_book(reader, Book.objects.create(title=f'D{i}', author=author, ISBN=f'BR-D-{i}'))
+
+    with pytest.raises(services.MaxActiveBorrowingsExceeded):
+        services.borrow_book(reader, catalog['south'])
+
+
+@pytest.mark.django_db(databases=DATABASES)
+@override_settings(LIBRARY_BRANCH_DATABASES=BRANCH_DATABASES)
+def test_fan_out_merges_and_paginates_across_databases(catalog, reader):
+    now = timezone.now()
+    books = [catalog['north'], catalog['south'], catalog['north2']]
+    for i, book in enumerate(books):
+        with routers.use_database(routers.circulation_alias(book)):
+            Borrowing.objects.create(
+                user=reader, book=book, branch_id=book.branch_id,
+                borrow_date=now - timedelta(days=i), return_date=now + timedelta(days=10),
+            )
+
+    merged = routers.fan_out(Borrowing.objects.select_related('book').order_by('-borrow_date'))
+    assert merged.count() == 3
+    assert [b.book.title for b in merged[0:2]] == ['North book', 'South book']
+    assert [b.book.title for b in merged[2:]] == ['North book 2']
+    assert merged.get(book=catalog['south'])._state.db == DEFAULT_DB_ALIAS
+
+
+@pytest.mark.django_db(databases=DATABASES)
+@override_settings(LIBRARY_BRANCH_DATABASES=BRANCH_DATABASES)
+def test_api_lists_all_branches_or_one_and_returns_across_databases(catalog, reader):
+    client = APIClient()
+    client.force_authenticate(reader)
+    north_loan = client.post('/api/v1/library/borrowings/', {'book': str(catalog['north'].pk)}, format='json').json()
+    client.post('/api/v1/library/borrowings/', {'book': str(catalog['south'].pk)}, format='json')
+
+    listed = client.get('/api/v1/library/borrowings/').json()
+    assert listed['count'] == 2
+    assert {row['branch'] for row in listed['results']} == {'north', 'south'}
+
+    north_only = client.get('/api/v1/library/borrowings/', {'branch': 'north'}).json()
+    assert [row['id'] for row in north_only['results']] == [north_loan['id']]
+
+    resp = client.post(f"/api/v1/library/borrowings/{north_loan['id']}/return/")
+    assert resp.status_code == 200
+    assert Borrowing.objects.using(NORTH_DB).get(pk=north_loan['id']).returned
+
+
+def _foreign_keys(alias, table):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return {tuple(info['columns']) for info in constraints.values() if info['foreign_key']}
+
+
+@pytest.mark.django_db(databases=DATABASES)
+def test_catalog_references_are_constraints_in_default_only():
+    assert {('book_id',), ('user_id',), ('copy_id',), ('branch_id',)} <= _foreign_keys(
+        DEFAULT_DB_ALIAS, Borrowing._meta.db_table
+    )
+    assert _foreign_keys(NORTH_DB, Borrowing._meta.db_table) == set()
+    assert _foreign_keys(NORTH_DB, Reservation._meta.db_table) == set()
+
+
+@pytest.mark.django_db(databases=DATABASES)
+def test_branch_databases_need_no_new_migrations():
+    field = Borrowing._meta.get_field('book')
+    declared = field.deconstruct()
+    routers.migration_started(sender=None, using=NORTH_DB)
+    try:
+        assert not field.db_constraint
+        assert field.deconstruct() == declared
+        call_command('makemigrations', 'library', '--check', '--dry-run', stdout=StringIO())
+    finally:
+        routers.migration_finished(sender=None, using=NORTH_DB)
+
+
+@pytest.mark.django_db(databases=DATABASES)
+@override_settings(LIBRARY_BRANCH_DATABASES=BRANCH_DATABASES)
+def test_deletes_apply_on_delete_rules_in_branch_databases(catalog, reader):
+    copy = BookCopy.objects.create(book=catalog['north2'], barcode='BR-N2-1')
+    services.borrow_book(reader, catalog['north'])
+    kept = services.borrow_book(reader, catalog['north2'])
+    other = User.objects.create_user(username='queued', email='q@example.com', password='pw')
+    services.reserve_book(other, catalog['north'])
+    assert kept.copy_id == copy.pk
+
+    catalog['north'].delete()
+    assert list(Borrowing.objects.using(NORTH_DB).values_list('pk', flat=True)) == [kept.pk]
+    assert not Reservation.objects.using(NORTH_DB).exists()
+
+    copy.delete()
+    assert Borrowing.objects.using(NORTH_DB).get(pk=kept.pk).copy_id is None
+
+    with pytest.raises(ProtectedError), transaction.atomic():
+        Branch.objects.get(code='north').delete()
+    reader.delete()
+    assert not Borrowing.objects.using(NORTH_DB).exists()
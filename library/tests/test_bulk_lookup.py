@@ -0,0 +1,78 @@
+import uuid
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from library.models import Author, Book
+
+URL = '/api/v1/library/books/bulk/'
+
+
+@pytest.fixture
+def books():
+    author = Author.objects.create(name='Bulk Author')
+    return [
+        Book.objects.create(title=f'Bulk {i}', author=author, ISBN=f'BULK-{i}', book_description='long text')
+        for i in range(5)
+    ]
+
+
+@pytest.mark.django_db
+def test_bulk_lookup_by_ids_and_isbns_returns_compact_records(books):
+    client = APIClient()
+    unknown = str(uuid.uuid4())
+    payload = {
+        'ids': [str(books[0].id), str(books[1].id), unknown, 'not-a-uuid'],
+        'isbns': ['BULK-2', 'BULK-0', 'NOPE'],
+    }
+    resp = client.post(URL, payload, format='json')
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [r['ISBN'] for r in data['results']] == ['BULK-0', 'BULK-1', 'BULK-2']
+    assert set(data['results'][0]) == {'id', 'ISBN', 'status', 'title'}
+    assert data['missing'] == {'ids': ['not-a-uuid', unknown], 'isbns': ['NOPE']}
+
+
+@pytest.mark.django_db
+def test_bulk_lookup_full_shape_uses_book_serializer(books):
+    client = APIClient()
+    resp = client.post(URL, {'isbns': ['BULK-3'], 'full': True}, format='json')
+
+    assert resp.status_code == 200
+    record = resp.json()['results'][0]
+    assert record['author']['name'] == 'Bulk Author'
+    assert record['book_description'] == 'long text'
+
+
+@pytest.mark.django_db
+def test_bulk_lookup_uses_one_query_per_chunk(books, monkeypatch):
+    from library import views
+
+    monkeypatch.setattr(views, 'BULK_LOOKUP_CHUNK_SIZE', 2)
+    client = APIClient()
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.post(URL, {'ids': [str(b.id) for b in books]}, format='json')
+
+    assert resp.status_code == 200
+    assert len(resp.json()['results']) == 5
+    assert len(ctx.captured_queries) == 3
+
+
+@pytest.mark.django_db
+def test_bulk_lookup_rejects_oversized_requests(monkeypatch):
+    from library import views
+
+    monkeypatch.setattr(views, 'BULK_LOOKUP_MAX_ITEMS', 2)
+    resp = APIClient().post(URL, {'isbns': ['a', 'b', 'c']}, format='json')
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', [URL, '/api/v1/library/books/by-isbn/'])
+@pytest.mark.parametrize('body', [['BULK-1'], 'BULK-1', 42])
+def test_lookups_reject_bodies_that_are_not_objects(url, body):
+    resp = APIClient().post(url, body, format='json')
+    assert resp.status_code == 400
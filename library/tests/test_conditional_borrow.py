@@ -0,0 +1,141 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import OperationalError
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from library import services
+from library.models import Author, Book, BookCopy, Borrowing, Reservation
+from library.views import BorrowingViewSet
+
+User = get_user_model()
+
+
+@pytest.fixture
+def service():
+    svc = services.ConditionalUpdateBorrowingService()
+    svc.backoff_base = 0
+    return svc
+
+
+@pytest.fixture
+def book():
+    author = Author.objects.create(name='Cond Author')
+    return Book.objects.create(title='Cond Book', author=author, ISBN='ISBN-COND')
+
+
+def _user(name):
+    return User.objects.create_user(username=name, email=f'{name}@example.com', password='pw')
+
+
+@pytest.mark.django_db
+def test_conditional_borrow_claims_book_once(service, book):
+    borrowing = service.borrow(_user('cb1'), book)
+
+    assert borrowing.book_id == book.pk
+    assert book.status == Book.STATUS_BORROWED
+    assert Book.objects.get(pk=book.pk).status == Book.STATUS_BORROWED
+    with pytest.raises(services.BookNotAvailable):
+        service.borrow(_user('cb2'), Book.objects.get(pk=book.pk))
+
+
+@pytest.mark.django_db
+def test_conditional_borrow_uses_copies_when_present(service, book):
+    BookCopy.objects.create(book=book, barcode='COND-1')
+
+    borrowing = service.borrow(_user('cc1'), book)
+
+    assert borrowing.copy is not None
+    assert Book.objects.get(pk=book.pk).status == Book.STATUS_BORROWED
+
+
+@pytest.mark.django_db
+def test_conditional_return_frees_book_or_hands_off(service, book):
+    borrowing = service.borrow(_user('cr1'), book)
+    waiting = _user('cr2')
+    Reservation.objects.create(user=waiting, book=book)
+
+    handed = service.return_borrowing(borrowing)
+    assert handed.user == waiting
+    assert Book.objects.get(pk=book.pk).status == Book.STATUS_BORROWED
+
+    service.return_borrowing(handed)
+    assert Book.objects.get(pk=book.pk).status == Book.STATUS_AVAILABLE
+    assert service.return_borrowing(handed).returned
+
+
+@pytest.mark.django_db
+def test_conditional_borrow_retries_lock_errors(service, book, monkeypatch):
+    calls = {'n': 0}
+    original = service._claim_and_create
+
+    def flaky(*args, **kwargs):
+        calls['n'] += 1
+        if calls['n'] < 3:
+            raise OperationalError('database is locked')
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(service, '_claim_and_create', flaky)
+    borrowing = service.borrow(_user('rt1'), book)
+
+    assert calls['n'] == 3
+    assert Borrowing.objects.filter(pk=borrowing.pk).exists()
+
+
+@pytest.mark.django_db
+def test_conditional_borrow_gives_up_after_max_attempts(service, book, monkeypatch):
+    def locked(*args, **kwargs):
+        raise OperationalError('database is locked')
+
+    monkeypatch.setattr(service, '_claim_and_create', locked)
+    with pytest.raises(OperationalError):
+        service.borrow(_user('rt2'), book)
+
+
+@pytest.mark.django_db
+def test_viewset_uses_injected_service(service, book, monkeypatch):
+    calls = []
+    borrow = service.borrow
+    monkeypatch.setattr(service, 'borrow', lambda *args, **kwargs: calls.append('borrow') or borrow(*args, **kwargs))
+    create = BorrowingViewSet.as_view({'post': 'create'}, borrowing_service=service)
+    give_back = BorrowingViewSet.as_view({'post': 'do_return'}, borrowing_service=service)
+    user = _user('inj0')
+    factory = APIRequestFactory()
+
+    request = factory.post('/api/v1/library/borrowings/', {'book': str(book.id)}, format='json')
+    force_authenticate(request, user)
+    resp = create(request)
+    assert resp.status_code == 201
+    assert calls == ['borrow']
+
+    request = factory.post(f'/api/v1/library/borrowings/{resp.data["id"]}/return/')
+    force_authenticate(request, user)
+    assert give_back(request, pk=resp.data['id']).status_code == 200
+    assert Book.objects.get(pk=book.pk).status == Book.STATUS_AVAILABLE
+
+
+@pytest.mark.django_db
+def test_viewsets_use_the_configured_service(book, monkeypatch, settings):
+    calls = []
+    for name in ('borrow', 'return_borrowing', 'reserve'):
+        method = getattr(services.ConditionalBorrowingService, name)
+        monkeypatch.setattr(
+            services.ConditionalBorrowingService, name,
+            lambda *args, _name=name, _method=method, **kwargs: calls.append(_name) or _method(*args, **kwargs),
+        )
+    # Resolved per request, so the setting may change after import.
+    settings.LIBRARY_BORROWING_SERVICE = 'library.services.ConditionalBorrowingService'
+    user = _user('inj1')
+    client = APIClient()
+    client.force_authenticate(user)
+
+    resp = client.post('/api/v1/library/borrowings/', {'book': str(book.id)}, format='json')
+    assert resp.status_code == 201
+    borrowing_id = resp.json()['id']
+
+    resp = client.post(f'/api/v1/library/borrowings/{borrowing_id}/return/')
+    assert resp.status_code == 200
+    assert Book.objects.get(pk=book.pk).status == Book.STATUS_AVAILABLE
+
+    resp = client.post('/api/v1/library/reservations/', {'book': str(book.id)}, format='json')
+    assert resp.status_code == 201
+    assert calls == ['borrow', 'return_borrowing', 'reserve']
@@ -0,0 +1,104 @@
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from library import isbn
+from library.dataset import DatasetGenerator
+from library.models import Author, Book, Borrowing, Reservation
+
+User = get_user_model()
+
+NOW = datetime(2026, 3, 1, 12, tzinfo=dt_timezone.utc)
+
+
+def generate(**options):
+    options = {
+        'seed': 7, 'authors': 20, 'books': 200, 'users': 50, 'borrowings': 2000, 'open_ratio': 0.05,
+        'overdue_ratio': 0.5, 'mean_queue': 2, 'chunk_size': 300, 'now': NOW, **options,
+    }
+    return DatasetGenerator(**options).run()
+
+
+def snapshot():
+    return {
+        'books': list(Book.objects.order_by('id').values_list('id', 'title', 'isbn13', 'status', 'trending_score')),
+        'loans': list(
+            Borrowing.objects.order_by('id').values_list('id', 'book_id', 'borrow_date', 'return_date', 'returned')
+        ),
+        'queues': list(Reservation.objects.order_by('id').values_list('id', 'book_id', 'created_at')),
+    }
+
+
+class GenerateDatasetTests(TestCase):
+    def test_rows_follow_the_requested_shape(self):
+        generate(branches=['main', 'north'])
+
+        self.assertEqual(Author.objects.count(), 20)
+        self.assertEqual(User.objects.filter(username__startswith='dataset-').count(), 50)
+        self.assertEqual(Borrowing.objects.count(), 2000)
+        open_loans = Borrowing.objects.filter(returned=False)
+        self.assertEqual(open_loans.count(), 100)
+        self.assertEqual(open_loans.values('book').distinct().count(), 100)
+        self.assertEqual(Book.objects.filter(status=Book.STATUS_BORROWED).count(), 100)
+        self.assertTrue(0.3 < open_loans.filter(return_date__lt=NOW).count() / 100 < 0.7)
+        self.assertTrue(Reservation.objects.exists())
+        self.assertFalse(Reservation.objects.exclude(book__status=Book.STATUS_BORROWED).exists())
+
+        book = Book.objects.order_by('-trending_score').first()
+        self.assertEqual(book.isbn13, isbn.to_isbn13(book.ISBN))
+        self.assertGreater(book.borrowings.count(), Borrowing.objects.count() / Book.objects.count())
+        self.assertFalse(Borrowing.objects.exclude(branch_id__in=['main', 'north']).exists())
+
+    def test_same_seed_gives_same_rows_with_either_writer(self):
+        indexes = set(self._indexes())
+        generate(raw=True)
+        first = snapshot()
+        self.assertEqual(set(self._indexes()), indexes)
+
+        Borrowing.objects.all().delete()
+        Reservation.objects.all().delete()
+        Book.objects.all().delete()
+        Author.objects.all().delete()
+        User.objects.all().delete()
+        generate()
+        second = snapshot()
+
+        self.assertEqual(first['books'], second['books'])
+        self.assertEqual(first['loans'], second['loans'])
+        self.assertEqual([row[:2] for row in first['queues']], [row[:2] for row in second['queues']])
+
+    def test_command_reports_throughput_and_refuses_reused_label(self):
+        out = StringIO()
+        call_command(
+            'generate_dataset', '--books', '50', '--authors', '5', '--users', '10', '--borrowings', '300', '--raw',
+            stdout=out,
+        )
+        self.assertIn('Generated', out.getvalue())
+        self.assertIn('300 borrowings', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', '--books', '5', stdout=StringIO())
+        call_command(
+            'generate_dataset', '--books', '50', '--authors', '5', '--users', '10', '--borrowings', '300', '--raw',
+            '--label', 'other', stdout=StringIO(),
+        )
+        self.assertEqual(Book.objects.count(), 100)
+        self.assertEqual(Borrowing.objects.count(), 600)
+
+    def test_failed_run_leaves_nothing_behind(self):
+        generator = DatasetGenerator(books=20, authors=5, users=10, borrowings=100, now=NOW)
+        with mock.patch.object(generator, 'write_books', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                generator.run()
+        self.assertFalse(Borrowing.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith='dataset-').exists())
+
+    @staticmethod
+    def _indexes():
+        with connection.cursor() as cursor:
+            return connection.introspection.get_constraints(cursor, Borrowing._meta.db_table)
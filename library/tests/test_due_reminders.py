@@ -0,0 +1,67 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from library.models import Author, Book, Borrowing
+
+User = get_user_model()
+
+
+class SendDueRemindersTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name='Reminder Author')
+        self.books = [Book.objects.create(title=f'Due {i}', author=author, ISBN=f'ISBN-DUE-{i}') for i in range(5)]
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        now = timezone.now()
+
+        def loan(user, book, due, returned=False):
+            return Borrowing.objects.create(
+                user=user, book=book, borrow_date=due - timedelta(days=14), return_date=due, returned=returned,
+            )
+
+        self.soon = loan(self.alice, self.books[0], now + timedelta(days=1))
+        self.overdue = loan(self.alice, self.books[1], now - timedelta(days=2))
+        self.later = loan(self.alice, self.books[2], now + timedelta(days=10))
+        self.returned = loan(self.bob, self.books[3], now - timedelta(days=1), returned=True)
+        self.bob_due = loan(self.bob, self.books[4], now + timedelta(hours=5))
+
+    def test_groups_loans_per_user_and_marks_them(self):
+        out = StringIO()
+        call_command('send_due_reminders', '--days', '3', '--chunk-size', '2', stdout=out)
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['alice@example.com', 'bob@example.com'])
+        alice_mail = next(m for m in mail.outbox if m.to == ['alice@example.com'])
+        self.assertIn('Due 0: due on', alice_mail.body)
+        self.assertIn('Due 1: overdue since', alice_mail.body)
+        self.assertNotIn('Due 2', alice_mail.body)
+        self.assertIn('Reminded 2 users about 3 loans', out.getvalue())
+
+        reminded = set(Borrowing.objects.filter(last_reminded_at__isnull=False).values_list('pk', flat=True))
+        self.assertEqual(reminded, {self.soon.pk, self.overdue.pk, self.bob_due.pk})
+
+    def test_patron_with_more_due_loans_than_a_chunk_gets_all_of_them(self):
+        call_command('send_due_reminders', '--days', '3', '--chunk-size', '1', stdout=StringIO())
+
+        alice_mail = next(m for m in mail.outbox if m.to == ['alice@example.com'])
+        self.assertLess(alice_mail.body.index('Due 1: overdue since'), alice_mail.body.index('Due 0: due on'))
+        self.assertEqual(Borrowing.objects.filter(last_reminded_at__isnull=False).count(), 3)
+
+    def test_rerun_on_same_day_sends_nothing(self):
+        call_command('send_due_reminders', stdout=StringIO())
+        mail.outbox.clear()
+
+        out = StringIO()
+        call_command('send_due_reminders', stdout=out)
+        self.assertEqual(mail.outbox, [])
+        self.assertIn('Reminded 0 users', out.getvalue())
+
+    def test_dry_run_does_not_send_or_mark(self):
+        call_command('send_due_reminders', '--dry-run', stdout=StringIO())
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(Borrowing.objects.filter(last_reminded_at__isnull=False).exists())
@@ -0,0 +1,110 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library import fines, services
+from library.models import Author, Book, Borrowing, FineLedger, PatronBalance
+
+User = get_user_model()
+
+
+@override_settings(LIBRARY_FINE_DAILY_RATE='0.50', LIBRARY_FINE_CAP='3.00')
+class FineTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        author = Author.objects.create(name='Fine Author')
+        self.users = [
+            User.objects.create_user(username=f'fined{i}', email=f'f{i}@example.com', password='pw') for i in range(2)
+        ]
+        self.books = [
+            Book.objects.create(title=f'Fine {i}', author=author, ISBN=f'ISBN-FN-{i}', status=Book.STATUS_BORROWED)
+            for i in range(5)
+        ]
+
+    def loan(self, book, days_late, user=None):
+        due = timezone.make_aware(datetime.combine(self.today - timedelta(days=days_late), time(12)))
+        return Borrowing.objects.create(
+            user=user or self.users[0], book=book, borrow_date=due - timedelta(days=14), return_date=due,
+        )
+
+    def test_accrual_charges_each_day_once_up_to_the_cap(self):
+        self.loan(self.books[0], 2)
+        self.loan(self.books[1], 10)
+        self.loan(self.books[2], 3, user=self.users[1])
+        self.loan(self.books[3], 0)
+        returned = self.loan(self.books[4], 4)
+        Borrowing.objects.filter(pk=returned.pk).update(returned=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(fines.accrue(chunk_size=2), (3, Decimal('5.50')))
+        # Per chunk: one SELECT, then the loan lock, recheck, ledger insert, balance upsert and UPDATE in a savepoint.
+        self.assertLessEqual(len(queries), 17)
+        self.assertEqual(fines.balance(self.users[0]), Decimal('4.00'))
+        self.assertEqual(fines.balance(self.users[1]), Decimal('1.50'))
+
+        self.assertEqual(fines.accrue(), (0, Decimal('0')))
+        # Skipping a day is caught up: every loan under the cap is charged for both days.
+        self.assertEqual(fines.accrue(self.today + timedelta(days=2)), (3, Decimal('3.00')))
+        self.assertEqual(fines.balance(self.users[0]), Decimal('6.00'))
+        self.assertEqual(fines.balance(self.users[1]), Decimal('2.50'))
+        self.assertEqual(
+            PatronBalance.objects.get(user=self.users[0]).balance,
+            sum(FineLedger.objects.filter(user=self.users[0]).values_list('amount', flat=True)),
+        )
+
+    def test_return_settles_the_fine_with_either_service(self):
+        for service, book in ((services.DefaultBorrowingService, self.books[0]),
+                              (services.ConditionalBorrowingService, self.books[1])):
+            with self.subTest(service=type(service).__name__):
+                borrowing = self.loan(book, 3)
+                fines.accrue(self.today - timedelta(days=1))
+                with self.captureOnCommitCallbacks(execute=True):
+                    service.return_borrowing(borrowing)
+                entries = FineLedger.objects.filter(borrowing=borrowing)
+                self.assertEqual(sum(entries.values_list('amount', flat=True)), Decimal('1.50'))
+                self.assertFalse(entries.filter(closed=False).exists())
+        self.assertEqual(fines.balance(self.users[0]), Decimal('3.00'))
+        self.assertEqual(fines.accrue(self.today + timedelta(days=5)), (0, Decimal('0')))
+
+    def test_loans_settled_after_the_chunk_was_read_are_not_charged_twice(self):
+        settled = self.loan(self.books[0], 2)
+        pending = self.loan(self.books[1], 2)
+        entries = [
+            FineLedger(borrowing_id=loan.pk, user_id=loan.user_id, accrued_on=self.today, amount=Decimal('1.00'))
+            for loan in (settled, pending)
+        ]
+        fines.settle([settled.pk])
+
+        self.assertEqual([entry.borrowing_id for entry in fines._claim(entries, self.today)], [pending.pk])
+        self.assertEqual(fines.accrue(), (1, Decimal('1.00')))
+        self.assertEqual(fines.balance(self.users[0]), Decimal('2.00'))
+
+    def test_command_and_balance_endpoint(self):
+        self.loan(self.books[0], 1)
+        out = StringIO()
+        call_command('accrue_fines', stdout=out)
+        self.assertIn('Charged 0.50 in fines over 1 borrowings', out.getvalue())
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.get('/api/v1/library/borrowings/fines/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['balance'], '0.50')
+        response = client.get('/api/v1/library/borrowings/fines/', {'user_id': self.users[1].pk})
+        self.assertEqual(response.data['balance'], '0.50')
+
+        self.users[1].is_staff = True
+        self.users[1].save()
+        client.force_authenticate(self.users[1])
+        response = client.get('/api/v1/library/borrowings/fines/', {'user_id': self.users[0].pk})
+        self.assertEqual(response.data, {'user_id': self.users[0].pk, 'balance': '0.50'})
+        response = client.get('/api/v1/library/borrowings/fines/', {'user_id': 'me'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,109 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from library import services
+from library.models import ArchivedReservation, Author, Book, BookCopy, Borrowing, Reservation
+
+User = get_user_model()
+
+
+@override_settings(LIBRARY_HOLD_PICKUP_DAYS=2)
+class HoldShelfTests(TestCase):
+    def setUp(self):
+        self.service = services.BorrowingService()
+        author = Author.objects.create(name='Hold Author')
+        self.book = Book.objects.create(title='Held', author=author, ISBN='ISBN-HOLD')
+        self.users = [
+            User.objects.create_user(username=f'hold{i}', email=f'hold{i}@example.com', password='pw')
+            for i in range(3)
+        ]
+
+    def _expire(self, reservation):
+        Reservation.objects.filter(pk=reservation.pk).update(pickup_deadline=timezone.now() - timedelta(minutes=1))
+
+    def test_return_puts_item_on_hold_shelf_for_next_reservation(self):
+        borrowing = self.service.borrow(self.users[0], self.book)
+        reservation = Reservation.objects.create(user=self.users[1], book=self.book)
+
+        result = self.service.return_borrowing(borrowing)
+
+        self.assertEqual(result.pk, borrowing.pk)
+        reservation.refresh_from_db()
+        self.assertTrue(reservation.on_hold_shelf)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).status, Book.STATUS_RESERVED)
+        self.assertFalse(Borrowing.objects.filter(user=self.users[1]).exists())
+
+    def test_only_holder_can_pick_up(self):
+        borrowing = self.service.borrow(self.users[0], self.book)
+        reservation = Reservation.objects.create(user=self.users[1], book=self.book)
+        self.service.return_borrowing(borrowing)
+        book = Book.objects.get(pk=self.book.pk)
+
+        with self.assertRaises(services.BookNotAvailable):
+            self.service.borrow(self.users[2], book)
+
+        loan = self.service.borrow(self.users[1], book)
+        self.assertEqual(loan.user, self.users[1])
+        self.assertEqual(Book.objects.get(pk=self.book.pk).status, Book.STATUS_BORROWED)
+        self.assertFalse(Reservation.objects.get(pk=reservation.pk).active)
+
+    def test_sweep_expires_missed_pickup_and_advances_queue(self):
+        borrowing = self.service.borrow(self.users[0], self.book)
+        first = Reservation.objects.create(user=self.users[1], book=self.book)
+        second = Reservation.objects.create(user=self.users[2], book=self.book)
+        self.service.return_borrowing(borrowing)
+        self._expire(first)
+
+        out = StringIO()
+        call_command('expire_holds', stdout=out)
+
+        self.assertIn('Expired 1 holds; 1 reservations', out.getvalue())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(first.expired)
+        self.assertFalse(first.active)
+        self.assertTrue(second.on_hold_shelf)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).status, Book.STATUS_RESERVED)
+
+    def test_sweep_releases_items_with_empty_queue(self):
+        copy = BookCopy.objects.create(book=self.book, barcode='HOLD-C1')
+        single_author = self.book.author
+        single = Book.objects.create(title='Single', author=single_author, ISBN='ISBN-HOLD-2')
+
+        copy_loan = self.service.borrow(self.users[0], self.book)
+        single_loan = self.service.borrow(self.users[0], single)
+        copy_hold = Reservation.objects.create(user=self.users[1], book=self.book)
+        single_hold = Reservation.objects.create(user=self.users[1], book=single)
+        self.service.return_borrowing(copy_loan)
+        self.service.return_borrowing(single_loan)
+        self.assertEqual(BookCopy.objects.get(pk=copy.pk).status, BookCopy.STATUS_RESERVED)
+        self._expire(copy_hold)
+        self._expire(single_hold)
+
+        self.assertEqual(self.service.expire_holds(), (2, 0))
+
+        self.assertEqual(BookCopy.objects.get(pk=copy.pk).status, BookCopy.STATUS_AVAILABLE)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).status, Book.STATUS_AVAILABLE)
+        self.assertEqual(Book.objects.get(pk=single.pk).status, Book.STATUS_AVAILABLE)
+
+
+class PurgeReservationsTests(TestCase):
+    def test_archives_only_old_closed_reservations(self):
+        user = User.objects.create_user(username='purge', email='purge@example.com', password='pw')
+        book = Book.objects.create(title='P', author=Author.objects.create(name='P'), ISBN='ISBN-PURGE')
+        old = Reservation.objects.create(user=user, book=book, active=False)
+        recent = Reservation.objects.create(user=user, book=book, active=False)
+        waiting = Reservation.objects.create(user=user, book=book)
+        Reservation.objects.filter(pk__in=[old.pk, waiting.pk]).update(updated_at=timezone.now() - timedelta(days=60))
+
+        out = StringIO()
+        call_command('purge_reservations', '--older-than-days', '30', '--chunk-size', '1', stdout=out)
+
+        self.assertIn('Archived 1', out.getvalue())
+        self.assertEqual(set(Reservation.objects.values_list('pk', flat=True)), {recent.pk, waiting.pk})
+        self.assertEqual(ArchivedReservation.objects.get().pk, old.pk)
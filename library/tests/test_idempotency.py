@@ -0,0 +1,137 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core import idempotency
+from core.models import IdempotencyKey
+from library.models import Author, Book, Borrowing, Reservation
+
+User = get_user_model()
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='idem', email='idem@example.com', password='pass')
+        self.client.force_authenticate(self.user)
+        author = Author.objects.create(name='Idem Author')
+        self.book = Book.objects.create(title='Idem Book', author=author, ISBN='ISBN-IDEM')
+
+    def _borrow(self, key, book=None):
+        book = book or self.book
+        return self.client.post(
+            '/api/v1/library/borrowings/', {'book': str(book.id), 'days': 7}, format='json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_duplicate_borrow_is_replayed(self):
+        first = self._borrow('k-1')
+        second = self._borrow('k-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Borrowing.objects.filter(user=self.user).count(), 1)
+
+    def test_duplicate_return_and_reservation_are_replayed(self):
+        borrowing_id = self._borrow('k-2').json()['id']
+        url = f'/api/v1/library/borrowings/{borrowing_id}/return/'
+        first = self.client.post(url, HTTP_IDEMPOTENCY_KEY='ret-1')
+        second = self.client.post(url, HTTP_IDEMPOTENCY_KEY='ret-1')
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+
+        payload = {'book': str(self.book.id)}
+        self.client.post('/api/v1/library/reservations/', payload, format='json', HTTP_IDEMPOTENCY_KEY='res-1')
+        again = self.client.post('/api/v1/library/reservations/', payload, format='json', HTTP_IDEMPOTENCY_KEY='res-1')
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(Reservation.objects.filter(user=self.user).count(), 1)
+
+    def test_reused_key_with_different_body_is_rejected(self):
+        other = Book.objects.create(title='Other', author=self.book.author, ISBN='ISBN-IDEM-2')
+        self._borrow('k-3')
+        resp = self._borrow('k-3', book=other)
+        self.assertEqual(resp.status_code, 422)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0)
+    def test_in_flight_duplicate_gets_conflict(self):
+        resp = self._borrow('k-4')
+        IdempotencyKey.objects.filter(key='k-4').update(state=IdempotencyKey.STATE_IN_PROGRESS)
+
+        resp = self._borrow('k-4')
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp['Retry-After'], '1')
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0)
+    def test_key_of_crashed_worker_is_taken_over_after_its_lease(self):
+        self._borrow('k-7')
+        Borrowing.objects.filter(user=self.user).delete()
+        Book.objects.filter(pk=self.book.pk).update(status=Book.STATUS_AVAILABLE)
+        # The worker died mid-request: the key stays in progress until its lease runs out.
+        IdempotencyKey.objects.filter(key='k-7').update(
+            state=IdempotencyKey.STATE_IN_PROGRESS, locked_until=timezone.now() + timedelta(minutes=1)
+        )
+        self.assertEqual(self._borrow('k-7').status_code, 409)
+
+        IdempotencyKey.objects.filter(key='k-7').update(locked_until=timezone.now() - timedelta(seconds=1))
+        resp = self._borrow('k-7')
+        self.assertEqual(resp.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', resp)
+        self.assertEqual(IdempotencyKey.objects.get(key='k-7').state, IdempotencyKey.STATE_COMPLETED)
+        self.assertEqual(self._borrow('k-7')['Idempotent-Replayed'], 'true')
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0)
+    def test_slow_request_keeps_its_key_by_renewing_the_lease(self):
+        renewals = []
+
+        def heartbeat(lease):
+            # Stands in for the renewal thread firing while the view still runs.
+            renewals.append(lease.locked_until)
+            IdempotencyKey.objects.filter(pk=lease.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+            lease.locked_until = IdempotencyKey.objects.get(pk=lease.pk).locked_until
+            self.assertTrue(lease.renew())
+            self.assertGreater(lease.locked_until, timezone.now())
+            renewals.append(self._borrow('k-8').status_code)
+
+        with mock.patch.object(idempotency._Lease, 'start', heartbeat):
+            resp = self._borrow('k-8')
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(renewals[1], 409)
+        self.assertEqual(IdempotencyKey.objects.get(key='k-8').state, IdempotencyKey.STATE_COMPLETED)
+        self.assertEqual(Borrowing.objects.filter(user=self.user).count(), 1)
+
+    def test_owner_that_lost_its_lease_stops_renewing(self):
+        record = IdempotencyKey.objects.create(
+            user=self.user, key='k-9', fingerprint='x', expires_at=timezone.now() + timedelta(hours=1),
+            locked_until=timezone.now() + timedelta(seconds=20),
+        )
+        lease = idempotency._Lease(record)
+        IdempotencyKey.objects.filter(pk=record.pk).update(locked_until=timezone.now() + timedelta(minutes=1))
+
+        self.assertFalse(lease.renew())
+        self.assertFalse(lease.owned().exists())
+
+    def test_failed_request_releases_key(self):
+        self.book.status = Book.STATUS_BORROWED
+        self.book.save()
+        self.assertEqual(self._borrow('k-5').status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.filter(key='k-5').exists())
+
+    def test_purge_command_deletes_expired_keys_only(self):
+        self._borrow('k-6')
+        IdempotencyKey.objects.create(
+            user=self.user, key='old', fingerprint='x', expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        out = StringIO()
+        call_command('purge_idempotency_keys', '--batch-size', '1', stdout=out)
+
+        self.assertIn('Purged 1', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['k-6'])
@@ -0,0 +1,125 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from library.isbn import InvalidISBN, to_isbn13
+from library.models import Author, Book
+
+User = get_user_model()
+
+
+@pytest.mark.parametrize('value', [
+    '9780306406157', '978-0-306-40615-7', 'ISBN 978 0 306 40615 7', '0306406152', '0-306-40615-2',
+])
+def test_to_isbn13_accepts_any_form(value):
+    assert to_isbn13(value) == '9780306406157'
+
+
+def test_to_isbn13_handles_x_check_digit_and_local_codes():
+    assert to_isbn13('0-8044-2957-x') == '9780804429573'
+    assert to_isbn13('ISBN-REC-1') is None
+    assert to_isbn13('') is None
+    with pytest.raises(InvalidISBN):
+        to_isbn13('978-0-306-40615-8')
+    with pytest.raises(InvalidISBN):
+        to_isbn13('0306406153')
+
+
+class BookIsbn13Tests(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(name='Isbn Author')
+
+    def test_save_computes_and_validates_isbn13(self):
+        book = Book.objects.create(title='Ten', author=self.author, ISBN='0-306-40615-2')
+        self.assertEqual(book.isbn13, '9780306406157')
+
+        book.ISBN = 'LOCAL-1'
+        book.save(update_fields=['ISBN'])
+        book.refresh_from_db()
+        self.assertIsNone(book.isbn13)
+
+        bad = Book(title='Bad', author=self.author, ISBN='9780306406158')
+        with self.assertRaises(ValidationError):
+            bad.full_clean()
+        bad.save()
+        self.assertIsNone(bad.isbn13)
+
+    def test_legacy_rows_with_unusable_isbns_can_still_be_edited(self):
+        Book.objects.create(title='Canonical', author=self.author, ISBN='9780306406157')
+        Book.objects.bulk_create([
+            Book(title='Duplicate', author=self.author, ISBN='0-306-40615-2'),
+            Book(title='Bad digit', author=self.author, ISBN='9780306406158'),
+        ])
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='editor', password='pw'))
+
+        for title in ('Duplicate', 'Bad digit'):
+            book = Book.objects.get(title=title)
+            resp = client.patch(f'/api/v1/library/books/{book.pk}/', {'subtitle': 'Revised'}, format='json')
+            self.assertEqual(resp.status_code, 200, title)
+            book.refresh_from_db()
+            self.assertEqual((book.subtitle, book.isbn13), ('Revised', None))
+
+        duplicate = Book.objects.get(title='Duplicate')
+        duplicate.ISBN = '0-8044-2957-X'
+        duplicate.save()
+        self.assertEqual(duplicate.isbn13, '9780804429573')
+
+    def test_backfill_fills_existing_rows_in_chunks(self):
+        Book.objects.bulk_create([
+            Book(title='A', author=self.author, ISBN='0-306-40615-2'),
+            Book(title='B', author=self.author, ISBN='978-0-8044-2957-3'),
+            Book(title='C', author=self.author, ISBN='9780306406157'),
+            Book(title='D', author=self.author, ISBN='LOCAL-9'),
+        ])
+        out = StringIO()
+        call_command('backfill_isbn13', '--chunk-size', '2', stdout=out)
+
+        self.assertIn('Filled isbn13 for 2 books; skipped 2', out.getvalue())
+        self.assertEqual(Book.objects.get(title='B').isbn13, '9780804429573')
+        self.assertEqual(Book.objects.filter(isbn13='9780306406157').count(), 1)
+        self.assertIsNone(Book.objects.get(title='D').isbn13)
+
+    def test_lookup_endpoints_accept_any_form(self):
+        book = Book.objects.create(title='Scanned', author=self.author, ISBN='978-0-306-40615-7')
+        Book.objects.create(title='Other', author=self.author, ISBN='0-8044-2957-X')
+        client = APIClient()
+
+        with self.assertNumQueries(1):
+            resp = client.get('/api/v1/library/books/by-isbn/0306406152/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['id'], str(book.pk))
+        self.assertEqual(client.get('/api/v1/library/books/by-isbn/9781234567897/').status_code, 404)
+        self.assertEqual(client.get('/api/v1/library/books/by-isbn/9780306406158/').status_code, 400)
+
+        resp = client.post(
+            '/api/v1/library/books/by-isbn/',
+            {'isbns': ['9780804429573', 'ISBN 0-306-40615-2', '9781234567897', 'junk']},
+            format='json',
+        )
+        data = resp.json()
+        self.assertEqual(
+            [(row['isbn'], row['book'] and row['book']['title']) for row in data['results']],
+            [('9780804429573', 'Other'), ('ISBN 0-306-40615-2', 'Scanned'), ('9781234567897', None)],
+        )
+        self.assertEqual(data['invalid'], ['junk'])
+
+    def test_api_rejects_bad_check_digit_and_equivalent_duplicates(self):
+        Book.objects.create(title='Existing', author=self.author, ISBN='9780306406157')
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='cataloguer', password='pw'))
+        payload = {'title': 'New', 'author_id': str(self.author.pk)}
+
+        resp = client.post('/api/v1/library/books/', {**payload, 'ISBN': '0-306-40615-2'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('ISBN', resp.json())
+        resp = client.post('/api/v1/library/books/', {**payload, 'ISBN': '0306406153'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        resp = client.post('/api/v1/library/books/', {**payload, 'ISBN': '0-8044-2957-X'}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()['isbn13'], '9780804429573')
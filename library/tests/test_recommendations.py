@@ -0,0 +1,124 @@
+import uuid
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library import recommendations, services
+from library.models import ArchivedBorrowing, Author, Book, BookNeighbor, Borrowing
+
+User = get_user_model()
+
+
+class CoBorrowingRecommendationTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name='Rec Author')
+        self.books = [Book.objects.create(title=f'Rec {i}', author=author, ISBN=f'ISBN-REC-{i}') for i in range(5)]
+        self.users = [
+            User.objects.create_user(username=f'reader{i}', email=f'r{i}@example.com', password='pw') for i in range(3)
+        ]
+        now = timezone.now()
+
+        def loan(user, book, days_ago=10):
+            borrow_date = now - timedelta(days=days_ago)
+            Borrowing.objects.create(
+                user=user, book=book, borrow_date=borrow_date,
+                return_date=borrow_date + timedelta(days=14), returned=True,
+            )
+
+        a, b, c, d, _ = self.books
+        # Three patrons borrowed A and B, two of them also C; one borrowed A
+        # and D, recorded in the archive.
+        for user in self.users:
+            loan(user, a)
+            loan(user, b)
+        loan(self.users[0], c)
+        loan(self.users[1], c)
+        ArchivedBorrowing.objects.create(
+            id=uuid.uuid4(), user=self.users[2], book=d, borrow_date=now - timedelta(days=900),
+            return_date=now - timedelta(days=886), closed_at=now - timedelta(days=886),
+        )
+
+    def scores(self, book):
+        return [(entry.neighbor_id, entry.score) for entry in recommendations.neighbors(book.pk)]
+
+    def test_build_counts_pairs_across_live_and_archived_history(self):
+        out = StringIO()
+        call_command('build_recommendations', stdout=out)
+
+        a, b, c, d, _ = self.books
+        self.assertEqual(self.scores(a), [(b.pk, 3), (c.pk, 2), (d.pk, 1)])
+        self.assertCountEqual(self.scores(d), [(a.pk, 1), (b.pk, 1)])
+        self.assertEqual(self.scores(self.books[4]), [])
+        self.assertIn(f'Stored {BookNeighbor.objects.count()} neighbour pairs', out.getvalue())
+
+    def test_build_keeps_only_top_k_neighbours(self):
+        call_command('build_recommendations', '--top-k', '1', stdout=StringIO())
+
+        a, b, c, d, _ = self.books
+        self.assertEqual(self.scores(a), [(b.pk, 3)])
+        self.assertEqual(BookNeighbor.objects.filter(book=c).count(), 1)
+
+    def test_endpoint_serves_precomputed_neighbours(self):
+        recommendations.build_index()
+        a, b, c, *_ = self.books
+        client = APIClient()
+
+        with self.assertNumQueries(1):
+            resp = client.get(f'/api/v1/library/books/{a.pk}/also-borrowed/', {'limit': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [(row['title'], row['score']) for row in resp.json()['results']],
+            [('Rec 1', 3), ('Rec 2', 2)],
+        )
+
+        resp = client.get(f'/api/v1/library/books/{self.books[4].pk}/also-borrowed/')
+        self.assertEqual(resp.json(), {'results': []})
+        missing = client.get('/api/v1/library/books/00000000-0000-0000-0000-000000000000/also-borrowed/')
+        self.assertEqual(missing.status_code, 404)
+
+    def test_new_loans_update_the_index_incrementally(self):
+        recommendations.build_index()
+        a, b, c, d, e = self.books
+        reader = self.users[2]
+
+        # The reader's archived loan of D counts as well, as in a rebuild.
+        with self.captureOnCommitCallbacks(execute=True):
+            services.borrow_book(reader, c)
+        self.assertCountEqual(self.scores(c), [(a.pk, 3), (b.pk, 3), (d.pk, 1)])
+        self.assertIn((c.pk, 3), self.scores(b))
+        self.assertIn((c.pk, 1), self.scores(d))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.borrow_book(reader, e)
+        self.assertEqual(sorted(score for _, score in self.scores(e)), [1, 1, 1, 1])
+        self.assertIn((e.pk, 1), self.scores(a))
+
+        incremental = set(BookNeighbor.objects.values_list('book_id', 'neighbor_id', 'score'))
+        recommendations.build_index()
+        self.assertEqual(set(BookNeighbor.objects.values_list('book_id', 'neighbor_id', 'score')), incremental)
+
+    def test_pair_counting_streams_patrons(self):
+        rows = [(1, 'a'), (1, 'b'), (1, 'c'), (2, 'b'), (2, 'c'), (3, 'd')]
+        book_ids, counts = recommendations.count_pairs(iter(rows))
+
+        self.assertEqual(book_ids, ['a', 'b', 'c', 'd'])
+        self.assertEqual(
+            recommendations.select_top_neighbors(book_ids, counts, 5),
+            {'a': [(1, 'c'), (1, 'b')], 'b': [(2, 'c'), (1, 'a')], 'c': [(2, 'b'), (1, 'a')]},
+        )
+
+    @override_settings(LIBRARY_RECOMMENDATIONS_TOP_K=2)
+    def test_incremental_update_respects_top_k(self):
+        recommendations.build_index()
+        a, b, c, d, e = self.books
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.borrow_book(self.users[0], e)
+        self.assertEqual(BookNeighbor.objects.filter(book=e).count(), 2)
+        self.assertEqual(BookNeighbor.objects.filter(book=a).count(), 2)
+        self.assertNotIn(e.pk, [neighbor for neighbor, _ in self.scores(a)])
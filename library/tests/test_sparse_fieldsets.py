@@ -0,0 +1,62 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from library.models import Author, Book
+
+URL = '/api/v1/library/books/'
+
+
+@pytest.fixture
+def book():
+    author = Author.objects.create(name='Sparse Author')
+    return Book.objects.create(title='Sparse', author=author, ISBN='SPARSE-1', book_description='x' * 5000)
+
+
+def _book_query(ctx):
+    return next(q['sql'] for q in ctx.captured_queries if 'library_book' in q['sql'] and 'COUNT' not in q['sql'])
+
+
+@pytest.mark.django_db
+def test_unfiltered_response_keeps_full_shape(book):
+    record = APIClient().get(URL).json()['results'][0]
+
+    assert record['author']['name'] == 'Sparse Author'
+    assert record['book_description'] == 'x' * 5000
+    assert 'available_copies' in record
+
+
+@pytest.mark.django_db
+def test_fields_limit_payload_and_selected_columns(book):
+    with CaptureQueriesContext(connection) as ctx:
+        resp = APIClient().get(URL, {'fields': 'id,title,author'})
+
+    assert resp.status_code == 200
+    assert resp.json()['results'] == [{'id': str(book.id), 'title': 'Sparse', 'author': str(book.author_id)}]
+    sql = _book_query(ctx)
+    assert 'book_description' not in sql
+    assert 'library_author' not in sql
+    assert 'library_bookcopy' not in sql
+
+
+@pytest.mark.django_db
+def test_expand_author_nests_it_with_a_join(book):
+    with CaptureQueriesContext(connection) as ctx:
+        resp = APIClient().get(f'{URL}{book.id}/', {'fields': 'title', 'expand': 'author'})
+
+    assert resp.status_code == 200
+    assert resp.json() == {
+        'title': 'Sparse',
+        'author': {'id': str(book.author_id), 'name': 'Sparse Author', 'biography': '', 'birth_date': None, 'nationality': ''},
+    }
+    assert len(ctx.captured_queries) == 1
+    assert 'library_author' in _book_query(ctx)
+
+
+@pytest.mark.django_db
+def test_unknown_fields_are_rejected(book):
+    resp = APIClient().get(URL, {'fields': 'title,secret', 'expand': 'copies'})
+
+    assert resp.status_code == 400
+    assert resp.json()['fields'] == ['Unknown field: copies', 'Unknown field: secret']
@@ -0,0 +1,84 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library import services, trending
+from library.models import Author, Book, TrendingClock
+
+User = get_user_model()
+
+
+@override_settings(LIBRARY_TRENDING_HALF_LIFE_DAYS=7)
+class TrendingScoreTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name='Trend Author')
+        self.fiction = [
+            Book.objects.create(title=f'Fiction {i}', author=author, ISBN=f'ISBN-TR-F{i}', category='fiction')
+            for i in range(3)
+        ]
+        self.poetry = Book.objects.create(title='Poetry', author=author, ISBN='ISBN-TR-P', category='poetry')
+        self.users = [
+            User.objects.create_user(username=f'trender{i}', email=f't{i}@example.com', password='pw') for i in range(3)
+        ]
+
+    def test_borrow_and_reserve_increment_the_score(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            services.borrow_book(self.users[0], self.fiction[0])
+            services.reserve_book(self.users[1], self.fiction[0])
+            services.reserve_book(self.users[1], self.fiction[1])
+
+        self.assertAlmostEqual(trending.current_score(self.fiction[0]), 1.5, places=3)
+        self.assertAlmostEqual(trending.current_score(self.fiction[1]), 0.5, places=3)
+        self.assertEqual(trending.current_score(self.poetry), 0)
+
+    def test_older_events_weigh_half_per_half_life(self):
+        now = timezone.now()
+        with mock.patch('library.trending.timezone.now', return_value=now - timedelta(days=7)):
+            trending.record_borrow(self.fiction[0])
+            trending.record_borrow(self.fiction[0])
+        with mock.patch('library.trending.timezone.now', return_value=now):
+            trending.record_borrow(self.fiction[1])
+
+        self.assertAlmostEqual(trending.current_score(self.fiction[0], now=now), 1.0, places=6)
+        self.assertAlmostEqual(trending.current_score(self.fiction[1], now=now), 1.0, places=6)
+
+    def test_rescale_moves_the_landmark_without_changing_rankings(self):
+        start = TrendingClock.objects.create(pk=trending.CLOCK_PK, landmark=timezone.now() - timedelta(days=70))
+        trending.record_borrow(self.fiction[0])
+        trending.record_reservation(self.fiction[1])
+        self.fiction[0].refresh_from_db()
+        self.assertGreater(self.fiction[0].trending_score, 1000)
+
+        out = StringIO()
+        call_command('rescale_trending', stdout=out)
+
+        self.assertIn('Rescaled trending scores', out.getvalue())
+        self.assertGreater(TrendingClock.objects.get().landmark, start.landmark)
+        self.fiction[0].refresh_from_db()
+        self.fiction[1].refresh_from_db()
+        self.assertAlmostEqual(self.fiction[0].trending_score, 1.0, places=3)
+        self.assertAlmostEqual(self.fiction[1].trending_score, 0.5, places=3)
+
+    def test_ordering_trending_overall_and_within_a_category(self):
+        trending.record_borrow(self.poetry)
+        trending.record_borrow(self.poetry)
+        trending.record_borrow(self.poetry)
+        trending.record_borrow(self.fiction[2])
+        trending.record_borrow(self.fiction[2])
+        trending.record_reservation(self.fiction[1])
+        client = APIClient()
+
+        titles = [row['title'] for row in client.get('/api/v1/library/books/', {'ordering': 'trending'}).json()['results']]
+        self.assertEqual(titles, ['Poetry', 'Fiction 2', 'Fiction 1', 'Fiction 0'])
+
+        resp = client.get('/api/v1/library/books/', {'ordering': 'trending', 'category': 'fiction', 'fields': 'title'})
+        self.assertEqual([row['title'] for row in resp.json()['results']], ['Fiction 2', 'Fiction 1', 'Fiction 0'])
+
+        titles = [row['title'] for row in client.get('/api/v1/library/books/', {'ordering': 'title'}).json()['results']]
+        self.assertEqual(titles[0], 'Fiction 0')
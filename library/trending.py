@@ -0,0 +1,108 @@
+"""Time-decayed popularity ("trending") scores of books.
+
+Scores use forward decay: an event at time ``t`` adds
+``weight * 2 ** ((t - landmark) / half_life)`` to ``Book.trending_score``.
+Relative to now, every stored score is then the sum of its events halved
+once per half-life, yet recording an event is a single atomic
+``UPDATE ... SET trending_score = trending_score + x`` and ordering by
+trending is a plain read of the indexed column.
+
+Increments grow with time since the landmark, so ``rescale()`` (the
+``rescale_trending`` command, run daily) divides every score by the current
+growth factor and moves the landmark to now. Rankings are unchanged by a
+rescale. ``record()`` reads the landmark under a share lock in the same
+transaction as its UPDATE, so an event is never scaled by a landmark that a
+concurrent rescale has just replaced.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Book, TrendingClock
+
+DEFAULT_HALF_LIFE_DAYS = 7
+
+BORROW_WEIGHT = 1.0
+RESERVE_WEIGHT = 0.5
+
+# Scores that decayed below this are reset to zero by ``rescale()``.
+MIN_SCORE = 1e-6
+
+CLOCK_PK = 1
+
+
+def half_life():
+    return timedelta(days=float(getattr(settings, 'LIBRARY_TRENDING_HALF_LIFE_DAYS', DEFAULT_HALF_LIFE_DAYS)))
+
+
+def _clock():
+    clock, _ = TrendingClock.objects.get_or_create(pk=CLOCK_PK)
+    return clock
+
+
+def growth(landmark, now):
+    """Factor by which an event at ``now`` outweighs one at ``landmark``."""
+    return 2 ** ((now - landmark) / half_life())
+
+
+def _shared_landmark():
+    """The landmark, locked against ``rescale()`` until the transaction ends.
+
+    PostgreSQL and MySQL take ``FOR SHARE`` on the clock row so events do not
+    block each other; other backends serialize writers already.
+    """
+    alias = router.db_for_write(TrendingClock)
+    connection = connections[alias]
+    clock = _clock()
+    if connection.vendor not in ('postgresql', 'mysql'):
+        return clock.landmark
+    table = connection.ops.quote_name(TrendingClock._meta.db_table)
+    pk = connection.ops.quote_name(TrendingClock._meta.pk.column)
+    landmark = connection.ops.quote_name(TrendingClock._meta.get_field('landmark').column)
+    query = f'SELECT {pk}, {landmark} FROM {table} WHERE {pk} = %s FOR SHARE'
+    return TrendingClock.objects.db_manager(alias).raw(query, [CLOCK_PK])[0].landmark
+
+
+def record(book, weight):
+    """Add an event of ``weight`` to the trending score of ``book``."""
+    with transaction.atomic(using=router.db_for_write(TrendingClock)):
+        increment = weight * growth(_shared_landmark(), timezone.now())
+        # updated_at moves with the score so the autocomplete sync re-ranks the title.
+        Book.objects.filter(pk=getattr(book, 'pk', book)).update(
+            trending_score=F('trending_score') + increment, updated_at=timezone.now()
+        )
+
+
+def record_borrow(book):
+    record(book, BORROW_WEIGHT)
+
+
+def record_reservation(book):
+    record(book, RESERVE_WEIGHT)
+
+
+def current_score(book, now=None):
+    """Score of ``book`` in "decayed events" as of ``now``."""
+    now = now or timezone.now()
+    book.refresh_from_db(fields=['trending_score'])
+    return book.trending_score / growth(_clock().landmark, now)
+
+
+def rescale(now=None):
+    """Move the landmark to ``now``, rescaling every score to match.
+
+    Returns the factor the scores were divided by.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        _clock()
+        clock = TrendingClock.objects.select_for_update().get(pk=CLOCK_PK)
+        factor = growth(clock.landmark, now)
+        Book.objects.filter(trending_score__gt=0).update(trending_score=F('trending_score') / factor)
+        Book.objects.filter(trending_score__gt=0, trending_score__lt=MIN_SCORE).update(trending_score=0)
+        clock.landmark = now
+        clock.save(update_fields=['landmark'])
+    return factor
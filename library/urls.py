@@ -5,7 +5,9 @@ from .views import (
     BookViewSet,
     BorrowingViewSet,
     ReservationViewSet,
+    book_availability_stream,
     borrowed_books_by_user,
+    catalog_autocomplete,
 )
 
 app_name = 'library'
@@ -17,13 +19,20 @@ urlpatterns = [
 
     # Books
     path('books/', BookViewSet.as_view({'get': 'list', 'post': 'create'}), name='book-list'),
+    path('books/availability/stream/', book_availability_stream, name='book-availability-stream'),
+    path('books/bulk/', BookViewSet.as_view({'post': 'bulk_lookup'}), name='book-bulk-lookup'),
+    path('books/by-isbn/', BookViewSet.as_view({'post': 'by_isbn_batch'}), name='book-by-isbn-batch'),
+    path('books/by-isbn/<str:code>/', BookViewSet.as_view({'get': 'by_isbn'}), name='book-by-isbn'),
     path('books/<uuid:pk>/', BookViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='book-detail'),
+    path('books/<uuid:pk>/also-borrowed/', BookViewSet.as_view({'get': 'also_borrowed'}), name='book-also-borrowed'),
 
     # Borrowings
     path('borrowings/', BorrowingViewSet.as_view({'get': 'list', 'post': 'create'}), name='borrowing-list'),
     path('borrowings/<uuid:pk>/', BorrowingViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='borrowing-detail'),
     path('borrowings/<uuid:pk>/return/', BorrowingViewSet.as_view({'post': 'do_return'}), name='borrowing-return'),
     path('borrowings/<uuid:pk>/renew/', BorrowingViewSet.as_view({'post': 'do_renew'}), name='borrowing-renew'),
+    path('borrowings/history/', BorrowingViewSet.as_view({'get': 'history'}), name='borrowing-history'),
+    path('borrowings/fines/', BorrowingViewSet.as_view({'get': 'fines'}), name='borrowing-fines'),
     path('borrowings/overdue/', BorrowingViewSet.as_view({'get': 'overdue'}), name='borrowing-overdue'),
     path('borrowings/borrowers/', BorrowingViewSet.as_view({'get': 'borrowers'}), name='borrowing-borrowers'),
 
@@ -31,6 +40,9 @@ urlpatterns = [
     path('reservations/', ReservationViewSet.as_view({'get': 'list', 'post': 'create'}), name='reservation-list'),
     path('reservations/<uuid:pk>/', ReservationViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='reservation-detail'),
 
+    # Type-ahead suggestions
+    path('autocomplete/', catalog_autocomplete, name='autocomplete'),
+
     # Convenience: borrowed books by user
     path('users/<int:user_id>/borrowed-books/', borrowed_books_by_user, name='borrowed-books-by-user'),
 ]
@@ -6,17 +6,38 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework import filters as drf_filters
 
 from django_filters.rest_framework import DjangoFilterBackend
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Prefetch, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+import uuid
 
-from .models import Author, Book, Borrowing, Reservation
-from .serializers import AuthorSerializer, BookSerializer, BorrowingSerializer, ReservationSerializer
+from .models import ArchivedBorrowing, Author, Book, Borrowing, Reservation
+from .serializers import (
+    AuthorSerializer,
+    BookSerializer,
+    BorrowingHistorySerializer,
+    BorrowingSerializer,
+    ReservationSerializer,
+)
 from .serializers import AuthorSerializer as _AuthorSerializer
+from . import autocomplete
+from . import availability
+from . import fines
+from . import isbn
+from . import recommendations
+from . import routers
 from . import services
 from rest_framework import status
 import logging
 from core.views import BaseViewSet
+from core.idempotency import idempotent
+from core.throttling import CatalogAnonThrottle, CirculationThrottle
 
 User = get_user_model()
 
@@ -27,23 +48,166 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+BOOK_SPARSE_FIELDS = tuple(name for name in BookSerializer.Meta.fields if name != 'author_id')
+
+
+class BookOrderingFilter(drf_filters.OrderingFilter):
+    """``OrderingFilter`` that also accepts ``ordering=trending`` (hottest first).
+
+    Trending order reads the indexed ``trending_score`` column, with the id as
+    tie-break so pages are stable; combined with ``?category=`` it is served
+    by the (category, score) index.
+    """
+
+    aliases = {
+        'trending': ('-trending_score', 'id'),
+        '-trending': ('trending_score', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if params:
+            fields = _split_param(params)
+            if any(field in self.aliases for field in fields):
+                ordering = []
+                for field in fields:
+                    if field in self.aliases:
+                        ordering.extend(self.aliases[field])
+                    elif self.remove_invalid_fields(queryset, [field], view, request):
+                        ordering.append(field)
+                return ordering
+        return super().get_ordering(request, queryset, view)
+
+
+def _split_param(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+BULK_LOOKUP_MAX_ITEMS = 5000
+BULK_LOOKUP_CHUNK_SIZE = 500
+BULK_LOOKUP_FIELDS = ('id', 'ISBN', 'status', 'title')
+
+BY_ISBN_MAX_ITEMS = 500
+BY_ISBN_FIELDS = ('id', 'ISBN', 'isbn13', 'status', 'title')
+
+AUTHOR_INCLUDE_BOOKS_MAX = 20
+
+ALSO_BORROWED_DEFAULT_LIMIT = 10
+ALSO_BORROWED_MAX_LIMIT = 50
+
+
+def _chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
 class AuthorViewSet(BaseViewSet):
-    queryset = Author.objects.all()
+    queryset = Author.objects.order_by('name', 'id')
     serializer_class = AuthorSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [CatalogAnonThrottle]
+    pagination_class = StandardResultsSetPagination
+    filter_backends = [drf_filters.SearchFilter, drf_filters.OrderingFilter]
+    search_fields = ['name']
+    ordering_fields = ['name', 'birth_date', 'nationality', 'book_count', 'available_count']
+
+    def get_included_books(self):
+        """Number of titles to nest per author from ``?include_books=N`` (0 when absent)."""
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return 0
+        raw = request.query_params.get('include_books')
+        if raw is None:
+            return 0
+        try:
+            count = int(raw)
+        except ValueError:
+            raise DRFValidationError({'include_books': ['Must be an integer.']})
+        if not 0 <= count <= AUTHOR_INCLUDE_BOOKS_MAX:
+            raise DRFValidationError({'include_books': [f'Must be between 0 and {AUTHOR_INCLUDE_BOOKS_MAX}.']})
+        return count
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = getattr(self, 'request', None)
+        if request is not None and request.method not in permissions.SAFE_METHODS:
+            return queryset
+        queryset = queryset.annotate(
+            book_count=Count('books'),
+            available_count=Count('books', filter=Q(books__status=Book.STATUS_AVAILABLE)),
+        )
+        included = self.get_included_books()
+        if included:
+            # A sliced prefetch queryset is fetched with one ROW_NUMBER()
+            # window query, so only the first N titles per author are read.
+            first_books = Book.objects.order_by('title', 'id').only(
+                'id', 'title', 'ISBN', 'status', 'publication_date', 'author_id',
+            )[:included]
+            queryset = queryset.prefetch_related(Prefetch('books', queryset=first_books, to_attr='first_books'))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.get_included_books():
+            kwargs.setdefault('include_books', True)
+        return super().get_serializer(*args, **kwargs)
 
 logger = logging.getLogger(__name__)
 
 class BookViewSet(BaseViewSet):
-    queryset = Book.objects.select_related('author').all().order_by('title')
+    queryset = Book.objects.select_related('author').with_available_copies().order_by('title')
     serializer_class = BookSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [CatalogAnonThrottle]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, drf_filters.SearchFilter, drf_filters.OrderingFilter]
-    filterset_fields = ['category', 'author', 'status']
+    filter_backends = [DjangoFilterBackend, drf_filters.SearchFilter, BookOrderingFilter]
+    filterset_fields = ['category', 'author', 'status', 'branch']
     search_fields = ['title', 'subtitle', 'ISBN']
     ordering_fields = ['title', 'publication_date', 'author__name']
 
+    def get_permissions(self):
+        if self.action in ('bulk_lookup', 'by_isbn_batch'):
+            return [permissions.AllowAny()]
+        return super().get_permissions()
+
+    def get_sparse_fieldset(self):
+        """Return ``(fields, expand)`` from ``?fields=`` and ``?expand=`` on reads.
+
+        ``fields`` is ``None`` when the full representation was requested.
+        """
+        if hasattr(self, '_sparse_fieldset'):
+            return self._sparse_fieldset
+        request = getattr(self, 'request', None)
+        fields, expand = None, ()
+        if request is not None and request.method in permissions.SAFE_METHODS and self.action in ('list', 'retrieve'):
+            params = request.query_params
+            expand = tuple(_split_param(params.get('expand', '')))
+            unknown = [name for name in expand if name not in BookSerializer.EXPANDABLE_FIELDS]
+            if 'fields' in params:
+                fields = tuple(dict.fromkeys(_split_param(params['fields']) + list(expand)))
+                unknown += [name for name in fields if name not in BOOK_SPARSE_FIELDS]
+            if unknown:
+                raise DRFValidationError({'fields': [f'Unknown field: {name}' for name in dict.fromkeys(unknown)]})
+        self._sparse_fieldset = (fields, expand)
+        return self._sparse_fieldset
+
+    def get_queryset(self):
+        fields, expand = self.get_sparse_fieldset()
+        if fields is None:
+            return super().get_queryset()
+        queryset = Book.objects.order_by('title')
+        if 'available_copies' in fields:
+            queryset = queryset.with_available_copies()
+        if 'author' in expand:
+            queryset = queryset.select_related('author')
+        return queryset.only('id', *(name for name in fields if name != 'available_copies'))
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_fieldset()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
     def update(self, request, *args, **kwargs):
         if 'status' in request.data and not request.user.is_staff:
             logger.warning('User %s attempted to change book status without permission', request.user)
@@ -60,17 +224,228 @@ class BookViewSet(BaseViewSet):
         logger.info('Book partially updated by user %s: %s', request.user, kwargs.get('pk'))
         return result
 
-class BorrowingViewSet(BaseViewSet):
-    queryset = Borrowing.objects.select_related('book', 'user').all()
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_lookup(self, request):
+        """Resolve many books by id and/or ISBN in one request.
+
+        Body: ``{"ids": [...], "isbns": [...], "full": false}``. Each chunk of
+        keys is resolved with a single ``IN`` query (the ISBN path hits the
+        unique index). Unknown or malformed keys are reported in ``missing``.
+        """
+        if not isinstance(request.data, dict):
+            return Response({'detail': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        ids = request.data.get('ids') or []
+        isbns = request.data.get('isbns') or []
+        full = str(request.data.get('full', '')).lower() in ('1', 'true', 'yes')
+        if not isinstance(ids, list) or not isinstance(isbns, list):
+            return Response({'detail': '"ids" and "isbns" must be lists'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) + len(isbns) > BULK_LOOKUP_MAX_ITEMS:
+            return Response(
+                {'detail': f'At most {BULK_LOOKUP_MAX_ITEMS} ids/isbns can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        valid_ids = []
+        missing_ids = []
+        for raw in dict.fromkeys(str(i) for i in ids):
+            try:
+                valid_ids.append(uuid.UUID(raw))
+            except ValueError:
+                missing_ids.append(raw)
+        wanted_isbns = list(dict.fromkeys(str(i) for i in isbns))
+
+        base_qs = Book.objects.order_by()
+        if full:
+            base_qs = base_qs.select_related('author').with_available_copies()
+        else:
+            base_qs = base_qs.only(*BULK_LOOKUP_FIELDS)
+
+        by_id = {}
+        for chunk in _chunked(valid_ids, BULK_LOOKUP_CHUNK_SIZE):
+            for book in base_qs.filter(pk__in=chunk):
+                by_id[book.pk] = book
+        by_isbn = {}
+        for chunk in _chunked(wanted_isbns, BULK_LOOKUP_CHUNK_SIZE):
+            for book in base_qs.filter(ISBN__in=chunk):
+                by_isbn[book.ISBN] = book
+
+        books = []
+        seen = set()
+        for key in valid_ids:
+            book = by_id.get(key)
+            if book is None:
+                missing_ids.append(str(key))
+            elif book.pk not in seen:
+                seen.add(book.pk)
+                books.append(book)
+        missing_isbns = []
+        for key in wanted_isbns:
+            book = by_isbn.get(key)
+            if book is None:
+                missing_isbns.append(key)
+            elif book.pk not in seen:
+                seen.add(book.pk)
+                books.append(book)
+
+        if full:
+            results = BookSerializer(books, many=True, context=self.get_serializer_context()).data
+        else:
+            results = [{field: getattr(book, field) for field in BULK_LOOKUP_FIELDS} for book in books]
+        logger.info('Bulk book lookup: requested=%s found=%s', len(ids) + len(isbns), len(books))
+        return Response(
+            {'results': results, 'missing': {'ids': missing_ids, 'isbns': missing_isbns}},
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=['get'], url_path=r'by-isbn/(?P<code>[^/]+)')
+    def by_isbn(self, request, code=None):
+        """Resolve an ISBN-10 or ISBN-13 in any form with one lookup on ``isbn13``."""
+        try:
+            isbn13 = isbn.to_isbn13(code)
+        except isbn.InvalidISBN as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if isbn13 is None:
+            return Response({'detail': f'{code!r} is not an ISBN'}, status=status.HTTP_400_BAD_REQUEST)
+        book = get_object_or_404(self.get_queryset(), isbn13=isbn13)
+        return Response(self.get_serializer(book).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='by-isbn')
+    def by_isbn_batch(self, request):
+        """Resolve a burst of scanned ISBNs: ``{"isbns": [...]}``.
+
+        All valid codes are resolved with one ``IN`` query on ``isbn13``.
+        ``results`` follows the request order, with ``book`` set to ``None``
+        for unknown ISBNs; malformed codes are listed in ``invalid``.
+        """
+        if not isinstance(request.data, dict):
+            return Response({'detail': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        scanned = request.data.get('isbns')
+        if not isinstance(scanned, list):
+            return Response({'detail': '"isbns" must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(scanned) > BY_ISBN_MAX_ITEMS:
+            return Response(
+                {'detail': f'At most {BY_ISBN_MAX_ITEMS} ISBNs can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        canonical = {}
+        invalid = []
+        for raw in dict.fromkeys(str(item) for item in scanned):
+            try:
+                isbn13 = isbn.to_isbn13(raw)
+            except isbn.InvalidISBN:
+                isbn13 = None
+            if isbn13 is None:
+                invalid.append(raw)
+            else:
+                canonical[raw] = isbn13
+        books = {
+            book.isbn13: book
+            for book in Book.objects.order_by().only(*BY_ISBN_FIELDS).filter(isbn13__in=set(canonical.values()))
+        }
+        results = []
+        for raw, isbn13 in canonical.items():
+            book = books.get(isbn13)
+            results.append({
+                'isbn': raw,
+                'book': None if book is None else {field: getattr(book, field) for field in BY_ISBN_FIELDS},
+            })
+        logger.info('ISBN batch lookup: scanned=%s found=%s', len(scanned), sum(1 for r in results if r['book']))
+        return Response({'results': results, 'invalid': invalid}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='also-borrowed')
+    def also_borrowed(self, request, pk=None):
+        """Titles most often borrowed by patrons who borrowed this one.
+
+        Served from the precomputed neighbour table (``build_recommendations``);
+        ``?limit=`` caps the number of titles (default 10).
+        """
+        try:
+            limit = int(request.query_params.get('limit', ALSO_BORROWED_DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'detail': '"limit" must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, ALSO_BORROWED_MAX_LIMIT))
+
+        neighbors = recommendations.neighbors(pk, limit)
+        if not neighbors and not Book.objects.filter(pk=pk).exists():
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        results = [
+            {
+                'id': entry.neighbor.pk,
+                'title': entry.neighbor.title,
+                'ISBN': entry.neighbor.ISBN,
+                'status': entry.neighbor.status,
+                'score': entry.score,
+            }
+            for entry in neighbors
+        ]
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+class BranchScopedMixin:
+    """Circulation querysets limited to ``?branch=<code>`` or spanning all branches.
+
+    A branch-scoped query runs on that branch's database only; without the
+    parameter the query is fanned out over every circulation database.
+    """
+
+    def scope_to_branches(self, queryset):
+        branch = self.request.query_params.get('branch')
+        if branch:
+            return routers.on_branch(queryset, branch)
+        return routers.fan_out(queryset)
+
+
+def _users_with_open_borrowings():
+    aliases = routers.circulation_aliases()
+    if len(aliases) == 1:
+        return User.objects.filter(borrowings__returned=False).distinct()
+    user_ids = set()
+    for alias in aliases:
+        user_ids.update(
+            Borrowing.objects.using(alias).filter(returned=False).order_by().values_list('user_id', flat=True).distinct()
+        )
+    return User.objects.filter(pk__in=user_ids)
+
+
+def _parse_history_bound(value, end=False):
+    """Parse a ``from``/``to`` history bound; a bare ``to`` date includes that day."""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class BorrowingViewSet(BranchScopedMixin, BaseViewSet):
+    queryset = Borrowing.objects.select_related('book', 'user').order_by('-borrow_date')
     serializer_class = BorrowingSerializer
     permission_classes = [permissions.IsAuthenticated]
-    borrowing_service = services.DefaultBorrowingService
+    throttle_classes = [CirculationThrottle]
+    # Injected with ``as_view(..., borrowing_service=...)``; otherwise the
+    # service named by ``LIBRARY_BORROWING_SERVICE`` is resolved per request.
+    borrowing_service = None
+
+    def get_borrowing_service(self):
+        return self.borrowing_service or services.get_borrowing_service()
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'borrowing_service': self.get_borrowing_service()}
 
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return self.queryset
-        return self.queryset.filter(user=user)
+            return self.scope_to_branches(self.queryset)
+        return self.scope_to_branches(self.queryset.filter(user=user))
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -78,7 +453,7 @@ class BorrowingViewSet(BaseViewSet):
         days = int(self.request.data.get('days', 14))
         try:
             logger.debug('User %s is creating a borrowing for book %s for %s days', user, book, days)
-            borrowing = self.borrowing_service.borrow(user, book, days=days)
+            borrowing = self.get_borrowing_service().borrow(user, book, days=days)
         except PermissionError as exc:
             logger.warning('Permission denied when creating borrowing: %s', exc)
             raise DRFValidationError(str(exc))
@@ -89,11 +464,12 @@ class BorrowingViewSet(BaseViewSet):
         logger.info('Borrowing created: user=%s book=%s id=%s', user, getattr(book, 'pk', None), getattr(borrowing, 'pk', None))
 
     @action(detail=True, methods=['post'], url_path='return')
+    @idempotent
     def do_return(self, request, pk=None):
         borrowing = self.get_object()
         try:
             logger.info('User %s requested return for borrowing %s', request.user, borrowing.pk)
-            services.return_book(borrowing)
+            self.get_borrowing_service().return_borrowing(borrowing)
         except PermissionError as exc:
             logger.warning('Permission error returning borrowing %s: %s', borrowing.pk, exc)
             return Response({'detail': str(exc)}, status=status.HTTP_403_FORBIDDEN)
@@ -109,7 +485,7 @@ class BorrowingViewSet(BaseViewSet):
         extra_days = int(request.data.get('extra_days', 7))
         try:
             logger.info('User %s requested renew for borrowing %s (+%s days)', request.user, borrowing.pk, extra_days)
-            services.renew_borrowing(borrowing, extra_days=extra_days)
+            self.get_borrowing_service().renew(borrowing, extra_days=extra_days)
         except PermissionError as exc:
             logger.warning('Permission error renewing borrowing %s: %s', borrowing.pk, exc)
             return Response({'detail': str(exc)}, status=status.HTTP_403_FORBIDDEN)
@@ -119,11 +495,60 @@ class BorrowingViewSet(BaseViewSet):
         logger.info('Borrowing %s renewed by user %s; new_return_date=%s', borrowing.pk, request.user, borrowing.return_date)
         return Response({'status': 'renewed', 'new_return_date': borrowing.return_date}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['get'], url_path='history')
+    def history(self, request):
+        """Loans of the requesting user (staff may pass ``?user_id=``), newest first.
+
+        ``?from=`` and ``?to=`` (dates or datetimes) bound ``borrow_date``.
+        Live and archived loans are merged, each read through its
+        ``(user, borrow_date)`` index.
+        """
+        try:
+            date_from = _parse_history_bound(request.query_params.get('from'))
+            date_to = _parse_history_bound(request.query_params.get('to'), end=True)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {'user_id': request.user.pk}
+        if request.user.is_staff and request.query_params.get('user_id'):
+            try:
+                filters['user_id'] = int(request.query_params['user_id'])
+            except ValueError:
+                return Response({'detail': '"user_id" must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if date_from is not None:
+            filters['borrow_date__gte'] = date_from
+        if date_to is not None:
+            filters['borrow_date__lt'] = date_to
+
+        querysets = [Borrowing.objects.using(alias).filter(**filters) for alias in routers.circulation_aliases()]
+        querysets += [ArchivedBorrowing.objects.using(alias).filter(**filters) for alias in routers.archive_aliases()]
+        history = routers.MergedQuerySet([qs.order_by('-borrow_date') for qs in querysets])
+
+        page = self.paginate_queryset(history)
+        serializer = BorrowingHistorySerializer(page, many=True)
+        logger.info('Borrowing history requested by %s: sources=%s', request.user, len(querysets))
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='fines')
+    def fines(self, request):
+        """Outstanding overdue fines of the requesting user (staff may pass ``?user_id=``).
+
+        Reads the balance maintained by ``accrue_fines`` and returns; the
+        ledger is never summed per request.
+        """
+        user_id = request.user.pk
+        if request.user.is_staff and request.query_params.get('user_id'):
+            try:
+                user_id = int(request.query_params['user_id'])
+            except ValueError:
+                return Response({'detail': '"user_id" must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'user_id': user_id, 'balance': str(fines.balance(user_id))}, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'], url_path='overdue')
     def overdue(self, request):
         try:
             now = timezone.now()
-            qs = self.queryset.filter(return_date__lt=now, returned=False)
+            qs = self.scope_to_branches(self.queryset.filter(return_date__lt=now, returned=False))
             user_id = request.query_params.get('user_id')
             if user_id:
                 qs = qs.filter(user_id=user_id)
@@ -144,7 +569,7 @@ class BorrowingViewSet(BaseViewSet):
     @action(detail=False, methods=['get'], url_path='borrowers')
     def borrowers(self, request):
         try:
-            users_qs = User.objects.filter(borrowings__returned=False).distinct()
+            users_qs = _users_with_open_borrowings()
             status_q = request.query_params.get('status')
             if status_q == 'active':
                 users_qs = users_qs.filter(is_active=True)
@@ -162,16 +587,24 @@ class BorrowingViewSet(BaseViewSet):
             return Response({'detail': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class ReservationViewSet(BaseViewSet):
+class ReservationViewSet(BranchScopedMixin, BaseViewSet):
     queryset = Reservation.objects.select_related('book', 'user').all()
     serializer_class = ReservationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [CirculationThrottle]
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'borrowing_service': services.get_borrowing_service()}
 
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return self.queryset
-        return self.queryset.filter(user=user)
+            return self.scope_to_branches(self.queryset)
+        return self.scope_to_branches(self.queryset.filter(user=user))
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         try:
@@ -194,11 +627,60 @@ class ReservationViewSet(BaseViewSet):
 def borrowed_books_by_user(request, user_id):
     try:
         user = get_object_or_404(User, pk=user_id)
-        borrowings = Borrowing.objects.filter(user=user, returned=False).select_related('book')
-        books = [b.book for b in borrowings]
+        loans = routers.fan_out(
+            Borrowing.objects.filter(user=user, returned=False).only('pk', 'book_id', 'borrow_date').order_by('-borrow_date')
+        )
+        book_ids = [loan.book_id for loan in loans]
+        # Titles live in the default database; one query for all of them, in loan order.
+        by_id = Book.objects.select_related('author').with_available_copies().in_bulk(book_ids)
+        books = [by_id[book_id] for book_id in book_ids if book_id in by_id]
         serializer = BookSerializer(books, many=True, context={'request': request})
         logger.info('Borrowed books fetched for user %s: count=%s by %s', user_id, len(books), request.user)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as exc:
         logger.exception('Error fetching borrowed books for user %s', user_id)
         return Response({'detail': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def catalog_autocomplete(request):
+    """Type-ahead suggestions: ``?q=<prefix>&limit=N`` titles and authors, most popular first."""
+    try:
+        limit = int(request.query_params.get('limit', autocomplete.DEFAULT_LIMIT))
+    except ValueError:
+        return Response({'detail': '"limit" must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(autocomplete.suggest(request.query_params.get('q', ''), limit), status=status.HTTP_200_OK)
+
+
+@require_GET
+async def book_availability_stream(request):
+    """Server-Sent Events with the status of ``?books=<id>,<id>``: current first, then every change.
+
+    Each event is ``availability`` with ``{"book": id, "status": status}``
+    as data; comment lines are sent as heartbeats. Served by the ASGI
+    application only.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'The availability stream is only served over ASGI'}, status=501)
+    try:
+        book_ids = {uuid.UUID(value.strip()) for value in request.GET.get('books', '').split(',') if value.strip()}
+    except ValueError:
+        return JsonResponse({'detail': '"books" must be a comma-separated list of book ids'}, status=400)
+    if not book_ids:
+        return JsonResponse({'detail': '"books" is required'}, status=400)
+    if len(book_ids) > availability.max_books():
+        return JsonResponse(
+            {'detail': f'At most {availability.max_books()} books can be watched per stream'}, status=400
+        )
+    if availability.hub.count >= availability.max_subscribers():
+        response = JsonResponse({'detail': 'Too many open availability streams, retry later'}, status=503)
+        response['Retry-After'] = str(availability.RETRY_MS // 1000)
+        return response
+
+    response = StreamingHttpResponse(availability.stream(book_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx-style proxies not to buffer the stream.
+    response['X-Accel-Buffering'] = 'no'
+    logger.info('Availability stream opened for %s books (%s open)', len(book_ids), availability.hub.count + 1)
+    return response
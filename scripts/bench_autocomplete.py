@@ -0,0 +1,77 @@
+"""Measure build time, memory and query latency of the autocomplete index.
+
+Builds a library.autocomplete.PrefixIndex over synthetic titles (random
+words, some accented, Zipf-like popularity) and times queries for prefixes
+of 1 to 8 characters taken from random titles, reporting p50/p99 latency
+and the memory held by each part of the index. No database access is
+needed.
+
+Run from the project root:
+python scripts/bench_autocomplete.py --titles 1000000 --queries 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+SYLLABLES = ['ba', 'ca', 'de', 'fé', 'go', 'hu', 'la', 'mi', 'no', 'pê', 'qui', 'ro', 'sa', 'tu', 'vi', 'zo', 'ção', 'ñe']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+
+def synthetic_titles(count, rng):
+    words = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(20000)]
+    for _ in range(count):
+        title = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 7))).capitalize()
+        yield uuid.uuid4(), title, rng.paretovariate(1.2)
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    args = parse_args()
+    import django
+
+    django.setup()
+    from library.autocomplete import PrefixIndex
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    index = PrefixIndex(synthetic_titles(args.titles, rng))
+    print(f'built {len(index)} titles, {len(index.entries)} keys in {time.perf_counter() - start:.1f}s')
+
+    memory = index.memory_usage()
+    for part, size in memory.items():
+        print(f'  {part:<8} {size / 2**20:>8.1f} MiB')
+    print(f'  {"total":<8} {sum(memory.values()) / 2**20:>8.1f} MiB')
+
+    prefixes = []
+    for _ in range(args.queries):
+        label = index.labels[rng.randrange(len(index.labels))]
+        prefixes.append(label[:rng.randint(1, 8)])
+    index.search('warm')
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        index.search(prefix, 10)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f'{len(timings)} queries: p50 {percentile(timings, 0.5):.3f} ms, '
+          f'p99 {percentile(timings, 0.99):.3f} ms, max {timings[-1]:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
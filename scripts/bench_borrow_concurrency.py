@@ -0,0 +1,137 @@
+"""Benchmark the locking and conditional-update borrow paths under threads.
+
+Each worker thread owns a user and repeatedly borrows a random book from a
+small pool of hot titles and returns it. The script runs against a fresh
+SQLite file in a temporary directory, so it never touches db.sqlite3.
+
+Run from the project root:
+python scripts/bench_borrow_concurrency.py --threads 8 --seconds 5 --books 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--books', type=int, default=4, help='number of hot titles shared by all threads')
+    parser.add_argument('--sqlite-timeout', type=float, default=5.0, help='SQLite busy timeout in seconds')
+    return parser.parse_args()
+
+
+def configure_database(path, timeout):
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = path
+    settings.DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = timeout
+    settings.LOGGING = {'version': 1, 'disable_existing_loggers': False}
+
+
+def seed(threads, books):
+    from django.contrib.auth import get_user_model
+    from library.models import Author, Book
+
+    User = get_user_model()
+    author = Author.objects.create(name='Bench Author')
+    book_ids = [
+        Book.objects.create(title=f'Hot {i}', author=author, ISBN=f'BENCH-{i}').pk
+        for i in range(books)
+    ]
+    user_ids = [
+        User.objects.create_user(username=f'bench{i}', email=f'bench{i}@example.com', password='x').pk
+        for i in range(threads)
+    ]
+    return book_ids, user_ids
+
+
+def reset(book_ids):
+    from library.models import Book, Borrowing, Reservation
+
+    Borrowing.objects.all().delete()
+    Reservation.objects.all().delete()
+    Book.objects.filter(pk__in=book_ids).update(status=Book.STATUS_AVAILABLE)
+
+
+def worker(service, user_id, book_ids, deadline, stats, lock):
+    from django.contrib.auth import get_user_model
+    from django.db import OperationalError, connection
+    from library.models import Book
+    from library.services import BookNotAvailable
+
+    User = get_user_model()
+    user = User.objects.get(pk=user_id)
+    rng = random.Random(user_id)
+    local = {'checkouts': 0, 'conflicts': 0, 'lock_errors': 0}
+    try:
+        while time.perf_counter() < deadline:
+            book = Book.objects.get(pk=rng.choice(book_ids))
+            try:
+                borrowing = service.borrow(user, book)
+            except BookNotAvailable:
+                local['conflicts'] += 1
+                continue
+            except OperationalError:
+                local['lock_errors'] += 1
+                continue
+            local['checkouts'] += 1
+            try:
+                service.return_borrowing(borrowing)
+            except OperationalError:
+                local['lock_errors'] += 1
+    finally:
+        connection.close()
+        with lock:
+            for key, value in local.items():
+                stats[key] += value
+
+
+def run(label, service, user_ids, book_ids, seconds):
+    reset(book_ids)
+    stats = {'checkouts': 0, 'conflicts': 0, 'lock_errors': 0}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + seconds
+    threads = [
+        threading.Thread(target=worker, args=(service, user_id, book_ids, deadline, stats, lock))
+        for user_id in user_ids
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    print(
+        f'{label:<12} checkouts/s={stats["checkouts"] / elapsed:8.1f} '
+        f'checkouts={stats["checkouts"]:<6} conflicts={stats["conflicts"]:<6} lock_errors={stats["lock_errors"]}'
+    )
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_database(os.path.join(tmp, 'bench.sqlite3'), args.sqlite_timeout)
+
+        import django
+
+        django.setup()
+        from django.core.management import call_command
+        from library import services
+
+        call_command('migrate', verbosity=0)
+        book_ids, user_ids = seed(args.threads, args.books)
+        print(f'threads={args.threads} books={args.books} seconds={args.seconds}')
+        run('locking', services.BorrowingService(), user_ids, book_ids, args.seconds)
+        run('conditional', services.ConditionalUpdateBorrowingService(), user_ids, book_ids, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Compare response size and rendering CPU of the JSON renderers.
+
+Builds a full page of books (nested author, long description) and of
+borrowings (UUID and datetime values) with the real serializers, renders
+each with DRF's JSONRenderer and core.renderers.FastJSONRenderer, and
+reports bytes on the wire with and without gzip plus CPU per response. No
+database access is needed.
+
+Run from the project root:
+python scripts/bench_renderers.py --page-size 100 --iterations 500
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=500)
+    return parser.parse_args()
+
+
+def build_payloads(page_size):
+    from django.contrib.auth import get_user_model
+    from django.utils import timezone
+    from library.models import Author, Book, Borrowing
+    from library.serializers import BookSerializer, BorrowingSerializer
+
+    User = get_user_model()
+    now = timezone.now()
+    author = Author(name='Bench Author', biography='Biography ' * 20, nationality='British')
+    books = []
+    for i in range(page_size):
+        book = Book(
+            title=f'Bench title {i}', subtitle='A subtitle', author=author, ISBN=f'978{i:010d}',
+            book_description='Long description. ' * 40, category='Fiction', publisher='Bench House',
+            page_count=320, language='English', cover_url=f'https://example.com/covers/{i}.jpg',
+        )
+        book.available_copies = i % 3
+        books.append(book)
+    borrowings = [
+        Borrowing(
+            id=uuid.uuid4(), user=User(username=f'reader{i}'), book=books[i], borrow_date=now,
+            return_date=now + timedelta(days=14),
+        )
+        for i in range(page_size)
+    ]
+    page = lambda results: {'count': page_size * 10, 'next': 'http://testserver/?page=2', 'previous': None, 'results': results}
+    return {
+        'books': page(BookSerializer(books, many=True).data),
+        'borrowings': page(BorrowingSerializer(borrowings, many=True).data),
+    }
+
+
+def measure(renderer, data, iterations):
+    from django.utils.text import compress_string
+
+    rendered = renderer.render(data, 'application/json', {})
+    start = time.process_time()
+    for _ in range(iterations):
+        renderer.render(data, 'application/json', {})
+    cpu_us = (time.process_time() - start) / iterations * 1e6
+    start = time.process_time()
+    for _ in range(iterations):
+        compressed = compress_string(rendered)
+    gzip_us = (time.process_time() - start) / iterations * 1e6
+    return len(rendered), len(compressed), cpu_us, gzip_us
+
+
+def main():
+    args = parse_args()
+    import django
+
+    django.setup()
+    from rest_framework.renderers import JSONRenderer
+    from core.renderers import FastJSONRenderer
+
+    payloads = build_payloads(args.page_size)
+    print(f'{"payload":<11} {"renderer":<17} {"bytes":>9} {"gzip bytes":>11} {"render us":>10} {"gzip us":>9}')
+    for name, data in payloads.items():
+        outputs = set()
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            size, gz_size, cpu_us, gzip_us = measure(renderer, data, args.iterations)
+            outputs.add(renderer.render(data, 'application/json', {}))
+            print(f'{name:<11} {type(renderer).__name__:<17} {size:>9} {gz_size:>11} {cpu_us:>10.1f} {gzip_us:>9.1f}')
+        if len(outputs) != 1:
+            print(f'  WARNING: renderers produced different output for {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from django.urls import path
 from users.views import UserViewSet
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from core.throttling import TokenIssueThrottle
 
 app_name = 'users'
 
@@ -8,6 +9,6 @@ urlpatterns = [
 	path('users/', UserViewSet.as_view({'get': 'list', 'post': 'create'}), name='user-list'),
 	path('users/<int:pk>/', UserViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='user-detail'),
 
-	path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-	path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+	path('token/', TokenObtainPairView.as_view(throttle_classes=[TokenIssueThrottle]), name='token_obtain_pair'),
+	path('token/refresh/', TokenRefreshView.as_view(throttle_classes=[TokenIssueThrottle]), name='token_refresh'),
 ]
\ No newline at end of file
@@ -2,6 +2,7 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.exceptions import ValidationError as DRFValidationError
 from users.models import User as CustomUser
 from users.serializers import UserSerializer
+from users.services import create_user
 from rest_framework import filters as drf_filters
 from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
@@ -31,7 +32,7 @@ class UserViewSet(BaseViewSet):
     def perform_create(self, serializer):
         try:
             logger.debug('Creating user with data: %s', {k: v for k, v in serializer.validated_data.items() if k != 'password'})
-            service = self.user_service or __import__('users.services', fromlist=['create_user']).create_user
+            service = self.user_service or create_user
             instance = service(serializer.validated_data)
         except Exception as exc:
             logger.exception('Error creating user')